@@ -1,29 +1,155 @@
 import argparse
-import time
+import hashlib
+import json
 import logging
-from pathlib import Path
+import os
+import time
+from datetime import timedelta
+from typing import Iterator, List, Sequence
 from telegram import ParseMode
-from bupt_messager.bupt_messager import BUPTMessager
-from bupt_messager.mess import set_logger
+from bupt_messager.bot_handler.bot_backend import BotBackend
+from bupt_messager.config import BOT_ALL_BURST_LIMIT, BROADCAST_CHECKPOINT_FOLDER, BROADCAST_LANES
+from bupt_messager.config import BROADCAST_PROGRESS_INTERVAL, DELIVERY_BATCH_SIZE
+from bupt_messager.notice_helper import NoticePayload
+from bupt_messager.notice_manager.bot_helper import BotHelper
+from bupt_messager.queued_bot import create_queued_bot
+from bupt_messager.sql_handler import SQLHandler, SQLManager
+
+
+class BroadcastCheckpoint(object):
+    """Progress of a broadcast, saved as JSON after each batch so that running it again resumes it.
+
+    :member path: Path of the checkpoint file.
+    :type path: str.
+    :member last_chat_id: Chats up to this id are handled, None if not started.
+    :type last_chat_id: int.
+    :member is_done: Whether the broadcast is finished.
+    :type is_done: bool.
+    """
+    def __init__(self, path: str, is_restarted: bool = False):
+        self.path = path
+        self.last_chat_id = None
+        self.sent_count = 0
+        self.failed_count = 0
+        self.is_done = False
+        if not is_restarted and os.path.exists(path):
+            with open(path, encoding='utf-8') as checkpoint_file:
+                self.__dict__.update(json.load(checkpoint_file))
+
+    def save(self):
+        """Write the checkpoint atomically.
+        """
+        temp_path = f'{self.path}.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as checkpoint_file:
+            json.dump({
+                'last_chat_id': self.last_chat_id,
+                'sent_count': self.sent_count,
+                'failed_count': self.failed_count,
+                'is_done': self.is_done}, checkpoint_file)
+        os.replace(temp_path, self.path)
+
+
+def get_checkpoint_path(text: str, chat_ids: Sequence[int]) -> str:
+    """Path of the checkpoint of broadcasting `text` to `chat_ids`, or to all chats if empty.
+
+    :rtype: str.
+    """
+    broadcast_key = hashlib.sha256(json.dumps([text, sorted(chat_ids)]).encode('utf-8')).hexdigest()[:12]
+    return os.path.join(BROADCAST_CHECKPOINT_FOLDER, f'broadcast_{broadcast_key}.json')
+
+
+def iter_chat_id_batches(sql_handler: SQLHandler, chat_ids: Sequence[int], after: int = None) -> Iterator[List[int]]:
+    """Yield sorted batches of `chat_ids`, or of all chats streamed from the database if empty,
+    greater than `after`.
+
+    :rtype: Iterator[List[int]].
+    """
+    if chat_ids:
+        chat_ids = sorted({chat_id for chat_id in chat_ids if after is None or chat_id > after})
+        for index in range(0, len(chat_ids), DELIVERY_BATCH_SIZE):
+            yield chat_ids[index:index + DELIVERY_BATCH_SIZE]
+        return
+    while True:
+        chat_id_batch = sql_handler.get_chat_id_batch(after=after)
+        if not chat_id_batch:
+            return
+        after = chat_id_batch[-1]
+        yield chat_id_batch
+
+
+def count_chats(sql_handler: SQLHandler, chat_ids: Sequence[int], after: int = None) -> int:
+    if chat_ids:
+        return len({chat_id for chat_id in chat_ids if after is None or chat_id > after})
+    return sql_handler.count_chats(after=after)
+
+
+def format_seconds(seconds: float) -> str:
+    return str(timedelta(seconds=round(seconds)))
+
 
+def broadcast(sql_handler: SQLHandler, bot_helper: BotHelper, payload: NoticePayload, chat_ids: Sequence[int], checkpoint: BroadcastCheckpoint):
+    """Send `payload` batch by batch, logging progress and saving `checkpoint` after each batch.
+    """
+    total_count = count_chats(sql_handler, chat_ids, checkpoint.last_chat_id)
+    start_time = last_log_time = time.monotonic()
+    handled_count = 0
+    for chat_id_batch in iter_chat_id_batches(sql_handler, chat_ids, checkpoint.last_chat_id):
+        sent_chat_ids, failed_chat_ids = bot_helper.send_batch(chat_id_batch, payload)
+        checkpoint.last_chat_id = chat_id_batch[-1]
+        checkpoint.sent_count += len(sent_chat_ids)
+        checkpoint.failed_count += len(failed_chat_ids)
+        checkpoint.save()
+        handled_count += len(chat_id_batch)
+        now = time.monotonic()
+        if now - last_log_time >= BROADCAST_PROGRESS_INTERVAL:
+            last_log_time = now
+            rate = handled_count / (now - start_time)
+            logging.warning(
+                f'Broadcast: {handled_count} / {total_count} chats, {rate:.1f} msg/s, '
+                f'ETA {format_seconds(max(total_count - handled_count, 0) / rate)}.')
+    checkpoint.is_done = True
+    checkpoint.save()
+    logging.warning(
+        f'Broadcast: Done in {format_seconds(time.monotonic() - start_time)}, '
+        f'{checkpoint.sent_count} sent, {checkpoint.failed_count} failed in total.')
 
 
 def main():
+    """Broadcast a text to chats, without starting the bot or the spider.
+    """
     parser = argparse.ArgumentParser()
     parser.add_argument("text", type=str, help='Text to broadcast.')
     parser.add_argument("--chat-ids", type=int, help='ID of chats to broadcast, all chats by default.', nargs='+', default=[])
+    parser.add_argument("--dry-run", action='store_true', help='Count chats and estimate duration without sending.')
+    parser.add_argument("--restart", action='store_true', help='Ignore the checkpoint of a previous run.')
     args = parser.parse_args()
-    messager = BUPTMessager(no_bot_mode=True, no_spider_mode=True)
-    text = args.text
-    if len(args.chat_ids) > 0:
-        chat_ids = args.chat_ids
-    else:
-        chat_ids = messager.notice_manager.bot_helper.sql_handler.get_chat_ids()
-    bot = messager.notice_manager.bot_helper.bot
-    logging.warning(f'Broadcast to {len(chat_ids)} subscribers: `{text}`.')
-    for chat_id in chat_ids:
-        bot.send_message(chat_id=chat_id, text=text, parse_mode=ParseMode.MARKDOWN)
-    messager.stop()
+    logging.basicConfig(level=logging.WARNING)
+    sql_manager = SQLManager()
+    sql_handler = SQLHandler(sql_manager)
+    checkpoint = BroadcastCheckpoint(get_checkpoint_path(args.text, args.chat_ids), is_restarted=args.restart)
+    if checkpoint.is_done:
+        logging.warning(f'Broadcast: Already done according to `{checkpoint.path}`, pass `--restart` to send again.')
+        sql_manager.close()
+        return
+    if checkpoint.last_chat_id is not None:
+        logging.warning(f'Broadcast: Resume after chat `{checkpoint.last_chat_id}` from `{checkpoint.path}`.')
+    chat_count = count_chats(sql_handler, args.chat_ids, checkpoint.last_chat_id)
+    logging.warning(
+        f'Broadcast: {chat_count} chats to send, estimated {format_seconds(chat_count / BOT_ALL_BURST_LIMIT)} '
+        f'at {BOT_ALL_BURST_LIMIT} msg/s: `{args.text}`.')
+    if args.dry_run:
+        sql_manager.close()
+        return
+    queued_bot = create_queued_bot(lanes=BROADCAST_LANES)
+    queued_bot.set_error_handle(BotBackend(sql_handler=sql_handler).error_collector)
+    payload = NoticePayload(key='broadcast', text=args.text, parse_mode=ParseMode.MARKDOWN, reply_markup=None)
+    try:
+        broadcast(sql_handler, BotHelper(sql_handler, queued_bot), payload, args.chat_ids, checkpoint)
+    except KeyboardInterrupt:
+        logging.warning(f'Broadcast: Interrupted, run again to resume from `{checkpoint.path}`.')
+    finally:
+        queued_bot.stop()
+        sql_manager.close()
 
 
 if __name__ == "__main__":
@@ -1,14 +1,35 @@
 """Utils for backend."""
+import calendar
 import functools
+import hashlib
 import logging
 import os
 import sys
-from typing import List
+from datetime import datetime
+from typing import Dict, List, NamedTuple, Optional, Tuple
 import telegram
-from telegram import ParseMode, InlineKeyboardButton, InlineKeyboardMarkup, Update
+from telegram import ParseMode, InlineKeyboardButton, InlineQuery, InlineQueryResultArticle, Update
+from telegram.error import BadRequest
 from ..config import BOT_ADMIN_IDS, BOT_NOTICE_MAX_BUTTON_PER_LINE, BOT_RESTART_ARG_NO_ARG, BOT_START_VALID_ARGS, NO_NOTICE_TEXT
-from ..mess import fun_logger, get_arg, threaded
-from ..notice_helper import send_notice
+from ..config import BOT_RESTART_HANDOVER
+from ..config import BOT_NOTICE_LIST_LENGTH, LATEST_PAGE_CACHE_SIZE, NOTICE_CURSOR_TIME_FORMAT, SEARCH_EXPIRED_TEXT, SEARCH_QUERY_CACHE_SIZE
+from ..config import SEARCH_QUERY_CACHE_TTL, SEARCH_QUERY_KEY_LENGTH, SEARCH_SINCE_FORMAT
+from ..config import DIGEST_CACHE_SIZE, DIGEST_PAGE_LENGTH, DIGEST_WINDOW_FORMAT
+from ..config import INLINE_ARTICLE_CACHE_SIZE, INLINE_QUERY_CACHE_TIME, INLINE_QUERY_RESULT_LIMIT, INLINE_RESULT_CACHE_SIZE
+from ..cache import LRUCache
+from ..mess import fun_logger, get_arg, threaded, to_base36, try_int
+from ..notice_helper import get_digest_window, markup_keyboard, render_digest, render_notice_list, send_notice
+from ..notice_helper import NoticePayload, render_inline_article, send_payload
+from ..read_models import NoticeListItem, NoticeSnapshot
+from .webhook import spawn_successor
+
+
+class SearchQuery(NamedTuple):
+    """Arguments of `/search`.
+    """
+    terms: str
+    since: datetime
+    author: str
 
 
 def admin_only(func):
@@ -36,57 +57,77 @@ class BackendHelper(object):
     :type sql_handler: SQLHandler.
     :member updater: Attached :obj: bot updater.
     :type updater: Updater.
+    :member search_queries: :obj:`SearchQuery`s by key, for paging search results.
+    :type search_queries: LRUCache.
+    :member digest_pages: Rendered digest pages by key, see `render_digest`.
+    :type digest_pages: LRUCache.
+    :member inline_articles: Notices rendered as inline query results, by notice id.
+    :type inline_articles: LRUCache.
+    :member inline_results: Pages of inline query results and their next offsets, by query and offset.
+    :type inline_results: LRUCache.
+    :member latest_pages: Rendered pages of `/latest` by length and cursor, see `get_latest_page`.
+    :type latest_pages: LRUCache.
+    :member successor: Process started by the last handover restart, see `restart_app`.
+    :type successor: subprocess.Popen.
     """
     def __init__(self, *, sql_handler=None, updater=None):
-        self.sql_handler = sql_handler
+        self.sql_handler = None
         self.updater = updater
+        self.search_queries = LRUCache(SEARCH_QUERY_CACHE_SIZE, SEARCH_QUERY_CACHE_TTL)
+        self.digest_pages = LRUCache(DIGEST_CACHE_SIZE)
+        self.inline_articles = LRUCache(INLINE_ARTICLE_CACHE_SIZE)
+        self.inline_results = LRUCache(INLINE_RESULT_CACHE_SIZE, INLINE_QUERY_CACHE_TIME)
+        self.latest_pages = LRUCache(LATEST_PAGE_CACHE_SIZE)
+        self.successor = None
+        if sql_handler is not None:
+            self.init_sql_handle(sql_handler)
 
     def init_sql_handle(self, sql_handler):
         self.sql_handler = sql_handler
+        if sql_handler.sql_manager is not None:
+            sql_handler.sql_manager.add_notice_listener(self.on_notices_inserted)
 
     def init_updater(self, updater):
         self.updater = updater
 
-    @threaded
-    def restart_app(self, args: List[str]):
-        """Gracefully kill current process and replace it with a new one.
+    @staticmethod
+    def get_restart_argv(args: List[str]) -> List[str]:
+        """Script and arguments of the new process.
 
         :param args: List of restart arguments (str) received from client.
         :type args: list.
+        :rtype: List[str].
         """
         start_commands = ['--' + arg for arg in args if arg in BOT_START_VALID_ARGS]
-        self.updater.stop()
         if BOT_RESTART_ARG_NO_ARG in args:
-            os.execl(sys.executable, sys.executable, sys.argv[0])
+            return [sys.argv[0]]
         elif start_commands:
-            os.execl(sys.executable, sys.executable, sys.argv[0], *start_commands)
-        else:
-            os.execl(sys.executable, sys.executable, *sys.argv)
+            return [sys.argv[0], *start_commands]
+        return sys.argv
 
-    @staticmethod
-    def markup_keyboard(buttons: List[InlineKeyboardButton],
-                        width: int,
-                        header_buttons: List[InlineKeyboardButton] = None,
-                        footer_buttons: List[InlineKeyboardButton] = None) -> InlineKeyboardMarkup:
-        """Build keybords from buttons.
-
-        :param buttons: Buttons displayed in the middle.
-        :type buttons: List[InlineKeyboardButton].
-        :param width: Amount of buttons per line.
-        :type width: int.
-        :param header_buttons: Defaults to None. Buttons on the first line.
-        :type header_buttons: List[InlineKeyboardButton], optional.
-        :param footer_buttons: Defaults to None. Buttons on the last line.
-        :type footer_buttons: List[InlineKeyboardButton], optional.
-        :return: Keyboard in :obj:`InlineKeyboardMarkup`.
-        :rtype: InlineKeyboardMarkup.
-        """
-        menu = [buttons[i:i + width] for i in range(0, len(buttons), width)]
-        if header_buttons:
-            menu.insert(0, header_buttons)
-        if footer_buttons:
-            menu.append(footer_buttons)
-        return InlineKeyboardMarkup(menu)
+    @threaded
+    def restart_app(self, args: List[str]):
+        """Replace current process with a new one.
+
+        If `BOT_RESTART_HANDOVER` is on and the webhook is listening, the new process inherits the webhook sockets,
+        and signals this process to drain and exit once it serves, see `BUPTMessager.hand_over`.
+        Otherwise stop the updater, write queued changes, and replace the process in place.
+
+        :param args: List of restart arguments (str) received from client.
+        :type args: list.
+        """
+        argv = self.get_restart_argv(args)
+        webhook_sockets = getattr(self.updater, 'webhook_sockets', None)
+        if BOT_RESTART_HANDOVER and webhook_sockets:
+            if self.successor is not None and self.successor.poll() is None:
+                logging.warning(f'BackendHelper: Successor `{self.successor.pid}` is still starting.')
+                return
+            self.successor = spawn_successor(webhook_sockets, argv)
+            return
+        self.updater.stop()
+        if self.sql_handler is not None and self.sql_handler.sql_manager is not None:
+            self.sql_handler.sql_manager.close()
+        os.execl(sys.executable, sys.executable, *argv)
 
     def send_notice_by_id(self, bot, chat_id: int, notice_id: str):
         notice_item = self.sql_handler.get_notice(notice_id)
@@ -95,34 +136,287 @@ class BackendHelper(object):
         else:
             send_notice(bot, chat_id, notice_item)
 
-    def send_latest_notice(self, *, bot, message: telegram.Message, length: int, start: int = 0):
-        """Send a list of notices.
+    @staticmethod
+    def dump_notice_cursor(notice) -> str:
+        """Encode the keyset cursor `(time, id)` of `notice` for callback data, within its 64 bytes.
+
+        :param notice: The first or the last notice of a page.
+        :type notice: Notification.
+        :return: Cursor in text, `{time}_{id}`, with the time in seconds since epoch in base 36.
+        :rtype: str.
+        """
+        return f'{to_base36(calendar.timegm(notice.time.timetuple()))}_{notice.id}'
+
+    @staticmethod
+    def load_notice_cursor(args: List[str]) -> Optional[Tuple[datetime, str]]:
+        """Decode a keyset cursor from callback arguments, see `dump_notice_cursor`,
+        or `{time}_{id}` with the time in `NOTICE_CURSOR_TIME_FORMAT` from older messages.
+
+        :param args: Callback arguments after the list length.
+        :type args: List[str].
+        :return: `(time, id)` or None if `args` is empty or malformed.
+        :rtype: Tuple[datetime, str]|None.
+        """
+        if len(args) < 2:
+            return None
+        try:
+            if len(args[0]) == len('YYYYmmddHHMMSS'):
+                return datetime.strptime(args[0], NOTICE_CURSOR_TIME_FORMAT), '_'.join(args[1:])
+            return datetime.utcfromtimestamp(int(args[0], 36)), '_'.join(args[1:])
+        except (ValueError, OverflowError, OSError):
+            logging.warning(f'BackendHelper: Malformed notice cursor `{args}`.')
+            return None
+
+    def get_latest_page(self, length: int, cursor: Tuple[datetime, str] = None, is_newer: bool = False) -> Optional[NoticePayload]:
+        """Get a rendered page of latest notices with prev and next buttons, shared by all chats.
+
+        Buttons carry callback data `latest_{length}_p_{cursor}` and `latest_{length}_n_{cursor}`,
+        with the cursor of the first and the last notice on the page, see `dump_notice_cursor`.
+
+        :param length: Amount of notices per page.
+        :type length: int.
+        :param cursor: Defaults to None. Cursor of the previous page, see `get_latest_notices`, the first page if None.
+        :type cursor: Tuple[datetime, str], optional.
+        :param is_newer: Defaults to False. Whether `cursor` is from the next page, i.e. going back.
+        :type is_newer: bool, optional.
+        :return: The page, None if no notice.
+        :rtype: NoticePayload.
+        """
+        page_key = (length, cursor, is_newer)
+        payload = self.latest_pages.get(page_key)
+        if payload is not None:
+            return payload
+        notices = self.sql_handler.get_latest_notices(length=length + 1, cursor=cursor, is_newer=is_newer)
+        if is_newer and cursor is not None:
+            if len(notices) <= length:
+                return self.get_latest_page(length)
+            notices, has_prev, has_next = notices[1:], True, True
+        else:
+            notices, has_prev, has_next = notices[:length], cursor is not None, len(notices) > length
+        if not notices:
+            return None
+        text, buttons = render_notice_list(notices)
+        footer_buttons = []
+        if has_prev:
+            footer_buttons.append(InlineKeyboardButton(
+                text='prev', callback_data=f'latest_{length}_p_{self.dump_notice_cursor(notices[0])}'))
+        if has_next:
+            footer_buttons.append(InlineKeyboardButton(
+                text='next', callback_data=f'latest_{length}_n_{self.dump_notice_cursor(notices[-1])}'))
+        payload = NoticePayload(
+            key=f'latest_{length}_{notices[0].id}',
+            text=text,
+            parse_mode=ParseMode.MARKDOWN,
+            reply_markup=markup_keyboard(
+                buttons=buttons,
+                width=BOT_NOTICE_MAX_BUTTON_PER_LINE,
+                footer_buttons=footer_buttons).to_json())
+        self.latest_pages.put(page_key, payload)
+        return payload
+
+    def send_latest_notice(self, *, bot, message: telegram.Message, length: int):
+        """Send the first page of latest notices.
 
         :param message: Message received.
         :type message: telegram.Message.
         :param length: Amount to notices to be sent.
         :type length: int.
-        :param start: Defaults to 0. Index of the most recent notice to be sent.
+        """
+        payload = self.get_latest_page(length)
+        if payload is None:
+            bot.send_message(chat_id=message.chat_id, text='No more news.')
+        else:
+            send_payload(bot, message.chat_id, payload)
+
+    def edit_latest_notice(
+            self, *, bot, message: telegram.Message, length: int, cursor: Tuple[datetime, str] = None, is_newer: bool = False) -> bool:
+        """Replace a page of latest notices in `message` with the previous or the next page.
+
+        :param message: Message with the current page.
+        :type message: telegram.Message.
+        :param length: Amount to notices per page.
+        :type length: int.
+        :param cursor: Defaults to None. See `get_latest_page`.
+        :type cursor: Tuple[datetime, str], optional.
+        :param is_newer: Defaults to False. See `get_latest_page`.
+        :type is_newer: bool, optional.
+        :return: False if there is no such page.
+        :rtype: bool.
+        """
+        payload = self.get_latest_page(length, cursor, is_newer)
+        if payload is None:
+            return False
+        try:
+            bot.edit_message_text(
+                chat_id=message.chat_id,
+                message_id=message.message_id,
+                text=payload.text,
+                parse_mode=payload.parse_mode,
+                reply_markup=payload.reply_markup)
+        except BadRequest as identifier:
+            logging.info(f'BackendHelper: Page `{payload.key}` not edited: {identifier}')
+        return True
+
+    def on_notices_inserted(self, notices: List[NoticeSnapshot]):
+        """Refresh rendered notices and pages after new notices are inserted.
+
+        :param notices: New notices.
+        :type notices: List[NoticeSnapshot].
+        """
+        self.latest_pages.clear()
+        self.add_inline_articles(notices)
+
+    @staticmethod
+    def prase_search_args(args: List[str]) -> SearchQuery:
+        """Prase arguments of `/search {terms} [since:YYYY-MM-DD] [author:name]`.
+
+        :param args: Command arguments.
+        :type args: List[str].
+        :raises ValueError: Malformed `since`, or nothing to search.
+        :rtype: SearchQuery.
+        """
+        terms, since, author = [], None, None
+        for arg in args:
+            if arg.startswith('since:'):
+                since = datetime.strptime(arg[len('since:'):], SEARCH_SINCE_FORMAT)
+            elif arg.startswith('author:'):
+                author = arg[len('author:'):]
+            else:
+                terms.append(arg)
+        if not terms and since is None and not author:
+            raise ValueError('Nothing to search.')
+        return SearchQuery(terms=' '.join(terms), since=since, author=author)
+
+    def save_search_query(self, search_query: SearchQuery) -> str:
+        """Remember `search_query` for paging, and return its key for callback data.
+
+        :rtype: str.
+        """
+        query_key = hashlib.sha1(repr(search_query).encode()).hexdigest()[:SEARCH_QUERY_KEY_LENGTH]
+        self.search_queries.put(query_key, search_query)
+        return query_key
+
+    def send_search_result(self, *, bot, chat_id: int, query_key: str, start: int = 0):
+        """Send a page of search results.
+
+        :param query_key: Key of the query, see `save_search_query`.
+        :type query_key: str.
+        :param start: Defaults to 0. Index of the first result to be sent.
         :type start: int, optional.
         """
-        text = ""
-        buttons = []
-        for index, notice in enumerate(self.sql_handler.get_latest_notices(length=length, start=start)):
-            text += f'{index + 1}.[{notice.title}]({notice.url})({notice.datetime})\n'
-            buttons.append(InlineKeyboardButton(text=f'{index + 1}', callback_data=f'read_{notice.id}'))
-        keyboard = self.markup_keyboard(
-            buttons=buttons,
-            width=BOT_NOTICE_MAX_BUTTON_PER_LINE,
-            footer_buttons=[InlineKeyboardButton(text='more', callback_data=f'latest_{length}_{start + length}')]
-        )
+        search_query = self.search_queries.get(query_key)
+        if search_query is None:
+            bot.send_message(chat_id=chat_id, text=SEARCH_EXPIRED_TEXT)
+            return
+        notices = self.sql_handler.search_notices(search_query.terms, since=search_query.since, author=search_query.author)
+        page_notices = notices[start:start + BOT_NOTICE_LIST_LENGTH]
+        text, buttons = render_notice_list(page_notices, start)
         if text:
-            bot.send_message(
-                chat_id=message.chat_id,
-                text=text,
-                parse_mode=ParseMode.MARKDOWN,
-                reply_markup=keyboard)
+            next_start = start + len(page_notices)
+            keyboard = markup_keyboard(
+                buttons=buttons,
+                width=BOT_NOTICE_MAX_BUTTON_PER_LINE,
+                footer_buttons=[InlineKeyboardButton(
+                    text='more', callback_data=f'search_{query_key}_{next_start}')] if next_start < len(notices) else None
+            )
+            text += f'({start + 1}-{next_start} / {len(notices)})'
+            bot.send_message(chat_id=chat_id, text=text, parse_mode=ParseMode.MARKDOWN, reply_markup=keyboard)
         else:
-            bot.send_message(chat_id=message.chat_id, text='No more news.')
+            bot.send_message(chat_id=chat_id, text='No more news.')
+
+    def send_digest_page(self, *, bot, chat_id: int, digest: str, window_key: str, page: int):
+        """Send a page of a digest, rendered once and shared by all chats.
+
+        :param digest: Digest mode, a key of `DIGEST_INTERVALS`.
+        :type digest: str.
+        :param window_key: Start of the window in `DIGEST_WINDOW_FORMAT`.
+        :type window_key: str.
+        :param page: Index of the page.
+        :type page: int.
+        """
+        page_key = f'{digest}_{window_key}_{page}'
+        payload = self.digest_pages.get(page_key)
+        if payload is None:
+            try:
+                start = datetime.strptime(window_key, DIGEST_WINDOW_FORMAT)
+            except ValueError:
+                logging.warning(f'BackendHelper: Malformed digest window `{window_key}`.')
+                return
+            _, end = get_digest_window(digest, start)
+            notices = self.sql_handler.get_notices_between(start, end)
+            if page * DIGEST_PAGE_LENGTH >= len(notices):
+                bot.send_message(chat_id=chat_id, text='No more news.')
+                return
+            payload = render_digest(digest, start, notices, page)
+            self.digest_pages.put(page_key, payload)
+        send_payload(bot, chat_id, payload)
+
+    def add_inline_articles(self, notices: List[NoticeSnapshot]):
+        """Render new notices as inline query results, and drop cached result pages, run after each insert.
+
+        :param notices: New notices.
+        :type notices: List[NoticeSnapshot].
+        """
+        for notice in notices:
+            self.inline_articles.put(notice.id, render_inline_article(notice))
+        self.inline_results.clear()
+
+    def warm_inline_articles(self):
+        """Render the latest notices, which are the results of an empty inline query.
+        """
+        self.get_inline_results('', 0)
+        logging.info(f'BackendHelper: {len(self.inline_articles)} inline articles rendered.')
+
+    def get_inline_articles(self, notices: List[NoticeListItem]) -> List[InlineQueryResultArticle]:
+        """Get rendered articles of `notices`, notices not yet rendered are loaded in one query.
+
+        :rtype: List[InlineQueryResultArticle].
+        """
+        articles = {notice.id: self.inline_articles.get(notice.id) for notice in notices} # type: Dict[str, InlineQueryResultArticle]
+        missing_ids = [notice_id for notice_id, article in articles.items() if article is None]
+        if missing_ids:
+            for notice in self.sql_handler.get_notices(missing_ids):
+                articles[notice.id] = render_inline_article(notice)
+                self.inline_articles.put(notice.id, articles[notice.id])
+        return [articles[notice.id] for notice in notices if articles[notice.id] is not None]
+
+    def get_inline_results(self, query: str, offset: int) -> Tuple[List[InlineQueryResultArticle], str]:
+        """Get a page of results of an inline query, the latest notices if `query` is empty.
+        `query` is prased like arguments of `/search`, or searched as a whole if malformed.
+
+        :param query: Text of the inline query.
+        :type query: str.
+        :param offset: Index of the first result.
+        :type offset: int.
+        :return: Articles, and the offset of the next page, empty if no more results.
+        :rtype: Tuple[List[InlineQueryResultArticle], str].
+        """
+        query = ' '.join(query.split())
+        results = self.inline_results.get((query, offset))
+        if results is None:
+            try:
+                search_query = self.prase_search_args(query.split())
+            except ValueError:
+                search_query = SearchQuery(terms=query, since=None, author=None)
+            notices = self.sql_handler.search_notices(search_query.terms, since=search_query.since, author=search_query.author)
+            page_notices = notices[offset:offset + INLINE_QUERY_RESULT_LIMIT]
+            next_offset = offset + len(page_notices)
+            results = (self.get_inline_articles(page_notices), str(next_offset) if next_offset < len(notices) else '')
+            self.inline_results.put((query, offset), results)
+        return results
+
+    def answer_inline_query(self, *, bot, inline_query: InlineQuery):
+        """Answer an inline query from cached results, and let Telegram cache the answer for `INLINE_QUERY_CACHE_TIME`.
+
+        :param inline_query: The inline query.
+        :type inline_query: InlineQuery.
+        """
+        articles, next_offset = self.get_inline_results(inline_query.query, max(try_int(inline_query.offset, 0), 0))
+        bot.answer_inline_query(
+            inline_query.id,
+            articles,
+            cache_time=INLINE_QUERY_CACHE_TIME,
+            next_offset=next_offset)
 
     @staticmethod
     @fun_logger(log_fun=logging.debug)
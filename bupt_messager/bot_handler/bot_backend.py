@@ -4,9 +4,13 @@ from datetime import datetime, timedelta
 from telegram import ParseMode
 from telegram.error import TelegramError, Unauthorized, BadRequest, TimedOut, ChatMigrated, NetworkError
 from ..config import BOT_NOTICE_LIST_LENGTH, BOT_STATUS_LIST_LENGTH, BOT_STATUS_STATISTIC_HOUR
+from ..config import BOT_NOTICE_LIST_MAX_LENGTH, BOT_STATUS_LIST_MAX_LENGTH
 from ..config import MESSAGE_ABOUT_ME, STATUS_SYNCED, ERROR_NOTICE_TEXT
-from ..config import INSIDER_JOIN_NOTICE_TEXT, INSIDER_LEAVE_NOTICE_TEXT
+from ..config import INSIDER_JOIN_NOTICE_TEXT, INSIDER_LEAVE_NOTICE_TEXT, SEARCH_USAGE_TEXT
+from ..config import DIGEST_INTERVALS, DIGEST_OFF, DIGEST_STATE_TEXT, DIGEST_USAGE_TEXT
+from ..handler_metrics import HandlerMetrics
 from ..mess import try_int
+from ..queued_bot import QueuedBot
 from .backend_helper import admin_only, BackendHelper
 
 
@@ -17,10 +21,13 @@ class BotBackend(object):
     :type sql_handler: SQLHadnle.
     :member updater: Active updater.
     :type updater: telegram.ext.Updater.
+    :member handler_metrics: Latency, queue wait and errors of handlers.
+    :type handler_metrics: HandlerMetrics.
     """
     def __init__(self, *, sql_handler=None, updater=None):
         self.sql_handler = sql_handler
         self.updater = updater
+        self.handler_metrics = HandlerMetrics()
         self.backend_helper = BackendHelper(sql_handler=sql_handler, updater=updater)
 
     def init_sql_handle(self, sql_handler):
@@ -47,7 +54,7 @@ class BotBackend(object):
             logging.info(f'BotBackend.start_command: new chat `{insert_result_id}`.')
 
     def latest_command(self, bot, update, args):
-        """Say latest notices when receiving command `/latest {length}`.
+        """Say latest notices when receiving command `/latest {length}`, `length` is capped by `BOT_NOTICE_LIST_MAX_LENGTH`.
         """
         try:
             length = int(args[0]) if args else BOT_NOTICE_LIST_LENGTH
@@ -55,15 +62,50 @@ class BotBackend(object):
             bot.send_message(chat_id=update.message.chat_id, text="Didn't understand...")
             logging.info(f'BotBackend.latest_command: {identifier}')
             return
-        self.backend_helper.send_latest_notice(bot=bot, message=update.message, length=length, start=0)
+        length = min(max(length, 1), BOT_NOTICE_LIST_MAX_LENGTH)
+        self.backend_helper.send_latest_notice(bot=bot, message=update.message, length=length)
 
     def latest_callback(self, bot, update):
-        """Say latest notices list when receiving callback `latest_{length}_{start}`.
+        """Turn the page of latest notices in place when receiving callback `latest_{length}_{n|p}_{time}_{id}`,
+        or `latest_{length}_{time}_{id}` from older messages, meaning the next page.
         """
         args = self.backend_helper.prase_callback(update)
-        length = try_int(args[0]) if args else 1
-        start = try_int(args[1]) if args[1:] else 0
-        self.backend_helper.send_latest_notice(bot=bot, message=update.callback_query.message, length=length, start=start)
+        length = try_int(args[0], BOT_NOTICE_LIST_LENGTH) if args else BOT_NOTICE_LIST_LENGTH
+        length = min(max(length, 1), BOT_NOTICE_LIST_MAX_LENGTH)
+        is_newer = args[1:2] == ['p']
+        cursor = self.backend_helper.load_notice_cursor(args[2:] if args[1:2] in (['n'], ['p']) else args[1:])
+        if self.backend_helper.edit_latest_notice(
+                bot=bot, message=update.callback_query.message, length=length, cursor=cursor, is_newer=is_newer):
+            update.callback_query.answer()
+        else:
+            update.callback_query.answer(text='No more news.')
+
+    def inline_query(self, bot, update):
+        """Answer inline queries `@bot [terms] [since:YYYY-MM-DD] [author:name]` with matching notices,
+        the latest notices if no terms.
+        """
+        self.backend_helper.answer_inline_query(bot=bot, inline_query=update.inline_query)
+        logging.debug(f'BotBackend.inline_query: `{update.inline_query.query}` from `{update.inline_query.from_user.id}`.')
+
+    def search_command(self, bot, update, args):
+        """Search notices when receiving command `/search {terms} [since:YYYY-MM-DD] [author:name]`.
+        """
+        try:
+            search_query = self.backend_helper.prase_search_args(args)
+        except ValueError as identifier:
+            bot.send_message(chat_id=update.message.chat_id, text=SEARCH_USAGE_TEXT)
+            logging.info(f'BotBackend.search_command: {identifier}')
+            return
+        query_key = self.backend_helper.save_search_query(search_query)
+        self.backend_helper.send_search_result(bot=bot, chat_id=update.message.chat_id, query_key=query_key)
+
+    def search_callback(self, bot, update):
+        """Send more search results when receiving callback `search_{key}_{start}`.
+        """
+        args = self.backend_helper.prase_callback(update)
+        start = try_int(args[1], 0) if args[1:] else 0
+        self.backend_helper.send_search_result(
+            bot=bot, chat_id=update.callback_query.message.chat_id, query_key=args[0], start=start)
         update.callback_query.answer()
 
     @staticmethod
@@ -72,6 +114,38 @@ class BotBackend(object):
         """
         bot.send_message(chat_id=update.message.chat_id, text='Yo~')
 
+    def digest_command(self, bot, update, args):
+        """Subscribe a digest when receiving command `/digest hourly|daily|off`, or show the current mode.
+        """
+        chat_id = update.message.chat_id
+        if not args:
+            chat = self.sql_handler.get_chat(chat_id)
+            if chat is None:
+                bot.send_message(chat_id=chat_id, text=ERROR_NOTICE_TEXT)
+            else:
+                bot.send_message(chat_id=chat_id, text=DIGEST_STATE_TEXT.format(digest=chat.digest or DIGEST_OFF))
+            return
+        if args[0] != DIGEST_OFF and args[0] not in DIGEST_INTERVALS:
+            bot.send_message(chat_id=chat_id, text=DIGEST_USAGE_TEXT)
+            return
+        chat = self.sql_handler.set_digest(chat_id, None if args[0] == DIGEST_OFF else args[0])
+        if chat is None:
+            logging.warning(f'BotBackend: command error `{update.effective_user.name}:{chat_id}`.')
+            bot.send_message(chat_id=chat_id, text=ERROR_NOTICE_TEXT)
+        else:
+            logging.info(f'BotBackend: digest `{args[0]}` for `{update.effective_user.name}:{chat_id}`.')
+            bot.send_message(chat_id=chat_id, text=DIGEST_STATE_TEXT.format(digest=args[0]))
+
+    def digest_callback(self, bot, update):
+        """Send a page of a digest when receiving callback `digest_{mode}_{window}_{page}`.
+        """
+        args = self.backend_helper.prase_callback(update)
+        if len(args) == 3 and args[0] in DIGEST_INTERVALS:
+            self.backend_helper.send_digest_page(
+                bot=bot, chat_id=update.callback_query.message.chat_id,
+                digest=args[0], window_key=args[1], page=try_int(args[2], 0))
+        update.callback_query.answer()
+
     def insider_command(self, bot, update):
         """Say yo notices when receiving command `/yo`.
         """
@@ -94,6 +168,21 @@ class BotBackend(object):
         logging.warning(f'BotBackend: Restart command `{args}` from `{update.effective_user.name}`.')
         self.backend_helper.restart_app(args)
 
+    @admin_only
+    def metrics_command(self, bot, update):
+        """Send latency, queue wait, errors and rejected updates of each handler when receiving command `/metrics`.
+        """
+        metrics = self.handler_metrics.stats
+        text = f"Handlers: {metrics['queued']} queued, {metrics['running']} running.\n"
+        for name, handler_stats in sorted(metrics['handlers'].items()):
+            latency, wait = handler_stats['latency'], handler_stats['wait']
+            text += (
+                f"{name}: {latency['count']} calls, {handler_stats['errors']} errors, "
+                f"p50 {latency['p50_ms']:.0f}ms, p95 {latency['p95_ms']:.0f}ms, max {latency['max_ms']:.0f}ms, "
+                f"wait avg {wait['avg_ms']:.0f}ms, max {wait['max_ms']:.0f}ms, "
+                f"{handler_stats['rejected'].get('limited', 0)} limited, {handler_stats['rejected'].get('shed', 0)} shed.\n")
+        bot.send_message(chat_id=update.message.chat_id, text=text)
+
     def status_command(self, bot, update, args):
         """Send latest status list when receiving command `/status {length}`.
         """
@@ -103,14 +192,20 @@ class BotBackend(object):
             bot.send_message(chat_id=update.message.chat_id, text="Didn't understand...")
             logging.info(f'BotBackend.status_command: {identifier}')
             return
-        latest_records = self.sql_handler.get_latest_status(datetime.now() - timedelta(hours=BOT_STATUS_STATISTIC_HOUR))
-        if latest_records:
-            error_records = [record for record in latest_records if record.status != STATUS_SYNCED]
-            error_rate = len(error_records) / len(latest_records)
+        length = min(max(length, 1), BOT_STATUS_LIST_MAX_LENGTH)
+        status_counts = self.sql_handler.get_status_counts(datetime.now() - timedelta(hours=BOT_STATUS_STATISTIC_HOUR))
+        status_amount = sum(status_counts.values())
+        if status_amount:
+            error_rate = 1 - status_counts.get(STATUS_SYNCED, 0) / status_amount
             text = ""
-            for status in latest_records[-length:]:
+            for status in self.sql_handler.get_recent_status(length):
                 text += f'{status.time}: {status.status_text}\n'
-            text += f'Error rate: {100 * error_rate:.2f}%.'
+            text += f'Error rate: {100 * error_rate:.2f}%.\n'
+            for cache_name, cache_stats in self.sql_handler.get_cache_stats().items():
+                text += f"Cache `{cache_name}`: {cache_stats['hits']} hits, {cache_stats['misses']} misses.\n"
+            if isinstance(bot, QueuedBot):
+                for lane_name, lane_stats in bot.get_queue_stats().items():
+                    text += f"Lane `{lane_name}`: {lane_stats['depth']} queued, {lane_stats['wait_avg']:.1f}s avg wait.\n"
         else:
             logging.warning('BotBackend: No status selected.')
             text = "No status log."
@@ -140,7 +235,11 @@ class BotBackend(object):
                 self.sql_handler.remove_chat(chat_id)
         except BadRequest:
             # handle malformed requests - read more below!
-            logging.error(f"Bad request detected. (chat_id=`{chat_id}`)")
+            if chat_id is not None and 'chat not found' in str(error).lower():
+                logging.warning(f"Remove Chat(id='{chat_id}'), chat not found.")
+                self.sql_handler.remove_chat(chat_id)
+            else:
+                logging.error(f"Bad request detected. (chat_id=`{chat_id}`)")
         except TimedOut:
             # handle slow connection problems
             logging.error(f"Timeout detected. (chat_id=`{chat_id}`)")
@@ -150,17 +249,17 @@ class BotBackend(object):
         except ChatMigrated:
             # the chat_id of a group has changed, use error.new_chat_id instead
             logging.warning(f"Chat migrated detected, from `{chat_id}` to `{error.new_chat_id}`.")
-            self.sql_handler.remove_chat(chat_id)
-            self.sql_handler.insert_chat(error.new_chat_id)
+            self.sql_handler.migrate_chat(chat_id, error.new_chat_id)
         except Exception as identifier:
             logging.error(f"Unknown error. (chat_id=`{chat_id}`)")
             logging.exception(error)
-            bot.send_error_report()
-            bot.send_message(chat_id=chat_id, text=ERROR_NOTICE_TEXT)
+            bot.send_error_report(error)
+            if chat_id is not None:
+                bot.send_message(chat_id=chat_id, text=ERROR_NOTICE_TEXT)
             raise identifier
 
     def error_callback(self, bot, update, error: Exception):
-        chat_id = update.message.chat_id
+        chat_id = update.effective_chat.id if update is not None and update.effective_chat is not None else None
         self.error_collector(bot, error, chat_id=chat_id)
 
     @staticmethod
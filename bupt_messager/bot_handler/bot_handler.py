@@ -1,8 +1,11 @@
 import logging
-from telegram.ext import Filters, Updater, CallbackQueryHandler, CommandHandler, MessageHandler
-from ..config import BOT_CERT_PATH, BOT_KEY_PATH, BOT_LISTEN_ADDRESS, BOT_WEB_HOOK_PORT, BOT_WEB_HOOK_URL, BOT_WEB_HOOK_URL_PATH
+from typing import Callable
+from telegram.ext import Filters, CallbackQueryHandler, CommandHandler, InlineQueryHandler, MessageHandler
+from ..config import BOT_CERT_PATH, BOT_DISPATCHER_WORKERS, BOT_KEY_PATH, BOT_LISTEN_ADDRESS, BOT_WEB_HOOK_PORT, BOT_WEB_HOOK_URL, BOT_WEB_HOOK_URL_PATH
 from ..sql_handler import SQLHandler
 from .bot_backend import BotBackend
+from .command_guard import CommandGuard
+from .webhook import HandoverUpdater
 
 
 class BotHandler(object):
@@ -10,54 +13,76 @@ class BotHandler(object):
 
     :member bot_backend: Attached :obj:BotBackend.
     :type bot_backend: BotBackend.
-    :member updater: Active updater.
-    :type updater: telegram.ext.Updater.
+    :member updater: Active updater, whose webhook sockets can be handed over to a new process.
+    :type updater: HandoverUpdater.
+    :member command_guard: Rate limits and load shedding in front of handlers.
+    :type command_guard: CommandGuard.
     """
     def __init__(self, sql_manager=None, bot=None):
         self.bot = bot
-        self.updater = Updater(bot=bot) if bot else None
+        self.updater = HandoverUpdater(bot=bot, workers=BOT_DISPATCHER_WORKERS) if bot else None
         self.bot_backend = BotBackend(
             sql_handler=SQLHandler(sql_manager=sql_manager),
             updater=self.updater
         )
+        self.command_guard = CommandGuard(self.bot_backend.handler_metrics)
 
     def init_bot_backend(self, sql_manager):
         self.bot_backend.sql_handler.init_sql_manager(sql_manager)
 
     def init_updater(self, bot):
-        self.updater = Updater(bot=bot)
+        self.updater = HandoverUpdater(bot=bot, workers=BOT_DISPATCHER_WORKERS)
+
+    def _timed(self, callback: Callable) -> Callable:
+        dispatcher = self.updater.dispatcher
+        return self.command_guard.guarded(dispatcher, self.bot_backend.handler_metrics.timed(dispatcher, callback))
 
     def add_handler(self):
         """Register handlers, run once per start.
+        Each handler is guarded by :attr:`command_guard`, runs in the worker pool of the dispatcher,
+        and is timed by :attr:`BotBackend.handler_metrics`.
         """
         dispatcher = self.updater.dispatcher
-        about_handler = CommandHandler('about', self.bot_backend.about_command)
+        about_handler = CommandHandler('about', self._timed(self.bot_backend.about_command))
         dispatcher.add_handler(about_handler)
-        start_handler = CommandHandler('start', self.bot_backend.start_command)
+        start_handler = CommandHandler('start', self._timed(self.bot_backend.start_command))
         dispatcher.add_handler(start_handler)
-        latest_handler = CommandHandler('latest', self.bot_backend.latest_command, pass_args=True)
+        latest_handler = CommandHandler('latest', self._timed(self.bot_backend.latest_command), pass_args=True)
         dispatcher.add_handler(latest_handler)
-        latest_callback = CallbackQueryHandler(pattern='^latest_', callback=self.bot_backend.latest_callback)
+        latest_callback = CallbackQueryHandler(pattern='^latest_', callback=self._timed(self.bot_backend.latest_callback))
         dispatcher.add_handler(latest_callback)
-        status_handler = CommandHandler('status', self.bot_backend.status_command, pass_args=True)
+        status_handler = CommandHandler('status', self._timed(self.bot_backend.status_command), pass_args=True)
         dispatcher.add_handler(status_handler)
-        read_handler = CommandHandler('read', self.bot_backend.read_command, pass_args=True)
+        read_handler = CommandHandler('read', self._timed(self.bot_backend.read_command), pass_args=True)
         dispatcher.add_handler(read_handler)
-        read_callback = CallbackQueryHandler(pattern='^read_', callback=self.bot_backend.read_callback)
+        read_callback = CallbackQueryHandler(pattern='^read_', callback=self._timed(self.bot_backend.read_callback))
         dispatcher.add_handler(read_callback)
-        yo_handler = CommandHandler('yo', self.bot_backend.yo_command)
+        search_handler = CommandHandler('search', self._timed(self.bot_backend.search_command), pass_args=True)
+        dispatcher.add_handler(search_handler)
+        search_callback = CallbackQueryHandler(pattern='^search_', callback=self._timed(self.bot_backend.search_callback))
+        dispatcher.add_handler(search_callback)
+        digest_handler = CommandHandler('digest', self._timed(self.bot_backend.digest_command), pass_args=True)
+        dispatcher.add_handler(digest_handler)
+        digest_callback = CallbackQueryHandler(pattern='^digest_', callback=self._timed(self.bot_backend.digest_callback))
+        dispatcher.add_handler(digest_callback)
+        inline_query_handler = InlineQueryHandler(self._timed(self.bot_backend.inline_query))
+        dispatcher.add_handler(inline_query_handler)
+        yo_handler = CommandHandler('yo', self._timed(self.bot_backend.yo_command))
         dispatcher.add_handler(yo_handler)
-        insider_handler = CommandHandler('insider', self.bot_backend.insider_command)
+        insider_handler = CommandHandler('insider', self._timed(self.bot_backend.insider_command))
         dispatcher.add_handler(insider_handler)
-        restart_handler = CommandHandler('restart', self.bot_backend.restart_command, pass_args=True)
+        restart_handler = CommandHandler('restart', self._timed(self.bot_backend.restart_command), pass_args=True)
         dispatcher.add_handler(restart_handler)
-        unknown_handler = MessageHandler(Filters.command, self.bot_backend.unknown_command)
+        metrics_handler = CommandHandler('metrics', self._timed(self.bot_backend.metrics_command))
+        dispatcher.add_handler(metrics_handler)
+        unknown_handler = MessageHandler(Filters.command, self._timed(self.bot_backend.unknown_command))
         dispatcher.add_handler(unknown_handler)
         dispatcher.add_error_handler(self.bot_backend.error_callback)
 
     def start(self):
         """Start the bot server.
         """
+        self.bot_backend.backend_helper.warm_inline_articles()
         self.updater.start_webhook(
             listen=BOT_LISTEN_ADDRESS,
             port=BOT_WEB_HOOK_PORT,
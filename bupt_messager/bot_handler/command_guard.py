@@ -0,0 +1,130 @@
+"""Rate limiting and load shedding in front of handlers."""
+import functools
+import logging
+import threading
+import time
+from typing import Callable, Dict, Tuple
+from ..cache import LRUCache
+from ..config import BOT_ADMIN_IDS, BOT_COMMAND_RATE_LIMIT, BOT_COMMAND_RATE_LIMITS, BOT_LANE_BULK, BOT_LANE_INTERACTIVE
+from ..config import BOT_RATE_LIMIT_CACHE_SIZE, BOT_SHED_NOTICE_INTERVAL, BOT_SHED_QUEUED_UPDATES, BOT_SHED_SEND_QUEUE_DEPTH
+from ..config import BUSY_TEXT, RATE_LIMITED_TEXT
+from ..handler_metrics import HandlerMetrics
+from ..mess import TokenBucket
+from ..queued_bot import QueuedBot
+
+
+class CommandGuard(object):
+    """Check each update in the dispatcher thread, before it is queued for a worker.
+
+    An update is rejected if its user ran out of tokens of the handler, see `BOT_COMMAND_RATE_LIMITS`,
+    or shed if too many updates wait for a worker or too many messages wait in the interactive lane.
+    Rejected updates get a short reply instead, a user is told about the rate limit once until a command passes.
+    The busy notice of a shed update goes to the bulk lane, so it never deepens the interactive lane,
+    at most once per user every `BOT_SHED_NOTICE_INTERVAL` seconds, callback queries are always answered.
+    Admins listed in `BOT_ADMIN_IDS` are exempt.
+
+    :member handler_metrics: Metrics of handlers, also counting rejected updates.
+    :type handler_metrics: HandlerMetrics.
+    """
+    def __init__(
+            self,
+            handler_metrics: HandlerMetrics,
+            rate_limits: Dict[str, Tuple[float, float]] = None,
+            max_queued_updates: int = BOT_SHED_QUEUED_UPDATES,
+            max_send_queue_depth: int = BOT_SHED_SEND_QUEUE_DEPTH):
+        self.handler_metrics = handler_metrics
+        self.rate_limits = BOT_COMMAND_RATE_LIMITS if rate_limits is None else rate_limits
+        self.max_queued_updates = max_queued_updates
+        self.max_send_queue_depth = max_send_queue_depth
+        self._buckets = LRUCache(BOT_RATE_LIMIT_CACHE_SIZE)
+        self._busy_notified_user_ids = LRUCache(BOT_RATE_LIMIT_CACHE_SIZE, BOT_SHED_NOTICE_INTERVAL)
+        self._lock = threading.Lock()
+
+    def take_token(self, name: str, user_id: int) -> Tuple[bool, bool]:
+        """Take a token from the bucket of `user_id` for handler `name`.
+
+        :return: Whether the update is allowed, and whether the user should be told about the limit.
+        :rtype: Tuple[bool, bool].
+        """
+        bucket_key = (name, user_id)
+        with self._lock:
+            bucket_state = self._buckets.get(bucket_key)
+            if bucket_state is None:
+                bucket_state = [TokenBucket(*self.rate_limits.get(name, BOT_COMMAND_RATE_LIMIT)), False]
+                self._buckets.put(bucket_key, bucket_state)
+            bucket, is_warned = bucket_state
+            if bucket.consume(time.monotonic()):
+                bucket_state[1] = False
+                return True, False
+            bucket_state[1] = True
+            return False, not is_warned
+
+    def take_busy_notice(self, user_id: int) -> bool:
+        """Whether `user_id` should be told about a shed update, at most once every `BOT_SHED_NOTICE_INTERVAL` seconds.
+
+        :rtype: bool.
+        """
+        with self._lock:
+            if self._busy_notified_user_ids.get(user_id):
+                return False
+            self._busy_notified_user_ids.put(user_id, True)
+            return True
+
+    def is_overloaded(self, bot) -> bool:
+        """Whether the dispatcher backlog or the interactive send queue is too deep.
+
+        :rtype: bool.
+        """
+        if self.handler_metrics.queued_count >= self.max_queued_updates:
+            return True
+        if isinstance(bot, QueuedBot):
+            return bot.get_queue_stats()[BOT_LANE_INTERACTIVE]['depth'] >= self.max_send_queue_depth
+        return False
+
+    @staticmethod
+    def reply(dispatcher, bot, update, text: str, lane: str = BOT_LANE_INTERACTIVE):
+        """Answer a rejected update without blocking the dispatcher, inline queries are ignored.
+
+        :param lane: Defaults to `BOT_LANE_INTERACTIVE`. Lane of the reply if `bot` is a :obj:`QueuedBot`.
+        :type lane: str, optional.
+        """
+        if update.callback_query is not None:
+            dispatcher.run_async(update.callback_query.answer, text=text)
+        elif update.inline_query is None and update.effective_chat is not None:
+            if isinstance(bot, QueuedBot):
+                bot.send_message(chat_id=update.effective_chat.id, text=text, lane=lane)
+            else:
+                bot.send_message(chat_id=update.effective_chat.id, text=text)
+
+    def guarded(self, dispatcher, callback: Callable) -> Callable:
+        """Wrap `callback`, usually wrapped by `HandlerMetrics.timed`, to reject updates before running it.
+
+        :param dispatcher: Dispatcher of the updater.
+        :type dispatcher: telegram.ext.Dispatcher.
+        :param callback: Handler callback, named by its `__name__`.
+        :type callback: Callable.
+        :rtype: Callable.
+        """
+        name = callback.__name__
+
+        @functools.wraps(callback)
+        def wrapped(bot, update, *args, **kwargs):
+            """See `guarded`.
+            """
+            user_id = update.effective_user.id if update.effective_user is not None else None
+            if user_id not in BOT_ADMIN_IDS:
+                if self.is_overloaded(bot):
+                    logging.warning(f'CommandGuard: Shed `{name}` from `{user_id}`.')
+                    self.handler_metrics.record_rejected(name, 'shed')
+                    if update.callback_query is not None or self.take_busy_notice(user_id):
+                        self.reply(dispatcher, bot, update, BUSY_TEXT, lane=BOT_LANE_BULK)
+                    return
+                is_allowed, should_warn = self.take_token(name, user_id)
+                if not is_allowed:
+                    logging.info(f'CommandGuard: Rate limited `{name}` from `{user_id}`.')
+                    self.handler_metrics.record_rejected(name, 'limited')
+                    if should_warn:
+                        self.reply(dispatcher, bot, update, RATE_LIMITED_TEXT)
+                    return
+            return callback(bot, update, *args, **kwargs)
+        return wrapped
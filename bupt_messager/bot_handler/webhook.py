@@ -0,0 +1,168 @@
+"""Webhook server whose listening sockets survive a restart."""
+import logging
+import os
+import signal
+import socket
+import ssl
+import subprocess
+import sys
+import time
+from typing import List
+from telegram import TelegramError
+from telegram.ext import Updater
+from telegram.utils.webhookhandler import WebhookAppClass, WebhookServer
+from tornado.ioloop import IOLoop
+from tornado.netutil import bind_sockets
+from ..config import BOT_HANDOVER_FDS_ENV, BOT_HANDOVER_PARENT_ENV, BOT_WEB_HOOK_REUSE_PORT
+
+
+def get_inherited_sockets() -> List[socket.socket]:
+    """Listening sockets handed over by the previous process, see `spawn_successor`.
+
+    :return: Sockets, empty if not started by a handover.
+    :rtype: List[socket.socket].
+    """
+    fds = os.environ.pop(BOT_HANDOVER_FDS_ENV, '')
+    sockets = []
+    for fd in fds.split(','):
+        if fd:
+            inherited_socket = socket.socket(fileno=int(fd))
+            inherited_socket.setblocking(False)
+            sockets.append(inherited_socket)
+    return sockets
+
+
+def get_handover_parent() -> int:
+    """Pid of the process to take over from, see `spawn_successor`.
+
+    :return: Pid, None if not started by a handover.
+    :rtype: int.
+    """
+    parent_pid = os.environ.pop(BOT_HANDOVER_PARENT_ENV, None)
+    return int(parent_pid) if parent_pid else None
+
+
+def spawn_successor(sockets: List[socket.socket], argv: List[str]) -> subprocess.Popen:
+    """Start `argv` with the current interpreter, passing `sockets` and the pid of this process.
+    The new process signals this one with `SIGUSR1` once it serves, see `BUPTMessager.hand_over`.
+
+    :param sockets: Listening sockets of the webhook.
+    :type sockets: List[socket.socket].
+    :param argv: Script and arguments.
+    :type argv: List[str].
+    :rtype: subprocess.Popen.
+    """
+    fds = [listening_socket.fileno() for listening_socket in sockets]
+    env = dict(os.environ)
+    env[BOT_HANDOVER_FDS_ENV] = ','.join(map(str, fds))
+    env[BOT_HANDOVER_PARENT_ENV] = str(os.getpid())
+    successor = subprocess.Popen([sys.executable, *argv], pass_fds=fds, env=env)
+    logging.warning(f'Webhook: Successor `{successor.pid}` started with sockets {fds}.')
+    return successor
+
+
+def signal_handover_parent(parent_pid: int) -> bool:
+    """Ask the previous process to drain and exit.
+
+    :return: Whether the signal is sent.
+    :rtype: bool.
+    """
+    try:
+        os.kill(parent_pid, signal.SIGUSR1)
+    except OSError as identifier:
+        logging.warning(f'Webhook: Failed to signal `{parent_pid}`: {identifier}.')
+        return False
+    logging.warning(f'Webhook: Signaled `{parent_pid}` to hand over.')
+    return True
+
+
+def wait_for_handover_parent(parent_pid: int, timeout: float) -> bool:
+    """Wait until the previous process, the parent of this one, exits.
+
+    :param timeout: Seconds to wait at most.
+    :type timeout: float.
+    :return: Whether it exited in time.
+    :rtype: bool.
+    """
+    deadline = time.monotonic() + timeout
+    while os.getppid() == parent_pid:
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.1)
+    return True
+
+
+class SocketWebhookServer(WebhookServer):
+    """Webhook server accepting on given listening sockets instead of binding its own.
+    """
+    def __init__(self, sockets: List[socket.socket], webhook_app, ssl_ctx):
+        super().__init__(None, None, webhook_app, ssl_ctx)
+        self.sockets = sockets
+
+    def serve_forever(self):
+        with self.server_lock:
+            IOLoop().make_current()
+            self.is_running = True
+            self.logger.debug('Webhook Server started.')
+            self.http_server.add_sockets(self.sockets)
+            self.loop = IOLoop.current()
+            self.loop.start()
+            self.logger.debug('Webhook Server stopped.')
+            self.is_running = False
+
+
+class HandoverUpdater(Updater):
+    """Updater whose webhook listens on sockets kept open by the process,
+    inherited from the previous process if any, so that a new process can take them over.
+
+    Stopping the updater stops accepting connections but leaves the sockets open,
+    new connections wait in the backlog until another process accepts them.
+
+    :member webhook_sockets: Listening sockets of the webhook, empty before `start_webhook`.
+    :type webhook_sockets: List[socket.socket].
+    """
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.webhook_sockets = get_inherited_sockets()
+
+    def _start_webhook(self, listen, port, url_path, cert, key, bootstrap_retries, clean,
+                       webhook_url, allowed_updates):
+        """Same as :meth:`telegram.ext.Updater._start_webhook`, serving :attr:`webhook_sockets`.
+        """
+        self.logger.debug('Updater thread started (webhook)')
+        if not url_path.startswith('/'):
+            url_path = f'/{url_path}'
+        app = WebhookAppClass(url_path, self.bot, self.update_queue)
+        ssl_ctx = None
+        if cert is not None and key is not None:
+            try:
+                ssl_ctx = ssl.create_default_context(ssl.Purpose.CLIENT_AUTH)
+                ssl_ctx.load_cert_chain(cert, key)
+            except ssl.SSLError:
+                raise TelegramError('Invalid SSL Certificate')
+        if self.webhook_sockets:
+            logging.info(f'Webhook: Serving {len(self.webhook_sockets)} inherited sockets.')
+        else:
+            self.webhook_sockets = bind_sockets(
+                int(port), address=listen, reuse_port=BOT_WEB_HOOK_REUSE_PORT and hasattr(socket, 'SO_REUSEPORT'))
+        self.httpd = SocketWebhookServer(self.webhook_sockets, app, ssl_ctx)
+        if ssl_ctx is not None:
+            self._bootstrap(
+                max_retries=bootstrap_retries,
+                clean=clean,
+                webhook_url=webhook_url or self._gen_webhook_url(listen, port, url_path),
+                cert=open(cert, 'rb'),
+                allowed_updates=allowed_updates)
+        elif clean:
+            self.logger.warning('cleaning updates is not supported if SSL-termination happens elsewhere; skipping')
+        self.httpd.serve_forever()
+
+    def _stop_httpd(self):
+        """Same as :meth:`telegram.ext.Updater._stop_httpd`, also waiting for the server to stop,
+        so that every update it received is queued before the dispatcher drains the queue and stops.
+        """
+        httpd = self.httpd
+        super()._stop_httpd()
+        if httpd is not None:
+            with httpd.server_lock:
+                pass
@@ -2,12 +2,14 @@
 import logging
 import os
 import signal
+import sys
 import threading
 import time
 from .mess import set_logger
 from .notice_manager.notice_manager import create_notice_manager
 from .bot_handler.bot_handler import BotHandler
-from .config import MESSAGER_PRINT_INTERVAL
+from .bot_handler.webhook import get_handover_parent, signal_handover_parent, wait_for_handover_parent
+from .config import BOT_RESTART_DRAIN_TIMEOUT, BOT_RESTART_TAKE_OVER_TIMEOUT, MESSAGER_PRINT_INTERVAL
 from .queued_bot import create_queued_bot
 from .sql_handler import SQLManager
 
@@ -17,13 +19,18 @@ class BUPTMessager(object):
 
     :type *_mode: bool.
     :type log_folder: str.
+    :member handover_parent_pid: Pid of the process to take over from, None if not started by a handover restart.
+    :type handover_parent_pid: int.
     """
     def __init__(self, *, debug_mode=False, no_bot_mode=False, no_spider_mode=False):
         sql_manager = SQLManager()
+        self.sql_manager = sql_manager
         self.debug_mode = debug_mode
         self.no_bot_mode = no_bot_mode
         self.no_spider_mode = no_spider_mode
+        self.handover_parent_pid = get_handover_parent()
         queued_bot = create_queued_bot()
+        self.queued_bot = queued_bot
         self.notice_manager = create_notice_manager(sql_manager=sql_manager, bot=queued_bot)
         self.bot_handler = BotHandler(sql_manager=sql_manager, bot=queued_bot)
         self.bot_handler.add_handler()
@@ -32,6 +39,7 @@ class BUPTMessager(object):
         queued_bot.set_error_handle(self.bot_handler.bot_backend.error_collector)
         signal.signal(signal.SIGINT, self.stop)
         signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGUSR1, self.hand_over)
 
     def _init_logger(self):
         if not os.path.exists(self.log_folder):
@@ -47,19 +55,60 @@ class BUPTMessager(object):
 
     def start(self):
         """Start messager, reading attributes `*_mode`.
+        The bot starts first, so that a process started by a handover restart serves before the previous one exits,
+        while the spider waits for it to exit, see `take_over`.
         """
-        if self.no_spider_mode:
-            logging.warning('BUPTMessager: no_spider_mode is ON.')
-        else:
-            self.notice_manager.start()
         if self.no_bot_mode:
             logging.warning('BUPTMessager: no_bot_mode is ON.')
         else:
             self.bot_handler.start()
+        if self.handover_parent_pid is not None:
+            self.take_over()
+        if self.no_spider_mode:
+            logging.warning('BUPTMessager: no_spider_mode is ON.')
+        else:
+            self.notice_manager.start()
         while True:
             logging.info(f'Workers: {threading.enumerate()}')
+            logging.info(f'SQL pool: {self.sql_manager.get_pool_stats()}')
+            logging.info(f'Message lanes: {self.queued_bot.get_queue_stats()}')
+            logging.info(f'Handlers: {self.bot_handler.bot_backend.handler_metrics.stats}')
             time.sleep(MESSAGER_PRINT_INTERVAL)
 
+    def take_over(self):
+        """Signal the previous process to drain and exit, and wait until it exits,
+        at most `BOT_RESTART_TAKE_OVER_TIMEOUT` seconds.
+        """
+        parent_pid = self.handover_parent_pid
+        self.handover_parent_pid = None
+        if not signal_handover_parent(parent_pid):
+            return
+        if not wait_for_handover_parent(parent_pid, BOT_RESTART_TAKE_OVER_TIMEOUT):
+            logging.warning(f'BUPTMessager: `{parent_pid}` is still running after {BOT_RESTART_TAKE_OVER_TIMEOUT}s.')
+            return
+        logging.warning(f'BUPTMessager: Took over from `{parent_pid}`.')
+
+    def hand_over(self, signum: int = None, frame=None):
+        """Exit after a new process took over the webhook sockets, see `BackendHelper.restart_app`.
+        Stop accepting updates and handle received ones, stop the spider,
+        send queued messages within `BOT_RESTART_DRAIN_TIMEOUT` seconds, then stop.
+
+        :param signum: Number representing a signal, defaults to None
+        :type signum: int, optional
+        :param frame: Stack frame, defaults to None
+        :type frame: Frame, optional
+        """
+        logging.warning(f'BUPTMessager: Hand over due to signal: {signum}')
+        if not self.no_bot_mode:
+            self.bot_handler.updater.stop()
+        if not self.no_spider_mode:
+            self.notice_manager.stop()
+            self.notice_manager.join()
+        if not self.queued_bot.drain(BOT_RESTART_DRAIN_TIMEOUT):
+            logging.warning(f'BUPTMessager: Messages left after draining for {BOT_RESTART_DRAIN_TIMEOUT}s.')
+        self.stop()
+        sys.exit(0)
+
     def stop(self, signum: int = None, frame=None):
         """Stop messager gracefully.
 
@@ -76,3 +125,4 @@ class BUPTMessager(object):
             self.notice_manager.stop()
             self.notice_manager.join()
         self.bot_handler.stop_bot()
+        self.sql_manager.close()
@@ -0,0 +1,173 @@
+"""Write-behind queue of changes to table `chat`."""
+import logging
+import threading
+from typing import Dict, List, Tuple, Union
+from .config import CHAT_WRITE_BATCH_SIZE, CHAT_WRITE_INTERVAL, CHAT_WRITE_MAX_ATTEMPTS
+from .models import Chat
+from .read_models import ChatSnapshot
+
+
+class ChatWriter(threading.Thread):
+    """Coalesce changes of chats and write them in batches, every `interval` seconds
+    or as soon as `batch_size` chats are changed.
+
+    Only the latest state of each chat is kept, a :obj:`ChatSnapshot` to insert or update it, or None to delete it.
+    Changes are visible through `lookup` until they are committed.
+
+    :member interval: Seconds between two flushes.
+    :type interval: float.
+    :member batch_size: Amount of changed chats to flush at once, also the size of each `IN` clause.
+    :type batch_size: int.
+    :member max_attempts: Flushes a chat may fail in a row before its change is dropped.
+    :type max_attempts: int.
+    """
+    def __init__(
+            self,
+            sql_manager,
+            interval: float = CHAT_WRITE_INTERVAL,
+            batch_size: int = CHAT_WRITE_BATCH_SIZE,
+            max_attempts: int = CHAT_WRITE_MAX_ATTEMPTS):
+        super().__init__(name='ChatWriter', daemon=True)
+        self.sql_manager = sql_manager
+        self.interval = interval
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+        self._pending = {} # type: Dict[int, Union[None, ChatSnapshot]]
+        self._flushing = {} # type: Dict[int, Union[None, ChatSnapshot]]
+        self._failure_counts = {} # type: Dict[int, int]
+        self._condition = threading.Condition()
+        self._flush_lock = threading.Lock()
+        self._is_stopped = False
+
+    def put(self, chat_id: int, chat: Union[None, ChatSnapshot]):
+        """Queue the new state of a chat.
+
+        :param chat_id: Chat id.
+        :type chat_id: int.
+        :param chat: New state of the chat, None to delete it.
+        :type chat: Union[None, ChatSnapshot].
+        """
+        with self._condition:
+            self._pending[chat_id] = chat
+            if len(self._pending) >= self.batch_size:
+                self._condition.notify()
+
+    def lookup(self, chat_id: int) -> Tuple[bool, Union[None, ChatSnapshot]]:
+        """Look up a change not yet committed.
+
+        :return: Whether the chat is changed, and its new state.
+        :rtype: Tuple[bool, Union[None, ChatSnapshot]].
+        """
+        with self._condition:
+            for changes in (self._pending, self._flushing):
+                if chat_id in changes:
+                    return True, changes[chat_id]
+        return False, None
+
+    def get_changes(self) -> Dict[int, Union[None, ChatSnapshot]]:
+        """Copy all changes not yet committed.
+
+        :rtype: Dict[int, Union[None, ChatSnapshot]].
+        """
+        with self._condition:
+            changes = dict(self._flushing)
+            changes.update(self._pending)
+            return changes
+
+    @staticmethod
+    def _split(items: list, size: int) -> List[list]:
+        return [items[index:index + size] for index in range(0, len(items), size)]
+
+    def _write(self, changes: Dict[int, Union[None, ChatSnapshot]]):
+        """Write `changes` in one transaction.
+        """
+        deleted_ids = [chat_id for chat_id, chat in changes.items() if chat is None]
+        chats = [chat for chat in changes.values() if chat is not None]
+        with self.sql_manager.create_session() as my_session:
+            for id_batch in self._split(deleted_ids, self.batch_size):
+                my_session.query(Chat).filter(Chat.id.in_(id_batch)).delete(synchronize_session=False)
+            existing_ids = set()
+            for chat_batch in self._split(chats, self.batch_size):
+                existing_ids.update(chat_id for chat_id, in my_session.query(Chat.id).filter(
+                    Chat.id.in_([chat.id for chat in chat_batch])))
+            my_session.bulk_update_mappings(Chat, [chat._asdict() for chat in chats if chat.id in existing_ids])
+            my_session.bulk_insert_mappings(Chat, [chat._asdict() for chat in chats if chat.id not in existing_ids])
+            my_session.commit()
+
+    def _write_each(self, changes: Dict[int, Union[None, ChatSnapshot]]) -> Dict[int, Exception]:
+        """Write `changes` chat by chat.
+
+        :return: Errors of chats failed.
+        :rtype: Dict[int, Exception].
+        """
+        errors = {} # type: Dict[int, Exception]
+        for chat_id, chat in changes.items():
+            try:
+                self._write({chat_id: chat})
+            except Exception as identifier:
+                errors[chat_id] = identifier
+        return errors
+
+    def flush(self) -> int:
+        """Write all queued changes in one transaction, or chat by chat if it failed.
+        A chat failed is requeued, and dropped after failing `max_attempts` flushes in a row.
+
+        :return: Amount of chats written.
+        :rtype: int.
+        """
+        with self._flush_lock:
+            with self._condition:
+                if not self._pending:
+                    return 0
+                self._flushing, self._pending = self._pending, {}
+                changes = self._flushing
+            try:
+                self._write(changes)
+                errors = {} # type: Dict[int, Exception]
+            except Exception as identifier:
+                logging.warning(f'ChatWriter: Failed to write {len(changes)} chats, write them one by one: {identifier}')
+                errors = self._write_each(changes)
+            with self._condition:
+                for chat_id in changes:
+                    if chat_id not in errors:
+                        self._failure_counts.pop(chat_id, None)
+                for chat_id, error in errors.items():
+                    if chat_id in self._pending:
+                        self._failure_counts.pop(chat_id, None)
+                        continue
+                    failure_count = self._failure_counts.get(chat_id, 0) + 1
+                    if failure_count >= self.max_attempts:
+                        logging.error(f'ChatWriter: Drop `{changes[chat_id]}` of chat `{chat_id}` after {failure_count} attempts: {error}')
+                        self._failure_counts.pop(chat_id, None)
+                    else:
+                        self._failure_counts[chat_id] = failure_count
+                        self._pending[chat_id] = changes[chat_id]
+                self._flushing = {}
+        if errors:
+            logging.error(f'ChatWriter: {len(errors)} of {len(changes)} chats failed.')
+        deleted_count = sum(chat is None for chat_id, chat in changes.items() if chat_id not in errors)
+        logging.info(f'ChatWriter: {len(changes) - len(errors) - deleted_count} chats written, {deleted_count} chats deleted.')
+        return len(changes) - len(errors)
+
+    def run(self):
+        """Main loop.
+        """
+        while True:
+            with self._condition:
+                self._condition.wait_for(
+                    lambda: self._is_stopped or len(self._pending) >= self.batch_size, self.interval)
+                is_stopped = self._is_stopped
+            self.flush()
+            if is_stopped:
+                break
+        logging.info('ChatWriter: Stopped.')
+
+    def stop(self, timeout: float = None):
+        """Stop the writer after writing all queued changes.
+        """
+        with self._condition:
+            self._is_stopped = True
+            self._condition.notify()
+        if self.is_alive():
+            self.join(timeout)
+        self.flush()
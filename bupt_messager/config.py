@@ -9,6 +9,16 @@ except ImportError as credentials_import_error:
     raise ImportError("Failed to import credentials. Please make sure `credentials.py` exists.")
 
 LOG_MAX_TEXT_LENGTH = 2000
+SQL_POOL_SIZE = 10
+SQL_POOL_MAX_OVERFLOW = 10
+SQL_POOL_TIMEOUT = 30
+SQL_POOL_RECYCLE = 3600
+SQL_POOL_PRE_PING = True
+SQL_SLOW_QUERY_TIME = 1
+SQL_METRICS_MAX_STATEMENTS = 100
+SQL_METRICS_STATEMENT_LENGTH = 120
+SQLITE_WAL_MODE = True
+SQLITE_BUSY_TIMEOUT = 30
 HTTP_CLIENT_MAX_RETRIES = 4
 HTTP_CLIENT_TIME_OUT = 10
 HTTP_CLIENT_REFERER = 'http://my.bupt.edu.cn/index.portal'
@@ -20,29 +30,120 @@ NOTICE_AUTHOR_LENGTH = 40
 NOTICE_DOWNLOAD_INTERVAL = 5
 NOTICE_TITLE_LENGTH = 80
 NOTICE_DB_SUMMARY_LENGTH = 10000
+NOTICE_HTML_CODEC = 'zlib'
+NOTICE_HTML_MIGRATION_BATCH_SIZE = 100
 NOTICE_MESSAGE_SUMMARY_LENGTH = 300
 NOTICE_UPDATE_ERROR_SLEEP_TIME = 3600
 ATTACHMENT_NAME_LENGTH = 50
 NOTICE_CHECK_INTERVAL = 600
 BROADCAST_CYCLE = 60 * 60 / NOTICE_CHECK_INTERVAL
 BOT_NOTICE_LIST_LENGTH = 5
+BOT_NOTICE_LIST_MAX_LENGTH = 20
 BOT_NOTICE_MAX_BUTTON_PER_LINE = 5
+NOTICE_CURSOR_TIME_FORMAT = '%Y%m%d%H%M%S'
+LATEST_PAGE_CACHE_SIZE = 64
 BOT_ALL_BURST_LIMIT = 15
 BOT_GROUP_BURST_LIMIT = 10
+BOT_CHAT_INTERVAL = 1
+BOT_SEND_WORKERS = 16
+BOT_DISPATCHER_WORKERS = 8
+BOT_CONNECTION_POOL_SIZE = BOT_SEND_WORKERS + BOT_DISPATCHER_WORKERS + 4
+BOT_HANDLER_LATENCY_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+BOT_HANDLER_SLOW_TIME = 2
+BOT_HANDLER_QUEUE_WAIT_WARNING_TIME = 1
+BOT_COMMAND_RATE_LIMIT = (0.5, 5)
+BOT_COMMAND_RATE_LIMITS = {
+    'latest_command': (0.2, 3),
+    'search_command': (0.2, 3),
+    'status_command': (0.1, 2),
+    'inline_query': (2, 10)
+}
+BOT_RATE_LIMIT_CACHE_SIZE = 10000
+BOT_SHED_QUEUED_UPDATES = 4 * BOT_DISPATCHER_WORKERS
+BOT_SHED_SEND_QUEUE_DEPTH = 200
+BOT_SHED_NOTICE_INTERVAL = 60
+BOT_SEND_RATE_WINDOW = 60
+BOT_RATE_MIN = 1
+BOT_RATE_INCREASE = 1
+BOT_RATE_DECREASE_FACTOR = 0.5
+BOT_RATE_DECREASE_INTERVAL = 1
+BOT_RETRY_AFTER_MAX_ATTEMPTS = 5
+BOT_LANE_INTERACTIVE = 'interactive'
+BOT_LANE_ADMIN = 'admin'
+BOT_LANE_BULK = 'bulk'
+BOT_MESSAGE_LANES = {BOT_LANE_INTERACTIVE: (8, 15, 15), BOT_LANE_ADMIN: (4, 5, 10), BOT_LANE_BULK: (1, 12, 12)}
 BOT_STATUS_LIST_LENGTH = 5
+BOT_STATUS_LIST_MAX_LENGTH = 20
 BOT_RESTART_ARG_NO_ARG = 'no-arg'
+BOT_RESTART_HANDOVER = True
+BOT_RESTART_DRAIN_TIMEOUT = 60
+BOT_RESTART_TAKE_OVER_TIMEOUT = 180
+BOT_HANDOVER_FDS_ENV = 'BUPT_MESSAGER_LISTEN_FDS'
+BOT_HANDOVER_PARENT_ENV = 'BUPT_MESSAGER_HANDOVER_PID'
+BOT_WEB_HOOK_REUSE_PORT = True
 BOT_START_VALID_ARGS = ['debug', 'no-bot', 'no-spider']
 BOT_STATUS_STATISTIC_HOUR = 24
+STATUS_RECENT_LENGTH = 100
+STATUS_RETENTION_DAYS = 30
+STATUS_ROLLUP_HOURLY_DAYS = 90
+STATUS_INSERT_ATTEMPTS = 3
 MESSAGER_PRINT_INTERVAL = 1200
+SUBSCRIBER_REGISTRY_RELOAD_INTERVAL = 3600
+CHAT_WRITE_INTERVAL = 5
+DIGEST_OFF = 'off'
+DIGEST_INTERVALS = {'hourly': 60 * 60, 'daily': 24 * 60 * 60}
+DIGEST_DELAY = 2 * NOTICE_CHECK_INTERVAL
+DIGEST_PAGE_LENGTH = 10
+DIGEST_WINDOW_FORMAT = '%Y%m%d%H'
+DIGEST_CACHE_SIZE = 64
+CHAT_WRITE_BATCH_SIZE = 500
+CHAT_WRITE_MAX_ATTEMPTS = 10
+NOTICE_CACHE_SIZE = 256
+NOTICE_CACHE_TTL = 24 * 60 * 60
+SEARCH_INDEX_SUMMARY_LENGTH = 2000
+SEARCH_INDEX_BATCH_SIZE = 500
+SEARCH_QUERY_CACHE_SIZE = 1024
+SEARCH_QUERY_CACHE_TTL = 24 * 60 * 60
+INLINE_QUERY_RESULT_LIMIT = 20
+INLINE_QUERY_CACHE_TIME = 300
+INLINE_ARTICLE_CACHE_SIZE = 512
+INLINE_RESULT_CACHE_SIZE = 256
+INLINE_ARTICLE_DESCRIPTION_LENGTH = 100
+SEARCH_QUERY_KEY_LENGTH = 12
+SEARCH_SINCE_FORMAT = '%Y-%m-%d'
 STATUS_TEXT_DICT = {0: 'SYNCED', 1: 'ERROR-LOGIN-WEBVPN', 2: 'ERROR-LOGIN-AUTH', 3: 'ERROR-DOWNLOAD'}
 STATUS_SYNCED = 0
 STATUS_ERROR_LOGIN_WEBVPN = 1
 STATUS_ERROR_LOGIN_AUTH = 2
 STATUS_ERROR_DOWNLOAD = 3
+DELIVERY_PENDING = 0
+DELIVERY_SENT = 1
+DELIVERY_FAILED = 2
+DELIVERY_BATCH_SIZE = 200
+DELIVERY_SEND_TIMEOUT = 120
+DELIVERY_RESUME_ATTEMPTS = 3
+DELIVERY_RETENTION_DAYS = 30
+BROADCAST_CHECKPOINT_FOLDER = 'log'
+BROADCAST_PROGRESS_INTERVAL = 10
+BROADCAST_LANES = {**BOT_MESSAGE_LANES, BOT_LANE_BULK: (1, BOT_ALL_BURST_LIMIT, BOT_ALL_BURST_LIMIT)}
+ERROR_REPORT_WINDOW = 60 * 60
+ERROR_REPORT_SUMMARY_INTERVAL = 10 * 60
+ERROR_REPORT_BURST = 5
+ERROR_REPORT_MAX_LENGTH = 3000
 MESSAGE_ABOUT_ME = "I'm a bot that forwards notifications." + \
     " 🍴 me at [https://github.com/Berailitz/bupt-messager](https://github.com/Berailitz/bupt-messager)."
 NOTICE_TEXT = "*{title}*\n{summary}...(`{id}`@{datetime})"
 NO_NOTICE_TEXT = "No such notice '{notice_index}'."
+SEARCH_USAGE_TEXT = "Usage: /search {terms} [since:YYYY-MM-DD] [author:name]"
+SEARCH_EXPIRED_TEXT = "Search expired, please search again."
+DIGEST_TEXT = "*{digest} digest* ({start} - {end})\n"
+DIGEST_USAGE_TEXT = "Usage: /digest hourly|daily|off"
+DIGEST_STATE_TEXT = "Digest: {digest}."
 ERROR_NOTICE_TEXT = "Oops...something was wrong."
+BUSY_TEXT = "Busy, please try again later."
+RATE_LIMITED_TEXT = "Too many requests, please slow down."
+ERROR_REPORT_TEXT = "Error `{fingerprint}`:\n```\n{traceback}```"
+ERROR_SUMMARY_TEXT = "*Errors in the last {minutes} minutes*\n"
+ERROR_SUMMARY_ITEM_TEXT = "`{fingerprint}` {count}x {error}\n"
 INSIDER_JOIN_NOTICE_TEXT = "You are an Insider now."
 INSIDER_LEAVE_NOTICE_TEXT = "You are not an Insider now."
@@ -0,0 +1,142 @@
+"""Coalesced error reports for admins."""
+import hashlib
+import logging
+import threading
+import time
+import traceback
+from typing import Callable, Dict, List
+from .config import ERROR_REPORT_BURST, ERROR_REPORT_MAX_LENGTH, ERROR_REPORT_SUMMARY_INTERVAL, ERROR_REPORT_TEXT
+from .config import ERROR_REPORT_WINDOW, ERROR_SUMMARY_ITEM_TEXT, ERROR_SUMMARY_TEXT
+from .mess import TokenBucket
+
+
+def get_error_fingerprint(error: BaseException) -> str:
+    """Identify an error by its type and the functions of its stack, ignoring its message.
+
+    :rtype: str.
+    """
+    frames = [(frame.filename, frame.name) for frame in traceback.extract_tb(error.__traceback__)]
+    raw_fingerprint = repr((type(error).__module__, type(error).__qualname__, frames))
+    return hashlib.sha1(raw_fingerprint.encode('utf-8')).hexdigest()[:8]
+
+
+class ErrorRecord(object):
+    """Occurrences of errors with the same fingerprint.
+
+    :member description: Type and message of the latest occurrence.
+    :type description: str.
+    :member reported_time: When the error was last reported in full.
+    :type reported_time: float.
+    :member count: Occurrences not yet reported, carried over when the error is reported in full again.
+    :type count: int.
+    """
+    def __init__(self, description: str, reported_time: float):
+        self.description = description
+        self.reported_time = reported_time
+        self.last_time = reported_time
+        self.count = 0
+
+
+class ErrorReporter(threading.Thread):
+    """Send the first occurrence of each error at once, and count repeats within `window` seconds,
+    reported in a summary every `summary_interval` seconds.
+
+    At most `burst` errors are reported in full per `window`, later new errors only show up in summaries.
+
+    :member send: Function sending a Markdown text to admins.
+    :type send: Callable[[str], None].
+    :member window: Seconds before an error is reported in full again.
+    :type window: float.
+    :member summary_interval: Seconds between two summaries.
+    :type summary_interval: float.
+    """
+    def __init__(
+            self,
+            send: Callable[[str], None],
+            window: float = ERROR_REPORT_WINDOW,
+            summary_interval: float = ERROR_REPORT_SUMMARY_INTERVAL,
+            burst: int = ERROR_REPORT_BURST):
+        super().__init__(name='ErrorReporter', daemon=True)
+        self.send = send
+        self.window = window
+        self.summary_interval = summary_interval
+        self._bucket = TokenBucket(burst / window, burst)
+        self._records = {} # type: Dict[str, ErrorRecord]
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+
+    def report(self, error: BaseException) -> bool:
+        """Report `error` in full if it is new or its window is over, count it otherwise.
+
+        :return: Whether `error` is reported in full.
+        :rtype: bool.
+        """
+        fingerprint = get_error_fingerprint(error)
+        description = f'{type(error).__name__}: {error}'.replace('`', "'")[:ERROR_REPORT_MAX_LENGTH]
+        now = time.monotonic()
+        with self._lock:
+            record = self._records.get(fingerprint)
+            is_reported = (record is None or now - record.reported_time >= self.window) and self._bucket.consume(now)
+            if is_reported:
+                new_record = self._records[fingerprint] = ErrorRecord(description, now)
+                if record is not None:
+                    new_record.count = record.count
+            elif record is None:
+                record = self._records[fingerprint] = ErrorRecord(description, now - self.window)
+                record.count = 1
+            else:
+                record.description = description
+                record.last_time = now
+                record.count += 1
+        if is_reported:
+            traceback_text = ''.join(traceback.format_exception(type(error), error, error.__traceback__))
+            self.send(ERROR_REPORT_TEXT.format(
+                fingerprint=fingerprint, traceback=traceback_text[-ERROR_REPORT_MAX_LENGTH:].replace('```', "'''")))
+        else:
+            logging.info(f'ErrorReporter: Error `{fingerprint}` suppressed.')
+        return is_reported
+
+    def get_summary(self) -> str:
+        """Render counts of errors not yet reported and reset them, forget errors idle for `window` seconds.
+
+        :return: Markdown text, None if no error is suppressed.
+        :rtype: str.
+        """
+        now = time.monotonic()
+        summary_items = [] # type: List[str]
+        with self._lock:
+            for fingerprint, record in list(self._records.items()):
+                if record.count:
+                    summary_items.append(ERROR_SUMMARY_ITEM_TEXT.format(
+                        fingerprint=fingerprint, count=record.count, error=f'`{record.description}`'))
+                    record.count = 0
+                elif now - record.last_time >= self.window and now - record.reported_time >= self.window:
+                    del self._records[fingerprint]
+        if not summary_items:
+            return None
+        return ERROR_SUMMARY_TEXT.format(minutes=round(self.summary_interval / 60)) + ''.join(summary_items)
+
+    def run(self):
+        """Main loop.
+        """
+        while not self._stop_event.wait(self.summary_interval):
+            self.flush()
+        logging.info('ErrorReporter: Stopped.')
+
+    def flush(self):
+        """Send the summary if any error is suppressed.
+        """
+        summary = self.get_summary()
+        if summary is not None:
+            try:
+                self.send(summary)
+            except Exception as identifier:
+                logging.exception(identifier)
+
+    def stop(self, timeout: float = None):
+        """Stop the reporter after sending the last summary.
+        """
+        self._stop_event.set()
+        if self.is_alive():
+            self.join(timeout)
+        self.flush()
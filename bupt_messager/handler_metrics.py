@@ -0,0 +1,169 @@
+"""Metrics of bot handlers."""
+import bisect
+import functools
+import logging
+import threading
+import time
+from typing import Callable, Dict, Sequence
+from .config import BOT_HANDLER_LATENCY_BUCKETS, BOT_HANDLER_QUEUE_WAIT_WARNING_TIME, BOT_HANDLER_SLOW_TIME
+
+
+class LatencyHistogram(object):
+    """Counts of latencies in fixed buckets, with the total and the maximum. Not thread-safe.
+
+    :member bounds: Upper bounds of buckets in seconds, the last bucket is unbounded.
+    :type bounds: Sequence[float].
+    """
+    def __init__(self, bounds: Sequence[float] = BOT_HANDLER_LATENCY_BUCKETS):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def record(self, seconds: float):
+        self.counts[bisect.bisect_left(self.bounds, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+
+    def get_percentile(self, percent: float) -> float:
+        """Upper bound of the bucket holding the `percent`th percentile, the maximum if in the last bucket.
+
+        :rtype: float.
+        """
+        rank = self.count * percent / 100
+        accumulated_count = 0
+        for bound, bucket_count in zip(self.bounds, self.counts):
+            accumulated_count += bucket_count
+            if accumulated_count >= rank:
+                return min(bound, self.max)
+        return self.max
+
+    @property
+    def stats(self) -> dict:
+        """Property, summary in milliseconds, and counts by upper bound in seconds.
+        """
+        return {
+            'count': self.count,
+            'avg_ms': 1000 * self.total / self.count if self.count else 0,
+            'p50_ms': 1000 * self.get_percentile(50),
+            'p95_ms': 1000 * self.get_percentile(95),
+            'max_ms': 1000 * self.max,
+            'buckets': dict(zip([*map(str, self.bounds), 'inf'], self.counts))
+        }
+
+
+class HandlerStats(object):
+    """Latency, queue wait, errors and rejected updates of one handler.
+    """
+    def __init__(self):
+        self.latency = LatencyHistogram()
+        self.wait = LatencyHistogram()
+        self.error_count = 0
+        self.rejected_counts = {} # type: Dict[str, int]
+
+
+class HandlerMetrics(object):
+    """Collect per-handler latency histograms, queue wait and error counts.
+
+    Handlers wrapped by `timed` run in the worker pool of the dispatcher, so a slow handler only holds one worker.
+
+    :member queued_count: Updates waiting for a worker.
+    :type queued_count: int.
+    :member running_count: Updates being handled.
+    :type running_count: int.
+    """
+    def __init__(self):
+        self.queued_count = 0
+        self.running_count = 0
+        self._lock = threading.Lock()
+        self._handlers = {} # type: Dict[str, HandlerStats]
+
+    def timed(self, dispatcher, callback: Callable) -> Callable:
+        """Wrap `callback` to run it in the worker pool of `dispatcher` and record its metrics.
+        Errors are passed to the error handlers of `dispatcher`, as for handlers run in the dispatcher.
+
+        :param dispatcher: Dispatcher of the updater.
+        :type dispatcher: telegram.ext.Dispatcher.
+        :param callback: Handler callback, named by its `__name__`.
+        :type callback: Callable.
+        :rtype: Callable.
+        """
+        name = callback.__name__
+
+        def run(enqueue_time: float, bot, update, *args, **kwargs):
+            start_time = time.perf_counter()
+            with self._lock:
+                self.queued_count -= 1
+                self.running_count += 1
+            is_error = False
+            try:
+                return callback(bot, update, *args, **kwargs)
+            except Exception as identifier:
+                is_error = True
+                dispatcher.dispatch_error(update, identifier)
+            finally:
+                with self._lock:
+                    self.running_count -= 1
+                self.record(name, start_time - enqueue_time, time.perf_counter() - start_time, is_error)
+
+        @functools.wraps(callback)
+        def wrapped(bot, update, *args, **kwargs):
+            """See `timed`.
+            """
+            with self._lock:
+                self.queued_count += 1
+            return dispatcher.run_async(run, time.perf_counter(), bot, update, *args, **kwargs)
+        return wrapped
+
+    def _get_handler_stats(self, name: str) -> HandlerStats:
+        handler_stats = self._handlers.get(name)
+        if handler_stats is None:
+            handler_stats = self._handlers[name] = HandlerStats()
+        return handler_stats
+
+    def record_rejected(self, name: str, reason: str):
+        """Count an update of handler `name` rejected before running, e.g. `limited` or `shed`.
+        """
+        with self._lock:
+            rejected_counts = self._get_handler_stats(name).rejected_counts
+            rejected_counts[reason] = rejected_counts.get(reason, 0) + 1
+
+    def record(self, name: str, wait_time: float, elapsed_time: float, is_error: bool = False):
+        """Record a finished call of handler `name`.
+
+        :param wait_time: Seconds waited for a worker.
+        :type wait_time: float.
+        :param elapsed_time: Seconds spent in the handler.
+        :type elapsed_time: float.
+        :param is_error: Defaults to False. Whether the handler raised an error.
+        :type is_error: bool, optional.
+        """
+        if elapsed_time > BOT_HANDLER_SLOW_TIME:
+            logging.warning(f'HandlerMetrics: Slow handler `{name}` ({elapsed_time:.3f}s).')
+        if wait_time > BOT_HANDLER_QUEUE_WAIT_WARNING_TIME:
+            logging.warning(f'HandlerMetrics: `{name}` waited {wait_time:.3f}s for a worker, {self.queued_count} queued.')
+        with self._lock:
+            handler_stats = self._get_handler_stats(name)
+            handler_stats.latency.record(elapsed_time)
+            handler_stats.wait.record(wait_time)
+            handler_stats.error_count += int(is_error)
+
+    @property
+    def stats(self) -> dict:
+        """Property, queued and running updates, and metrics of each handler.
+        """
+        with self._lock:
+            return {
+                'queued': self.queued_count,
+                'running': self.running_count,
+                'handlers': {
+                    name: {
+                        'latency': handler_stats.latency.stats,
+                        'wait': handler_stats.wait.stats,
+                        'errors': handler_stats.error_count,
+                        'rejected': dict(handler_stats.rejected_counts)
+                    } for name, handler_stats in self._handlers.items()
+                }
+            }
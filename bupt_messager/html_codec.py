@@ -0,0 +1,55 @@
+"""Compression of notice HTML."""
+import hashlib
+import zlib
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+HTML_CODEC_PLAIN = 'plain'
+HTML_CODEC_ZLIB = 'zlib'
+HTML_CODEC_ZSTD = 'zstd'
+
+
+def get_html_codec(codec: str) -> str:
+    """Check `codec`, fall back to zlib if zstd is not installed.
+
+    :param codec: `plain`, `zlib` or `zstd`.
+    :type codec: str.
+    :raises ValueError: Unknown codec.
+    :rtype: str.
+    """
+    if codec == HTML_CODEC_ZSTD and zstandard is None:
+        return HTML_CODEC_ZLIB
+    if codec not in (HTML_CODEC_PLAIN, HTML_CODEC_ZLIB, HTML_CODEC_ZSTD):
+        raise ValueError(f'Unknown HTML codec `{codec}`.')
+    return codec
+
+
+def hash_html(html: str) -> str:
+    """Content hash of `html`, in hex.
+
+    :rtype: str.
+    """
+    return hashlib.sha256(html.encode('utf-8')).hexdigest()
+
+
+def compress_html(html: str, codec: str) -> bytes:
+    """Compress `html` with `codec`, `zlib` or `zstd`.
+
+    :rtype: bytes.
+    """
+    raw_html = html.encode('utf-8')
+    if codec == HTML_CODEC_ZSTD:
+        return zstandard.ZstdCompressor().compress(raw_html)
+    return zlib.compress(raw_html, 9)
+
+
+def decompress_html(data: bytes, codec: str) -> str:
+    """Decompress `data` compressed by `compress_html`.
+
+    :rtype: str.
+    """
+    if codec == HTML_CODEC_ZSTD:
+        return zstandard.ZstdDecompressor().decompress(data).decode('utf-8')
+    return zlib.decompress(data).decode('utf-8')
@@ -74,6 +74,20 @@ def try_int(text, default=None):
         return default
 
 
+def to_base36(number: int) -> str:
+    """Convert a non-negative int to text in base 36, the inverse of `int(text, 36)`.
+
+    :rtype: str.
+    """
+    digits = '0123456789abcdefghijklmnopqrstuvwxyz'
+    text = ''
+    while True:
+        number, digit = divmod(number, 36)
+        text = digits[digit] + text
+        if not number:
+            return text
+
+
 def get_arg(target: type, args: list, kwargs: dict):
     """Select argument with type `target` in `args` and kwargs.
 
@@ -93,6 +107,48 @@ def get_arg(target: type, args: list, kwargs: dict):
     raise ValueError(f'No such value: {target}')
 
 
+class TokenBucket(object):
+    """Token bucket refilled at `rate` tokens per second, holding at most `capacity` tokens.
+    Not thread-safe.
+    """
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._update_time = time.monotonic()
+
+    def _refill(self, now: float):
+        self._tokens = min(self.capacity, self._tokens + (now - self._update_time) * self.rate)
+        self._update_time = now
+
+    def set_rate(self, rate: float):
+        """Change the rate, and the capacity to hold one second of tokens.
+        """
+        self._refill(time.monotonic())
+        self.rate = rate
+        self.capacity = max(1, rate)
+        self._tokens = min(self._tokens, self.capacity)
+
+    def get_wait_time(self, now: float = None) -> float:
+        """Seconds to wait before a token is available, 0 if available now.
+
+        :rtype: float.
+        """
+        self._refill(time.monotonic() if now is None else now)
+        return 0 if self._tokens >= 1 else (1 - self._tokens) / self.rate
+
+    def consume(self, now: float = None) -> bool:
+        """Take a token if available.
+
+        :return: Whether a token is taken.
+        :rtype: bool.
+        """
+        if self.get_wait_time(now):
+            return False
+        self._tokens -= 1
+        return True
+
+
 def threaded(target_function: Callable) -> threading.Thread:
     """Start a function in another thread and return it.
 
@@ -0,0 +1,343 @@
+"""Scheduler of outgoing messages with priority lanes."""
+import heapq
+import itertools
+import logging
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, NamedTuple, Tuple
+from telegram.error import RetryAfter
+from telegram.utils.promise import Promise
+from .config import BOT_ALL_BURST_LIMIT, BOT_CHAT_INTERVAL, BOT_GROUP_BURST_LIMIT, BOT_MESSAGE_LANES
+from .config import BOT_RETRY_AFTER_MAX_ATTEMPTS, BOT_SEND_RATE_WINDOW, BOT_SEND_WORKERS
+from .mess import TokenBucket
+from .rate_controller import RateController
+
+
+class MessagePromise(Promise):
+    """A :obj:`Promise` settled by the scheduler, which may try its function several times.
+    """
+    def __init__(self, pooled_function: Callable, args: tuple, kwargs: dict):
+        super().__init__(pooled_function, args, kwargs)
+        self._done_callbacks = [] # type: List[Callable[[MessagePromise], None]]
+        self._callback_lock = threading.Lock()
+
+    def add_done_callback(self, callback: Callable):
+        """Call `callback(promise)` in the thread settling the promise, or at once if already settled.
+        """
+        with self._callback_lock:
+            if not self.done.is_set():
+                self._done_callbacks.append(callback)
+                return
+        self._run_callback(callback)
+
+    def _run_callback(self, callback: Callable):
+        try:
+            callback(self)
+        except Exception as identifier:
+            logging.exception(identifier)
+
+    def _settle(self):
+        with self._callback_lock:
+            self.done.set()
+            done_callbacks, self._done_callbacks = self._done_callbacks, []
+        for callback in done_callbacks:
+            self._run_callback(callback)
+
+    def resolve(self, result):
+        self._result = result
+        self._settle()
+
+    def reject(self, exception: Exception):
+        self._exception = exception
+        self._settle()
+
+
+class ScheduledMessage(NamedTuple):
+    """A queued send request.
+    """
+    promise: MessagePromise
+    chat_id: int
+    enqueue_time: float
+    attempt: int = 0
+
+
+class MessageLane(object):
+    """A queue of messages with its own weight and token bucket.
+
+    :member name: Name of the lane.
+    :type name: str.
+    :member weight: Share of the global rate when other lanes are busy.
+    :type weight: float.
+    :member bucket: Rate limit of the lane alone.
+    :type bucket: TokenBucket.
+    :member messages: Queued messages.
+    :type messages: deque.
+    :member virtual_time: Weighted amount of messages sent, the busy lane with the least goes first.
+    :type virtual_time: float.
+    """
+    def __init__(self, name: str, weight: float, rate: float, burst: float):
+        self.name = name
+        self.weight = weight
+        self.bucket = TokenBucket(rate, burst)
+        self.messages = deque()
+        self.virtual_time = 0.0
+        self.delayed_count = 0
+        self.retried_count = 0
+        self.sent_count = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+    def record_sent(self, wait_time: float):
+        self.sent_count += 1
+        self.wait_total += wait_time
+        self.wait_max = max(self.wait_max, wait_time)
+        self.virtual_time += 1 / self.weight
+
+    @property
+    def stats(self) -> dict:
+        """Property, queue depth and wait times in seconds.
+        """
+        return {
+            'depth': len(self.messages) + self.delayed_count,
+            'sent': self.sent_count,
+            'retried': self.retried_count,
+            'wait_avg': self.wait_total / self.sent_count if self.sent_count else 0,
+            'wait_max': self.wait_max
+        }
+
+
+class MessageScheduler(threading.Thread):
+    """Send queued messages lane by lane, by weighted fair queuing,
+    within the global rate limit and the rate limit of each chat.
+
+    Up to `workers` messages are sent at the same time by a thread pool, at most one per chat.
+    Messages to a chat sent too recently, or still being sent, wait in a delay heap without blocking other chats.
+
+    A message failed with `RetryAfter` is queued again after `retry_after` seconds, during which its chat cools down,
+    and the global rate is adapted by a :obj:`RateController`.
+
+    :member lanes: Lanes by name.
+    :type lanes: Dict[str, MessageLane].
+    :member workers: Maximum amount of messages in flight.
+    :type workers: int.
+    """
+    def __init__(
+            self,
+            lanes: Dict[str, Tuple[float, float, float]] = None,
+            all_burst_limit: float = BOT_ALL_BURST_LIMIT,
+            chat_interval: float = BOT_CHAT_INTERVAL,
+            group_interval: float = 60 / BOT_GROUP_BURST_LIMIT,
+            workers: int = BOT_SEND_WORKERS):
+        super().__init__(name='MessageScheduler', daemon=True)
+        self.lanes = {
+            name: MessageLane(name, weight, rate, burst)
+            for name, (weight, rate, burst) in (lanes or BOT_MESSAGE_LANES).items()
+        }
+        self.chat_interval = chat_interval
+        self.group_interval = group_interval
+        self._global_bucket = TokenBucket(all_burst_limit, all_burst_limit)
+        self.rate_controller = RateController(all_burst_limit)
+        self._chat_ready_times = {} # type: Dict[int, float]
+        self._delayed = [] # type: List[tuple]
+        self._sequence = itertools.count()
+        self._condition = threading.Condition()
+        self._is_stopped = False
+        self.workers = workers
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='MessageSender')
+        self._in_flight_chat_ids = set()
+        self._in_flight_count = 0
+        self._sent_times = deque()
+
+    def put(self, func: Callable, args: tuple, kwargs: dict, chat_id: int, lane: str) -> Promise:
+        """Queue `func(*args, **kwargs)` sending to `chat_id` in `lane`.
+
+        :return: Promise of the result.
+        :rtype: Promise.
+        """
+        promise = MessagePromise(func, args, kwargs)
+        with self._condition:
+            message_lane = self.lanes[lane]
+            if not message_lane.messages and not message_lane.delayed_count:
+                busy_times = [
+                    other_lane.virtual_time for other_lane in self.lanes.values()
+                    if other_lane.messages or other_lane.delayed_count]
+                if busy_times:
+                    message_lane.virtual_time = max(message_lane.virtual_time, min(busy_times))
+            message_lane.messages.append(ScheduledMessage(promise, chat_id, time.monotonic()))
+            self._condition.notify_all()
+        return promise
+
+    def _release_delayed(self, now: float):
+        """Move messages whose chat is ready back to the head of their lanes, in order.
+        """
+        released_messages = {} # type: Dict[str, list]
+        while self._delayed and self._delayed[0][0] <= now:
+            _, _, lane_name, message = heapq.heappop(self._delayed)
+            released_messages.setdefault(lane_name, []).append(message)
+            self.lanes[lane_name].delayed_count -= 1
+        for lane_name, messages in released_messages.items():
+            self.lanes[lane_name].messages.extendleft(reversed(messages))
+
+    def _select(self, now: float) -> Tuple[MessageLane, ScheduledMessage, float]:
+        """Pick the next message to send.
+
+        :return: The lane and the message, or None and seconds to wait.
+        :rtype: Tuple[MessageLane, ScheduledMessage, float].
+        """
+        while True:
+            self._release_delayed(now)
+            wait_times = [self._delayed[0][0] - now] if self._delayed else []
+            ready_lanes = []
+            for message_lane in self.lanes.values():
+                if message_lane.messages:
+                    lane_wait_time = message_lane.bucket.get_wait_time(now)
+                    if lane_wait_time:
+                        wait_times.append(lane_wait_time)
+                    else:
+                        ready_lanes.append(message_lane)
+            if not ready_lanes:
+                return None, None, min(wait_times) if wait_times else None
+            global_wait_time = self._global_bucket.get_wait_time(now)
+            if global_wait_time:
+                return None, None, global_wait_time
+            message_lane = min(ready_lanes, key=lambda ready_lane: ready_lane.virtual_time)
+            message = message_lane.messages.popleft()
+            chat_ready_time = self._chat_ready_times.get(message.chat_id, 0)
+            if message.chat_id in self._in_flight_chat_ids:
+                chat_ready_time = max(chat_ready_time, now + self.chat_interval)
+            if chat_ready_time > now:
+                heapq.heappush(self._delayed, (chat_ready_time, next(self._sequence), message_lane.name, message))
+                message_lane.delayed_count += 1
+                continue
+            message_lane.bucket.consume(now)
+            self._global_bucket.consume(now)
+            if message.chat_id is not None:
+                is_group = isinstance(message.chat_id, int) and message.chat_id < 0
+                self._chat_ready_times[message.chat_id] = now + (self.group_interval if is_group else self.chat_interval)
+            return message_lane, message, 0
+
+    def _prune_chat_ready_times(self, now: float):
+        self._chat_ready_times = {
+            chat_id: ready_time for chat_id, ready_time in self._chat_ready_times.items() if ready_time > now}
+
+    def _retry_later(self, message: ScheduledMessage, lane_name: str, retry_after: float, now: float):
+        """Cool down the chat of `message` and queue it again after `retry_after` seconds.
+        """
+        retry_time = now + retry_after
+        if message.chat_id is not None:
+            self._chat_ready_times[message.chat_id] = max(self._chat_ready_times.get(message.chat_id, 0), retry_time)
+        heapq.heappush(self._delayed, (
+            retry_time, next(self._sequence), lane_name, message._replace(attempt=message.attempt + 1)))
+        self.lanes[lane_name].delayed_count += 1
+        self.lanes[lane_name].retried_count += 1
+
+    def _send(self, message: ScheduledMessage, lane_name: str):
+        """Run in the thread pool, send `message`, settle its promise or queue it again, and release its chat.
+        """
+        promise = message.promise
+        retry_after = None
+        try:
+            promise.resolve(promise.pooled_function(*promise.args, **promise.kwargs))
+        except RetryAfter as identifier:
+            if message.attempt + 1 < BOT_RETRY_AFTER_MAX_ATTEMPTS:
+                retry_after = identifier.retry_after
+                logging.warning(f'MessageScheduler: Retry message to `{message.chat_id}` after {retry_after}s.')
+            else:
+                logging.error(f'MessageScheduler: Drop message to `{message.chat_id}` after {message.attempt + 1} attempts.')
+                promise.reject(identifier)
+        except Exception as identifier:
+            logging.exception(identifier)
+            promise.reject(identifier)
+        finally:
+            with self._condition:
+                now = time.monotonic()
+                self._in_flight_count -= 1
+                self._in_flight_chat_ids.discard(message.chat_id)
+                if retry_after is None:
+                    self.rate_controller.on_success()
+                    self._sent_times.append(now)
+                    while self._sent_times[0] < now - BOT_SEND_RATE_WINDOW:
+                        self._sent_times.popleft()
+                else:
+                    self.rate_controller.on_retry_after(now)
+                    self._retry_later(message, lane_name, retry_after, now)
+                self._global_bucket.set_rate(self.rate_controller.rate)
+                self._condition.notify_all()
+
+    def run(self):
+        """Main loop.
+        """
+        logging.info(f'MessageScheduler: Started with {self.workers} workers.')
+        while True:
+            with self._condition:
+                while True:
+                    if self._is_stopped:
+                        logging.info('MessageScheduler: Stopped.')
+                        return
+                    if self._in_flight_count >= self.workers:
+                        self._condition.wait()
+                        continue
+                    now = time.monotonic()
+                    message_lane, message, wait_time = self._select(now)
+                    if message is not None:
+                        message_lane.record_sent(now - message.enqueue_time)
+                        break
+                    self._condition.wait(wait_time)
+                self._in_flight_count += 1
+                self._in_flight_chat_ids.add(message.chat_id)
+                if len(self._chat_ready_times) > 4 * len(self._delayed) + 1024:
+                    self._prune_chat_ready_times(now)
+            self._executor.submit(self._send, message, message_lane.name)
+
+    def stop(self, timeout: float = None):
+        """Stop the scheduler, discarding queued messages, and wait for messages in flight.
+        """
+        with self._condition:
+            self._is_stopped = True
+            self._condition.notify_all()
+        if self.is_alive():
+            self.join(timeout)
+        self._executor.shutdown(wait=True)
+
+    def drain(self, timeout: float = None) -> bool:
+        """Wait until queued, delayed and in flight messages are all sent or dropped.
+
+        :param timeout: Defaults to None. Seconds to wait at most, forever if None.
+        :type timeout: float, optional.
+        :return: Whether all messages are sent or dropped.
+        :rtype: bool.
+        """
+        with self._condition:
+            return self._condition.wait_for(
+                lambda: self._is_stopped or not (
+                    self._in_flight_count or self._delayed
+                    or any(message_lane.messages for message_lane in self.lanes.values())),
+                timeout)
+
+    def get_send_rate(self) -> float:
+        """Messages sent per second in the last `BOT_SEND_RATE_WINDOW` seconds.
+
+        :rtype: float.
+        """
+        with self._condition:
+            window_start_time = time.monotonic() - BOT_SEND_RATE_WINDOW
+            while self._sent_times and self._sent_times[0] < window_start_time:
+                self._sent_times.popleft()
+            return len(self._sent_times) / BOT_SEND_RATE_WINDOW
+
+    @property
+    def stats(self) -> Dict[str, dict]:
+        """Property, stats of each lane, messages in flight and the send rate.
+        """
+        send_rate = self.get_send_rate()
+        with self._condition:
+            stats = {name: message_lane.stats for name, message_lane in self.lanes.items()}
+            stats['total'] = {
+                'in_flight': self._in_flight_count,
+                'rate': send_rate,
+                'rate_limit': self.rate_controller.rate,
+                'retry_after': self.rate_controller.retry_after_count
+            }
+            return stats
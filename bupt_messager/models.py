@@ -1,11 +1,12 @@
 """Models representing SQL tables."""
 import datetime
 from enum import Enum
-from sqlalchemy import BigInteger, Boolean, Column, DateTime, Integer, String, Text, ForeignKey
+from sqlalchemy import BigInteger, Boolean, Column, DateTime, Index, Integer, LargeBinary, String, Text, ForeignKey
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import relationship
+from sqlalchemy.orm import deferred, relationship
 from sqlalchemy.sql import func as sql_func
-from .config import STATUS_TEXT_DICT
+from .config import DELIVERY_PENDING, STATUS_TEXT_DICT
+from .html_codec import decompress_html
 
 Base = declarative_base()
 
@@ -31,17 +32,35 @@ class Notification(Base):
         :type summary: str.
         :member date: Date of the notice.
         :type date: str.
+        :member html_hash: Hash of the compressed HTML in table `notice_html`, None if stored inline.
+        :type html_hash: str.
     """
     __tablename__ = 'notification'
+    __table_args__ = (Index('notice_time_id', 'time', 'id'),)
     id = Column(String(36), primary_key=True)
     author = Column(String(40))
-    html = Column(Text)
+    inline_html = deferred(Column('html', Text))
+    html_hash = Column(String(64), ForeignKey('notice_html.hash'))
     title = Column(String(80))
     url = Column(Text)
-    summary = Column(Text)
+    summary = deferred(Column(Text))
     time = Column(DateTime)
     is_pushed = Column(Boolean, default=False)
 
+    compressed_html = relationship('NoticeHtml')
+
+    @property
+    def html(self) -> str:
+        """Property, HTML of the notice, decompressed if stored in table `notice_html`.
+        """
+        if self.html_hash is not None:
+            return self.compressed_html.html
+        return self.inline_html
+
+    @html.setter
+    def html(self, html: str):
+        self.inline_html = html
+
     def to_dict(self):
         return {
             'id': self.id,
@@ -62,6 +81,29 @@ class Notification(Base):
         return f"<Notification(id='{self.id}', title='{self.title}')>"
 
 
+class NoticeHtml(Base):
+    """Table notice_html, compressed HTML of notices keyed by content hash.
+
+        :member hash: SHA-256 of the HTML, in hex.
+        :type hash: str.
+        :member codec: Compression codec, `zlib` or `zstd`.
+        :type codec: str.
+        :member data: Compressed HTML.
+        :type data: bytes.
+    """
+    __tablename__ = 'notice_html'
+    hash = Column(String(64), primary_key=True)
+    codec = Column(String(8))
+    data = Column(LargeBinary(length=2 ** 24))
+
+    @property
+    def html(self) -> str:
+        return decompress_html(self.data, self.codec)
+
+    def __repr__(self):
+        return f"<NoticeHtml(hash='{self.hash}', codec='{self.codec}')>"
+
+
 class Attachment(Base):
     """Table attachment.
 
@@ -76,7 +118,7 @@ class Attachment(Base):
     """
     __tablename__ = 'attachment'
     id = Column(Integer, primary_key=True)
-    notice_id = Column(String(36), ForeignKey('notification.id'))
+    notice_id = Column(String(36), ForeignKey('notification.id'), index=True)
     name = Column(String(50))
     url = Column(Text)
 
@@ -92,13 +134,16 @@ class Chat(Base):
     Attributes:
         :member id: Chat id.
         :type id: int.
+        :member digest: Digest mode, a key of `DIGEST_INTERVALS`, or None to receive each notice.
+        :type digest: str.
     """
     __tablename__ = 'chat'
     id = Column(BigInteger, primary_key=True)
     is_insider = Column(Boolean, default=False)
+    digest = Column(String(8), default=None)
 
     def __repr__(self):
-        return f"<Chat(id='{self.id}', is_insider={self.is_insider})>"
+        return f"<Chat(id='{self.id}', is_insider={self.is_insider}, digest={self.digest})>"
 
 
 class Status(Base):
@@ -122,3 +167,47 @@ class Status(Base):
         """Property, status in text.
         """
         return STATUS_TEXT_DICT[self.status]
+
+
+class StatusRollup(Base):
+    """Table status_rollup, amount of each status code per time bucket.
+
+    Attributes:
+        :member bucket: Start of the bucket, an hour, or a day after downsampling.
+        :type bucket: datetime.datetime.
+        :member status: Status code.
+        :type status: int.
+        :member count: Amount of status logs.
+        :type count: int.
+    """
+    __tablename__ = 'status_rollup'
+    bucket = Column(DateTime, primary_key=True)
+    status = Column(Integer, primary_key=True, autoincrement=False)
+    count = Column(Integer, default=0)
+
+    def __repr__(self):
+        return f"<StatusRollup(bucket='{self.bucket}', status={self.status}, count={self.count})>"
+
+
+class Delivery(Base):
+    """Table delivery, the outbox of notices to be sent to each chat.
+
+    Attributes:
+        :member notice_id: Id of the notice.
+        :type notice_id: str.
+        :member chat_id: Id of the chat.
+        :type chat_id: int.
+        :member state: Delivery state, `DELIVERY_PENDING`, `DELIVERY_SENT` or `DELIVERY_FAILED`.
+        :type state: int.
+        :member time: Time of the last state change.
+        :type time: datetime.datetime.
+    """
+    __tablename__ = 'delivery'
+    __table_args__ = (Index('delivery_state', 'state', 'notice_id'),)
+    notice_id = Column(String(36), ForeignKey('notification.id'), primary_key=True)
+    chat_id = Column(BigInteger, primary_key=True, autoincrement=False)
+    state = Column(Integer, default=DELIVERY_PENDING)
+    time = Column(DateTime, default=sql_func.now())
+
+    def __repr__(self):
+        return f"<Delivery(notice_id='{self.notice_id}', chat_id={self.chat_id}, state={self.state})>"
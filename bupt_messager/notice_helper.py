@@ -1,15 +1,28 @@
-from telegram import ParseMode, InlineKeyboardButton, InlineKeyboardMarkup
-from .config import NOTICE_TEXT, NOTICE_MESSAGE_SUMMARY_LENGTH
+from datetime import datetime, time, timedelta
+from typing import List, NamedTuple, Tuple
+from telegram import ParseMode, InlineKeyboardButton, InlineKeyboardMarkup, InlineQueryResultArticle
+from telegram import InputTextMessageContent
+from .config import BOT_NOTICE_MAX_BUTTON_PER_LINE, DIGEST_INTERVALS, DIGEST_PAGE_LENGTH, DIGEST_TEXT
+from .config import DIGEST_WINDOW_FORMAT, INLINE_ARTICLE_DESCRIPTION_LENGTH, NOTICE_TEXT, NOTICE_MESSAGE_SUMMARY_LENGTH
 from .models import Notification
+from .read_models import NoticeListItem
 
 
-def send_notice(bot, chat_id: int, notice: Notification = None):
-    """Send a notice to a specific user.
+class NoticePayload(NamedTuple):
+    """Message rendered once, to be sent to any chat.
+    `reply_markup` is serialized into JSON.
+    """
+    key: str
+    text: str
+    parse_mode: str
+    reply_markup: str
 
-    :param bot: Current bot.
-    :type bot: telegram.bot.
-    :param notice: Notification to be sent.
-    :param index: Index of the message to be sent.
+
+def render_notice_keyboard(notice: Notification) -> InlineKeyboardMarkup:
+    """Render the READ button and attachment buttons of a notice.
+
+    :param notice: Notification or :obj:`NoticeSnapshot`.
+    :rtype: InlineKeyboardMarkup.
     """
     keyboard = [[InlineKeyboardButton('READ', notice.url)]]
     if notice.attachments:
@@ -17,13 +30,168 @@ def send_notice(bot, chat_id: int, notice: Notification = None):
             [InlineKeyboardButton(attachment.name, attachment.url)]
             for attachment in notice.attachments
         ]
-    menu_markup = InlineKeyboardMarkup(keyboard)
-    bot.send_message(
+    return InlineKeyboardMarkup(keyboard)
+
+
+def render_notice_text(notice: Notification) -> str:
+    """Render the text of a notice in markdown.
+
+    :param notice: Notification or :obj:`NoticeSnapshot`.
+    :rtype: str.
+    """
+    return NOTICE_TEXT.format(
+        title=notice.title,
+        summary=notice.summary[:NOTICE_MESSAGE_SUMMARY_LENGTH],
+        datetime=notice.datetime,
+        id=notice.id)
+
+
+def render_notice(notice: Notification) -> NoticePayload:
+    """Render the message of a notice.
+
+    :param notice: Notification or :obj:`NoticeSnapshot` to be rendered.
+    :return: Rendered message.
+    :rtype: NoticePayload.
+    """
+    return NoticePayload(
+        key=notice.id,
+        text=render_notice_text(notice),
+        parse_mode=ParseMode.MARKDOWN,
+        reply_markup=render_notice_keyboard(notice).to_json())
+
+
+def render_inline_article(notice: Notification) -> InlineQueryResultArticle:
+    """Render a notice as a result of inline queries, sharing the message of `render_notice`.
+
+    :param notice: Notification or :obj:`NoticeSnapshot` to be rendered.
+    :rtype: InlineQueryResultArticle.
+    """
+    return InlineQueryResultArticle(
+        id=notice.id,
+        title=notice.title,
+        input_message_content=InputTextMessageContent(render_notice_text(notice), parse_mode=ParseMode.MARKDOWN),
+        reply_markup=render_notice_keyboard(notice),
+        url=notice.url,
+        description=f'{notice.datetime} {notice.summary[:INLINE_ARTICLE_DESCRIPTION_LENGTH]}')
+
+
+def markup_keyboard(buttons: List[InlineKeyboardButton],
+                    width: int,
+                    header_buttons: List[InlineKeyboardButton] = None,
+                    footer_buttons: List[InlineKeyboardButton] = None) -> InlineKeyboardMarkup:
+    """Build keybords from buttons.
+
+    :param buttons: Buttons displayed in the middle.
+    :type buttons: List[InlineKeyboardButton].
+    :param width: Amount of buttons per line.
+    :type width: int.
+    :param header_buttons: Defaults to None. Buttons on the first line.
+    :type header_buttons: List[InlineKeyboardButton], optional.
+    :param footer_buttons: Defaults to None. Buttons on the last line.
+    :type footer_buttons: List[InlineKeyboardButton], optional.
+    :return: Keyboard in :obj:`InlineKeyboardMarkup`.
+    :rtype: InlineKeyboardMarkup.
+    """
+    menu = [buttons[i:i + width] for i in range(0, len(buttons), width)]
+    if header_buttons:
+        menu.insert(0, header_buttons)
+    if footer_buttons:
+        menu.append(footer_buttons)
+    return InlineKeyboardMarkup(menu)
+
+
+def render_notice_list(notices: List[NoticeListItem], start: int = 0) -> Tuple[str, List[InlineKeyboardButton]]:
+    """Render a numbered list of notices, with a READ button for each notice.
+
+    :param notices: Notices to be listed.
+    :type notices: List[NoticeListItem].
+    :param start: Defaults to 0. Index of the first notice, numbers start from `start + 1`.
+    :type start: int, optional.
+    :return: Text in markdown, and buttons.
+    :rtype: Tuple[str, List[InlineKeyboardButton]].
+    """
+    text = ""
+    buttons = []
+    for index, notice in enumerate(notices, start + 1):
+        text += f'{index}.[{notice.title}]({notice.url})({notice.datetime})\n'
+        buttons.append(InlineKeyboardButton(text=f'{index}', callback_data=f'read_{notice.id}'))
+    return text, buttons
+
+
+def get_digest_window(digest: str, moment: datetime) -> Tuple[datetime, datetime]:
+    """Get the window of digest `digest` containing `moment`, windows are aligned to midnight.
+
+    :param digest: Digest mode, a key of `DIGEST_INTERVALS`.
+    :type digest: str.
+    :return: Start and end of the window.
+    :rtype: Tuple[datetime, datetime].
+    """
+    interval = timedelta(seconds=DIGEST_INTERVALS[digest])
+    midnight = datetime.combine(moment.date(), time())
+    start = midnight + (moment - midnight) // interval * interval
+    return start, start + interval
+
+
+def render_digest(digest: str, start: datetime, notices: List[NoticeListItem], page: int = 0) -> NoticePayload:
+    """Render a page of the digest of notices released in a window.
+
+    :param digest: Digest mode, a key of `DIGEST_INTERVALS`.
+    :type digest: str.
+    :param start: Start of the window.
+    :type start: datetime.
+    :param notices: All notices released in the window.
+    :type notices: List[NoticeListItem].
+    :param page: Defaults to 0. Index of the page.
+    :type page: int, optional.
+    :rtype: NoticePayload.
+    """
+    first_index = page * DIGEST_PAGE_LENGTH
+    window_key = start.strftime(DIGEST_WINDOW_FORMAT)
+    text, buttons = render_notice_list(notices[first_index:first_index + DIGEST_PAGE_LENGTH], first_index)
+    last_index = first_index + len(buttons)
+    _, end = get_digest_window(digest, start)
+    text = DIGEST_TEXT.format(
+        digest=digest.capitalize(),
+        start=start.strftime('%Y/%m/%d %H:%M'),
+        end=end.strftime('%Y/%m/%d %H:%M')) + text + f'({first_index + 1}-{last_index} / {len(notices)})'
+    return NoticePayload(
+        key=f'{digest}_{window_key}_{page}',
+        text=text,
+        parse_mode=ParseMode.MARKDOWN,
+        reply_markup=markup_keyboard(
+            buttons=buttons,
+            width=BOT_NOTICE_MAX_BUTTON_PER_LINE,
+            footer_buttons=[InlineKeyboardButton(
+                text='more', callback_data=f'digest_{digest}_{window_key}_{page + 1}')] if last_index < len(notices) else None
+        ).to_json())
+
+
+def send_payload(bot, chat_id: int, payload: NoticePayload, **kwargs):
+    """Send a rendered notice to a specific user.
+
+    :param bot: Current bot.
+    :type bot: telegram.bot.
+    :param payload: Rendered notice.
+    :type payload: NoticePayload.
+    :param **kwargs: Extra keyword arguments of `bot.send_message`, e.g. `lane`.
+    :type **kwargs: dict.
+    :return: Sent message, or a :obj:`Promise` if the message is queued.
+    """
+    return bot.send_message(
         chat_id=chat_id,
-        text=NOTICE_TEXT.format(
-            title=notice.title,
-            summary=notice.summary[:NOTICE_MESSAGE_SUMMARY_LENGTH],
-            datetime=notice.datetime,
-            id=notice.id),
-        reply_markup=menu_markup,
-        parse_mode=ParseMode.MARKDOWN)
+        text=payload.text,
+        reply_markup=payload.reply_markup,
+        parse_mode=payload.parse_mode,
+        **kwargs)
+
+
+def send_notice(bot, chat_id: int, notice: Notification = None):
+    """Send a notice to a specific user.
+
+    :param bot: Current bot.
+    :type bot: telegram.bot.
+    :param notice: Notification to be sent.
+    :param index: Index of the message to be sent.
+    :return: Sent message, or a :obj:`Promise` if the message is queued.
+    """
+    return send_payload(bot, chat_id, render_notice(notice))
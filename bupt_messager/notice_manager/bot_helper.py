@@ -1,17 +1,46 @@
 """Tools for the bot."""
 import logging
-from telegram import InlineKeyboardButton, InlineKeyboardMarkup, ParseMode
+import queue
+import time
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, NamedTuple, Sequence, Set, Tuple
+from ..cache import LRUCache
+from ..config import BOT_LANE_BULK, DELIVERY_FAILED, DELIVERY_PENDING, DELIVERY_SEND_TIMEOUT, DELIVERY_SENT
+from ..config import DELIVERY_BATCH_SIZE, DELIVERY_RESUME_ATTEMPTS, DIGEST_DELAY, DIGEST_INTERVALS, NOTICE_CACHE_SIZE
+from ..message_scheduler import MessagePromise
 from ..models import Notification, SubscriberChannel
-from ..notice_helper import send_notice
+from ..notice_helper import NoticePayload, get_digest_window, render_digest, render_notice, send_payload
+
+
+class TimedOutBatch(NamedTuple):
+    """Messages of a batch of `BotHelper.send_batch` still unsettled when it timed out.
+    """
+    key: str
+    settled_chats: queue.Queue
+    on_settled: Callable[[List[int], List[int]], None]
+    unsettled_chat_ids: Set[int]
 
 
 class BotHelper(object):
     """Bot layer for `NoticeManager`.
+
+    :member notice_payloads: Rendered messages of recent notices, by notice id.
+    :type notice_payloads: LRUCache.
+    :member digest_window_ends: End of the latest closed window of each digest mode.
+    :type digest_window_ends: Dict[str, datetime].
+    :member delivery_resume_counts: Times pending deliveries of each notice were resumed, see `resume_deliveries`.
+    :type delivery_resume_counts: Dict[str, int].
+    :member timed_out_batches: Batches of `send_batch` timed out with messages not yet settled.
+    :type timed_out_batches: List[TimedOutBatch].
     """
 
     def __init__(self, sql_handler=None, bot=None):
         self.bot = bot
         self.sql_handler = sql_handler
+        self.notice_payloads = LRUCache(NOTICE_CACHE_SIZE)
+        self.digest_window_ends = {} # type: Dict[str, datetime]
+        self.delivery_resume_counts = {} # type: Dict[str, int]
+        self.timed_out_batches = [] # type: List[TimedOutBatch]
 
     def init_bot(self, bot=None):
         self.bot = bot
@@ -19,12 +48,183 @@ class BotHelper(object):
     def init_sql_handle(self, sql_handler=None):
         self.sql_handler = sql_handler
 
+    def prepare_notices(self, notices: List[Notification]):
+        """Render messages of new notices ahead of broadcasting.
+
+        :param notices: New notifications.
+        :type notices: List[Notification].
+        """
+        for notice in notices:
+            self.notice_payloads.put(notice.id, render_notice(notice))
+
+    def get_payload(self, notice: Notification) -> NoticePayload:
+        """Get the rendered message of `notice`, render it if not prepared.
+
+        :rtype: NoticePayload.
+        """
+        payload = self.notice_payloads.get(notice.id)
+        if payload is None:
+            payload = render_notice(notice)
+            self.notice_payloads.put(notice.id, payload)
+        return payload
+
     def broadcast_notice(self, notice: Notification, channel: SubscriberChannel = SubscriberChannel.AllChannel):
-        """Broadcast new notification to all user.
+        """Broadcast new notification to all user, through the delivery outbox.
 
         :param notice: New notification.
         """
         chat_id_list = self.sql_handler.get_chat_ids(channel)
-        logging.info(f'BotHelper: Broadcast to {len(chat_id_list)} subscribers, {channel}.')
-        for chat_id in chat_id_list:
-            send_notice(self.bot, chat_id, notice)
+        new_delivery_count = self.sql_handler.enqueue_deliveries(notice.id, chat_id_list)
+        logging.info(f'BotHelper: Broadcast to {new_delivery_count} / {len(chat_id_list)} new subscribers, {channel}.')
+        self.deliver_notice(notice)
+
+    def send_batch(
+            self,
+            chat_ids: Sequence[int],
+            payload: NoticePayload,
+            on_settled: Callable[[List[int], List[int]], None] = None) -> Tuple[List[int], List[int]]:
+        """Send `payload` to `chat_ids` in the bulk lane and wait for all of them,
+        giving up once no message settles for `DELIVERY_SEND_TIMEOUT` seconds.
+
+        :param on_settled: Defaults to None. Called in this thread with ids of chats sent to and ids of chats failed,
+            once the batch is settled or timed out. Messages settled after giving up are passed by `collect_timed_out`.
+        :type on_settled: Callable[[List[int], List[int]], None], optional.
+        :return: Ids of chats sent to, and ids of chats failed. Chats timed out are in neither.
+        :rtype: Tuple[List[int], List[int]].
+        """
+        settled_chats = queue.Queue()
+        for chat_id in chat_ids:
+            promise = send_payload(self.bot, chat_id, payload, lane=BOT_LANE_BULK)
+            if isinstance(promise, MessagePromise):
+                promise.add_done_callback(lambda settled_promise, chat_id=chat_id: settled_chats.put(
+                    (chat_id, settled_promise.exception is None and settled_promise.result() is not None)))
+            else:
+                settled_chats.put((chat_id, promise is not None))
+        sent_chat_ids, failed_chat_ids = [], []
+        for _ in chat_ids:
+            try:
+                chat_id, is_sent = settled_chats.get(timeout=DELIVERY_SEND_TIMEOUT)
+            except queue.Empty:
+                unsettled_chat_ids = set(chat_ids).difference(sent_chat_ids, failed_chat_ids)
+                logging.warning(f'BotHelper: Message `{payload.key}` timed out for {len(unsettled_chat_ids)} chats.')
+                if on_settled is not None:
+                    self.timed_out_batches.append(TimedOutBatch(payload.key, settled_chats, on_settled, unsettled_chat_ids))
+                break
+            (sent_chat_ids if is_sent else failed_chat_ids).append(chat_id)
+        if on_settled is not None:
+            on_settled(sent_chat_ids, failed_chat_ids)
+        return sent_chat_ids, failed_chat_ids
+
+    def collect_timed_out(self):
+        """Pass messages settled since their batch timed out to `on_settled` of `send_batch`, once per batch.
+        """
+        for timed_out_batch in list(self.timed_out_batches):
+            sent_chat_ids, failed_chat_ids = [], []
+            while timed_out_batch.unsettled_chat_ids:
+                try:
+                    chat_id, is_sent = timed_out_batch.settled_chats.get_nowait()
+                except queue.Empty:
+                    break
+                timed_out_batch.unsettled_chat_ids.discard(chat_id)
+                (sent_chat_ids if is_sent else failed_chat_ids).append(chat_id)
+            if sent_chat_ids or failed_chat_ids:
+                timed_out_batch.on_settled(sent_chat_ids, failed_chat_ids)
+            if not timed_out_batch.unsettled_chat_ids:
+                self.timed_out_batches.remove(timed_out_batch)
+
+    def get_unsettled_chat_ids(self, key: str) -> Set[int]:
+        """Chats of timed out messages with payload key `key` not yet settled, which must not be sent again.
+
+        :rtype: Set[int].
+        """
+        return set().union(*(
+            timed_out_batch.unsettled_chat_ids for timed_out_batch in self.timed_out_batches if timed_out_batch.key == key))
+
+    def deliver_notice(self, notice: Notification):
+        """Send `notice` to chats with pending deliveries batch by batch, marking deliveries of each batch once it settles,
+        so that deliveries stay pending until then and are resumed after a crash.
+
+        :param notice: The notification.
+        """
+        self.collect_timed_out()
+        start_time = time.monotonic()
+        payload = self.get_payload(notice)
+
+        def mark_deliveries(sent_chat_ids: List[int], failed_chat_ids: List[int]):
+            if sent_chat_ids:
+                self.sql_handler.mark_deliveries(notice.id, sent_chat_ids, DELIVERY_SENT)
+            if failed_chat_ids:
+                self.sql_handler.mark_deliveries(notice.id, failed_chat_ids, DELIVERY_FAILED)
+
+        unsettled_chat_ids = self.get_unsettled_chat_ids(payload.key)
+        sent_count, failed_count, last_chat_id = 0, 0, None
+        while True:
+            chat_ids = self.sql_handler.get_pending_deliveries(notice.id, after=last_chat_id)
+            if not chat_ids:
+                break
+            last_chat_id = chat_ids[-1]
+            chat_ids = [chat_id for chat_id in chat_ids if chat_id not in unsettled_chat_ids]
+            sent_chat_ids, failed_chat_ids = self.send_batch(chat_ids, payload, on_settled=mark_deliveries)
+            sent_count += len(sent_chat_ids)
+            failed_count += len(failed_chat_ids)
+            logging.info(
+                f'BotHelper: Notice `{notice.id}`: {sent_count} sent, {failed_count} failed, '
+                f'{(sent_count + failed_count) / (time.monotonic() - start_time):.1f} msg/s.')
+        delivery_progress = self.sql_handler.get_delivery_progress(notice.id)
+        logging.info(
+            f"BotHelper: Notice `{notice.id}` delivered in {time.monotonic() - start_time:.1f}s: "
+            f"{delivery_progress.get(DELIVERY_SENT, 0)} sent, {delivery_progress.get(DELIVERY_FAILED, 0)} failed, "
+            f"{delivery_progress.get(DELIVERY_PENDING, 0)} pending.")
+
+    def resume_deliveries(self):
+        """Deliver notices left pending, e.g. by a restart during a broadcast or by messages timed out, run every cycle.
+        Deliveries of a notice still pending after `DELIVERY_RESUME_ATTEMPTS` resumes by this process are marked failed.
+        """
+        self.collect_timed_out()
+        for notice_id in self.sql_handler.get_pending_notice_ids():
+            resume_count = self.delivery_resume_counts.get(notice_id, 0)
+            if resume_count >= DELIVERY_RESUME_ATTEMPTS:
+                failed_count = self.sql_handler.fail_pending_deliveries(notice_id)
+                logging.error(f'BotHelper: {failed_count} deliveries of notice `{notice_id}` failed after {resume_count} resumes.')
+                self.delivery_resume_counts.pop(notice_id)
+                continue
+            self.delivery_resume_counts[notice_id] = resume_count + 1
+            notice = self.sql_handler.get_notice(notice_id)
+            if notice is not None:
+                logging.warning(f'BotHelper: Resume delivery of notice `{notice_id}` ({resume_count + 1} / {DELIVERY_RESUME_ATTEMPTS}).')
+                self.deliver_notice(notice)
+
+    def broadcast_digests(self, now: datetime = None):
+        """Send the digest of each mode whose window closed at least `DIGEST_DELAY` seconds ago,
+        rendered once and shared by all its subscribers.
+
+        The first call only remembers the latest closed window, so that no digest is sent twice after a restart.
+
+        :param now: Defaults to None. Current time, `datetime.now()` if not specified.
+        :type now: datetime, optional.
+        """
+        due_time = (now or datetime.now()) - timedelta(seconds=DIGEST_DELAY)
+        for digest in DIGEST_INTERVALS:
+            end, _ = get_digest_window(digest, due_time)
+            last_end = self.digest_window_ends.get(digest)
+            self.digest_window_ends[digest] = end
+            if last_end is None or last_end >= end:
+                continue
+            start = end - timedelta(seconds=DIGEST_INTERVALS[digest])
+            if last_end < start:
+                logging.warning(f'BotHelper: {digest.capitalize()} digests from `{last_end}` to `{start}` skipped.')
+            notices = self.sql_handler.get_notices_between(start, end)
+            chat_ids = self.sql_handler.get_digest_chat_ids(digest)
+            if not notices or not chat_ids:
+                logging.info(f'BotHelper: Skip {digest} digest of `{start}`, {len(notices)} notices, {len(chat_ids)} chats.')
+                continue
+            payload = render_digest(digest, start, notices)
+            start_time = time.monotonic()
+            sent_count, failed_count = 0, 0
+            for index in range(0, len(chat_ids), DELIVERY_BATCH_SIZE):
+                sent_chat_ids, failed_chat_ids = self.send_batch(chat_ids[index:index + DELIVERY_BATCH_SIZE], payload)
+                sent_count += len(sent_chat_ids)
+                failed_count += len(failed_chat_ids)
+            logging.info(
+                f'BotHelper: {digest.capitalize()} digest `{payload.key}` of {len(notices)} notices '
+                f'sent in {time.monotonic() - start_time:.1f}s: {sent_count} sent, {failed_count} failed.')
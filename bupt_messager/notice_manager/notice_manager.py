@@ -13,6 +13,7 @@ from ..config import NOTICE_DOWNLOAD_INTERVAL, NOTICE_DB_SUMMARY_LENGTH, NOTICE_
 from ..config import STATUS_ERROR_DOWNLOAD, STATUS_SYNCED, PAGE_COUNTER_PER_UPDATE, NOTICE_MESSAGE_SUMMARY_LENGTH
 from ..mess import fun_logger
 from ..models import Notification, SubscriberChannel
+from ..read_models import NoticeSnapshot
 from ..sql_handler import SQLHandler
 from .bot_helper import BotHelper
 from .http_client import HTTPClient
@@ -69,10 +70,12 @@ class NoticeManager(threading.Thread):
             logging.info(f'NoticeManager: Updating. ({update_counter} / {BROADCAST_CYCLE})')
             self.http_client.refresh_session()
             try:
+                self.bot_helper.resume_deliveries()
                 notice_dict_list = self._doanload_notice()
                 notice_items = self.update(notice_dict_list)
                 for notice in notice_items:
                     self.bot_helper.broadcast_notice(notice, SubscriberChannel.InsiderChannel)
+                self.bot_helper.broadcast_digests()
                 if update_counter >= BROADCAST_CYCLE:
                     update_counter = 0
                     for new_notice in self.sql_handler.get_unpushed_notices():
@@ -81,6 +84,8 @@ class NoticeManager(threading.Thread):
                         else:
                             logging.warning(f'Invalid notice `{new_notice}`.')
                         self.sql_handler.mark_pushed(new_notice.id)
+                    self.sql_handler.prune_status()
+                    self.sql_handler.prune_deliveries()
                 logging.info(f'NoticeManager: Sleep for {NOTICE_CHECK_INTERVAL} seconds.')
             except KeyboardInterrupt as identifier:
                 logging.warning('NoticeManager: Catch KeyboardInterrupt when logging in.')
@@ -88,7 +93,7 @@ class NoticeManager(threading.Thread):
             except Exception as identifier:
                 logging.exception(identifier)
                 logging.error(f'NoticeManager: Error occured when updating: {identifier}')
-                self.bot.send_error_report()
+                self.bot.send_error_report(identifier)
                 logging.info(f'NoticeManager: Sleep for {NOTICE_UPDATE_ERROR_SLEEP_TIME} seconds.')
                 if self._stop_event.wait(NOTICE_UPDATE_ERROR_SLEEP_TIME):
                     break
@@ -106,15 +111,14 @@ class NoticeManager(threading.Thread):
         logging.info('NoticeManager: Set stop signal.')
 
     @change_status(ok_status=STATUS_SYNCED)
-    def update(self, notice_dict_list) -> List[Notification]:
+    def update(self, notice_dict_list) -> List[NoticeSnapshot]:
         """Fetch new notice.
 
         :return: Amount of new notice.
         :rtype: int.
         """
-        notice_items = []
-        for notice_dict in notice_dict_list:
-            notice_items.append(self.sql_handler.insert_notice(notice_dict))
+        notice_items = self.sql_handler.insert_notices(notice_dict_list)
+        self.bot_helper.prepare_notices(notice_items)
         logging.info(f'{len(notice_items)} notifications inserted.')
         return notice_items
 
@@ -193,9 +197,12 @@ class NoticeManager(threading.Thread):
         for page_index in range(PAGE_COUNTER_PER_UPDATE):
             notice_raw_list = self.download_notice_list_page(page_index + 1)
             logging.info(f'{len(notice_raw_list)} notice detected.')
-            for notice_raw in notice_raw_list:
-                notice_dict = self.prase_notice(notice_raw)
-                if self.sql_handler.is_new_notice(notice_dict['id']):
+            notice_dicts = [self.prase_notice(notice_raw) for notice_raw in notice_raw_list]
+            new_notice_ids = set(self.sql_handler.filter_new_notice_ids([notice_dict['id'] for notice_dict in notice_dicts]))
+            new_notice_ids.difference_update(notice_dict['id'] for notice_dict in notice_list)
+            for notice_dict in notice_dicts:
+                if notice_dict['id'] in new_notice_ids:
+                    new_notice_ids.discard(notice_dict['id'])
                     logging.info(f"NoticeManager: Waiting for attachment of `{notice_dict['title']}`@`{notice_dict['id']}`.")
                     time.sleep(NOTICE_DOWNLOAD_INTERVAL)
                     notice_dict['attachments'] = self.get_attachments(notice_dict)
@@ -217,5 +224,6 @@ def create_notice_manager(sql_manager, bot):
     :rtype: NoticeManager.
     """
     sql_handler = SQLHandler(sql_manager)
+    sql_handler.warm_up()
     notice_manager = NoticeManager(sql_handler=sql_handler, bot=bot)
     return notice_manager
@@ -1,25 +1,29 @@
 """Telegram bot with message queue."""
 import logging
-import traceback
-from typing import Callable
+import sys
+from typing import Callable, Dict, Tuple
 import telegram.bot
 from telegram import ParseMode
-from telegram.ext import messagequeue
-from .config import BOT_ADMIN_IDS, BOT_ALL_BURST_LIMIT, BOT_GROUP_BURST_LIMIT, BOT_TOKEN, PROXY_URL
+from telegram.error import RetryAfter
+from .config import BOT_ADMIN_IDS, BOT_CONNECTION_POOL_SIZE, BOT_LANE_ADMIN, BOT_LANE_INTERACTIVE, BOT_TOKEN, PROXY_URL
+from .error_reporter import ErrorReporter
+from .message_scheduler import MessageScheduler
 
 
 class QueuedBot(telegram.bot.Bot):
     """A bot which delegates send method handling to message queues.
 
     :member _is_messages_queued_default: Whether messages are queued by default.
-    :member _msg_queue: Queue for messages.
-    :type _msg_queue: MessageQueue.
+    :member _msg_queue: Scheduler for messages.
+    :type _msg_queue: MessageScheduler.
+    :member error_reporter: Aggregator of error reports to admins.
+    :type error_reporter: ErrorReporter.
     """
     def __init__(self, msg_queue, *args, is_queued_def=True, error_handle: Callable = None, **kwargs):
         """Initialize bot and attach `msg_queue` to bot.
 
-        :param msg_queue: Queue for messages.
-        :type msg_queue: MessageQueue.
+        :param msg_queue: Scheduler for messages.
+        :type msg_queue: MessageScheduler.
         :param *args: Arguments to initialize bot.
         :type *args: list.
         :param **kwargs: keyword arguments.
@@ -31,6 +35,8 @@ class QueuedBot(telegram.bot.Bot):
         self._is_messages_queued_default = is_queued_def
         self._msg_queue = msg_queue
         self.error_handle = error_handle
+        self.error_reporter = ErrorReporter(self.send_admin_message)
+        self.error_reporter.start()
 
     def set_error_handle(self, error_handle: Callable):
         self.error_handle = error_handle
@@ -45,47 +51,93 @@ class QueuedBot(telegram.bot.Bot):
             logging.error('QueuedBot: Error occured when stopping message queue.')
             logging.exception(identifier)
 
-    @messagequeue.queuedmessage
-    def send_message(self, *args, **kwargs) -> telegram.Message:
-        """Send message by pushing messages to message queue,
-        and accept new `queued` and `isgroup` keyword arguments.
+    def send_message(self, *args, queued: bool = None, lane: str = BOT_LANE_INTERACTIVE, **kwargs):
+        """Send message by pushing messages to lane `lane` of the scheduler,
+        and accept new `queued` and `lane` keyword arguments.
+
+        :param queued: Defaults to None. Whether the message is queued, `_is_messages_queued_default` if None.
+        :type queued: bool, optional.
+        :param lane: Defaults to `BOT_LANE_INTERACTIVE`. Lane of the message.
+        :type lane: str, optional.
+        :return: Sent message, or a :obj:`Promise` if the message is queued.
+        """
+        if queued is None:
+            queued = self._is_messages_queued_default
+        if not queued:
+            return self._send_message(*args, **kwargs)
+        chat_id = kwargs['chat_id'] if 'chat_id' in kwargs.keys() else args[0]
+        return self._msg_queue.put(self._send_message, args, kwargs, chat_id=chat_id, lane=lane)
+
+    def _send_message(self, *args, **kwargs) -> telegram.Message:
+        """Send message, passing errors except `RetryAfter` to `error_handle`.
         """
         try:
             return super().send_message(*args, **kwargs)
+        except RetryAfter as identifier:
+            raise identifier
         except Exception as identifier:
             if self.error_handle is not None:
                 if 'chat_id' in kwargs.keys():
                     chat_id = kwargs['chat_id']
                 else:
                     chat_id = args[0]
-                self.error_handle(identifier, chat_id=chat_id)
+                self.error_handle(self, identifier, chat_id=chat_id)
             else:
                 raise identifier
 
-    def send_error_report(self):
-        """Send error report to all admins.
+    def send_admin_message(self, text: str):
+        """Send a Markdown text to all admins in the admin lane.
 
-        :param bot: Current bot.
-        :type bot: telegram.bot.
-        :param notice: Notification to be sent.
-        :param index: Index of the message to be sent.
+        :param text: Text to send.
+        :type text: str.
         """
-        error_text = f'```\n{traceback.format_exc()}```'
         for admin_chat_id in BOT_ADMIN_IDS:
             self.send_message(
                 chat_id=admin_chat_id,
-                text=error_text,
-                parse_mode=ParseMode.MARKDOWN)
+                text=text,
+                parse_mode=ParseMode.MARKDOWN,
+                lane=BOT_LANE_ADMIN)
+
+    def send_error_report(self, error: BaseException = None):
+        """Report an error to all admins through `error_reporter`,
+        which sends the first occurrence at once and coalesces repeats into summaries.
+
+        :param error: Defaults to None. The error, the one being handled if None.
+        :type error: BaseException, optional.
+        """
+        if error is None:
+            error = sys.exc_info()[1]
+        if error is not None:
+            self.error_reporter.report(error)
+
+    def get_queue_stats(self) -> dict:
+        """Get queue depth and wait time of each lane.
+
+        :rtype: dict.
+        """
+        return self._msg_queue.stats
+
+    def drain(self, timeout: float = None) -> bool:
+        """Wait until queued messages are sent, see `MessageScheduler.drain`.
+
+        :rtype: bool.
+        """
+        return self._msg_queue.drain(timeout)
 
     def stop(self):
-        """Stop the message queue."""
+        """Stop the error reporter and the message queue."""
+        self.error_reporter.stop()
         self._msg_queue.stop()
 
 
-def create_queued_bot():
+def create_queued_bot(lanes: Dict[str, Tuple[float, float, float]] = None):
     """Factorial function to create queued bot.
+
+    :param lanes: Defaults to None. `(weight, rate, burst)` of each lane, `BOT_MESSAGE_LANES` if None.
+    :type lanes: Dict[str, Tuple[float, float, float]], optional.
     """
-    msg_queue = messagequeue.MessageQueue(all_burst_limit=BOT_ALL_BURST_LIMIT, group_burst_limit=BOT_GROUP_BURST_LIMIT)
-    _my_request = telegram.utils.request.Request(proxy_url=PROXY_URL)
+    msg_queue = MessageScheduler(lanes=lanes)
+    msg_queue.start()
+    _my_request = telegram.utils.request.Request(proxy_url=PROXY_URL, con_pool_size=BOT_CONNECTION_POOL_SIZE)
     queued_bot = QueuedBot(msg_queue, token=BOT_TOKEN, request=_my_request)
     return queued_bot
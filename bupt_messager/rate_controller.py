@@ -0,0 +1,46 @@
+"""Adaptive rate of outgoing messages."""
+import logging
+from .config import BOT_RATE_DECREASE_FACTOR, BOT_RATE_DECREASE_INTERVAL, BOT_RATE_INCREASE, BOT_RATE_MIN
+
+
+class RateController(object):
+    """Adapt the global send rate by additive increase and multiplicative decrease (AIMD),
+    driven by successes and `RetryAfter` (HTTP 429) errors. Not thread-safe.
+
+    :member max_rate: Upper bound of the rate, in messages per second.
+    :type max_rate: float.
+    :member rate: Current rate, in messages per second.
+    :type rate: float.
+    :member retry_after_count: Amount of `RetryAfter` errors observed.
+    :type retry_after_count: int.
+    """
+    def __init__(
+            self,
+            max_rate: float,
+            min_rate: float = BOT_RATE_MIN,
+            increase: float = BOT_RATE_INCREASE,
+            decrease_factor: float = BOT_RATE_DECREASE_FACTOR,
+            decrease_interval: float = BOT_RATE_DECREASE_INTERVAL):
+        self.max_rate = max_rate
+        self.min_rate = min(min_rate, max_rate)
+        self.increase = increase
+        self.decrease_factor = decrease_factor
+        self.decrease_interval = decrease_interval
+        self.rate = max_rate
+        self.retry_after_count = 0
+        self._decrease_time = None
+
+    def on_success(self):
+        """Raise the rate by about `increase` messages per second, every second of sending without 429.
+        """
+        self.rate = min(self.max_rate, self.rate + self.increase / self.rate)
+
+    def on_retry_after(self, now: float):
+        """Cut the rate by `decrease_factor`, at most once every `decrease_interval`,
+        since errors of messages in flight arrive together.
+        """
+        self.retry_after_count += 1
+        if self._decrease_time is None or now - self._decrease_time >= self.decrease_interval:
+            self._decrease_time = now
+            self.rate = max(self.min_rate, self.rate * self.decrease_factor)
+            logging.warning(f'RateController: Rate limited by Telegram, reduce rate to {self.rate:.1f} msg/s.')
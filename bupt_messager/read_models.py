@@ -0,0 +1,101 @@
+"""Immutable read models detached from SQL sessions."""
+from datetime import datetime
+from typing import NamedTuple, Tuple
+from .config import NOTICE_MESSAGE_SUMMARY_LENGTH, STATUS_TEXT_DICT
+from .models import Attachment, Chat, Notification, Status
+
+
+class AttachmentSnapshot(NamedTuple):
+    """Snapshot of an :obj:`Attachment`.
+    """
+    name: str
+    url: str
+
+    @classmethod
+    def from_attachment(cls, attachment: Attachment) -> 'AttachmentSnapshot':
+        return cls(name=attachment.name, url=attachment.url)
+
+
+class ChatSnapshot(NamedTuple):
+    """Snapshot of a :obj:`Chat`.
+    """
+    id: int
+    is_insider: bool
+    digest: str = None
+
+    @classmethod
+    def from_chat(cls, chat: Chat) -> 'ChatSnapshot':
+        return cls(id=chat.id, is_insider=bool(chat.is_insider), digest=chat.digest)
+
+
+class NoticeListItem(NamedTuple):
+    """Columns of a :obj:`Notification` needed to list it.
+    """
+    id: str
+    title: str
+    url: str
+    time: datetime
+
+    @property
+    def datetime(self):
+        return self.time.strftime('%Y/%m/%d %H:%M:%S')
+
+
+class NoticeSnapshot(NamedTuple):
+    """Snapshot of a :obj:`Notification` with its attachments, to be sent as a message.
+    `summary` is cut to `NOTICE_MESSAGE_SUMMARY_LENGTH`, and `html` is left out.
+    """
+    id: str
+    author: str
+    title: str
+    url: str
+    summary: str
+    time: datetime
+    attachments: Tuple[AttachmentSnapshot, ...]
+
+    @property
+    def datetime(self):
+        return self.time.strftime('%Y/%m/%d %H:%M:%S')
+
+    @classmethod
+    def from_notification(cls, notice: Notification) -> 'NoticeSnapshot':
+        """Copy `notice`, whose attachments must be loaded.
+        """
+        return cls(
+            id=notice.id,
+            author=notice.author,
+            title=notice.title,
+            url=notice.url,
+            summary=notice.summary[:NOTICE_MESSAGE_SUMMARY_LENGTH],
+            time=notice.time,
+            attachments=tuple(AttachmentSnapshot.from_attachment(attachment) for attachment in notice.attachments))
+
+    @classmethod
+    def from_notice_dict(cls, notice_dict: dict) -> 'NoticeSnapshot':
+        """Copy a dict representing a new notice, with key `attachments`.
+        """
+        return cls(
+            id=notice_dict['id'],
+            author=notice_dict['author'],
+            title=notice_dict['title'],
+            url=notice_dict['url'],
+            summary=notice_dict['summary'][:NOTICE_MESSAGE_SUMMARY_LENGTH],
+            time=notice_dict['time'],
+            attachments=tuple(
+                AttachmentSnapshot(name=attachment_dict['name'], url=attachment_dict['url'])
+                for attachment_dict in notice_dict['attachments']))
+
+
+class StatusSnapshot(NamedTuple):
+    """Snapshot of a :obj:`Status`.
+    """
+    status: int
+    time: datetime
+
+    @property
+    def status_text(self) -> str:
+        return STATUS_TEXT_DICT[self.status]
+
+    @classmethod
+    def from_status(cls, status: Status) -> 'StatusSnapshot':
+        return cls(status=status.status, time=status.time)
@@ -0,0 +1,110 @@
+"""Inverted index for searching notices."""
+import logging
+import re
+import threading
+from array import array
+from datetime import datetime
+from typing import Dict, List, NamedTuple, Set
+from .read_models import NoticeListItem
+
+CJK_PATTERN = r'[\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff]'
+TOKEN_RUN_PATTERN = re.compile(f'({CJK_PATTERN}+)|([0-9a-z]+)')
+
+
+def tokenize(text: str, is_query: bool = False) -> Set[str]:
+    """Split `text` into tokens: lowercase words for latin letters and digits,
+    characters and character bigrams for Chinese.
+
+    :param text: Text to split.
+    :type text: str.
+    :param is_query: Defaults to False. Produce only bigrams for Chinese runs longer than one character.
+    :type is_query: bool, optional.
+    :rtype: Set[str].
+    """
+    tokens = set()
+    for cjk_run, word in TOKEN_RUN_PATTERN.findall(text.lower()):
+        if word:
+            tokens.add(word)
+        elif len(cjk_run) == 1 or not is_query:
+            tokens.update(cjk_run)
+        if len(cjk_run) > 1:
+            tokens.update(cjk_run[index:index + 2] for index in range(len(cjk_run) - 1))
+    return tokens
+
+
+class SearchDocument(NamedTuple):
+    """Indexed notice.
+    """
+    item: NoticeListItem
+    author: str
+
+
+class SearchIndex(object):
+    """In-memory inverted index over title, author and summary of notices.
+
+    Postings are compact arrays of document numbers, filled incrementally by `add`.
+
+    :member is_loaded: Whether all notices in the database are indexed.
+    :type is_loaded: bool.
+    """
+    def __init__(self):
+        self.is_loaded = False
+        self._lock = threading.Lock()
+        self._documents = [] # type: List[SearchDocument]
+        self._document_numbers = {} # type: Dict[str, int]
+        self._postings = {} # type: Dict[str, array]
+
+    def add(self, item: NoticeListItem, author: str, summary: str):
+        """Index a notice, ignored if already indexed.
+
+        :param item: The notice.
+        :type item: NoticeListItem.
+        :param author: Author of the notice.
+        :type author: str.
+        :param summary: Summary of the notice.
+        :type summary: str.
+        """
+        tokens = tokenize(f'{item.title}\n{author}\n{summary}')
+        with self._lock:
+            if item.id in self._document_numbers:
+                return
+            document_number = len(self._documents)
+            self._documents.append(SearchDocument(item=item, author=author or ''))
+            self._document_numbers[item.id] = document_number
+            for token in tokens:
+                self._postings.setdefault(token, array('I')).append(document_number)
+
+    def search(self, terms: str, since: datetime = None, author: str = None) -> List[NoticeListItem]:
+        """Find notices containing all tokens in `terms`, newest first.
+
+        :param terms: Search terms, all notices match if empty.
+        :type terms: str.
+        :param since: Defaults to None. Only notices released since this time match.
+        :type since: datetime, optional.
+        :param author: Defaults to None. Only notices whose author contains this text match.
+        :type author: str, optional.
+        :rtype: List[NoticeListItem].
+        """
+        tokens = tokenize(terms, is_query=True)
+        with self._lock:
+            if tokens:
+                postings = sorted((self._postings.get(token, ()) for token in tokens), key=len)
+                document_numbers = set(postings[0])
+                for posting in postings[1:]:
+                    if not document_numbers:
+                        break
+                    document_numbers.intersection_update(posting)
+                documents = [self._documents[document_number] for document_number in document_numbers]
+            else:
+                documents = list(self._documents)
+        if since is not None:
+            documents = [document for document in documents if document.item.time >= since]
+        if author:
+            author = author.lower()
+            documents = [document for document in documents if author in document.author.lower()]
+        documents.sort(key=lambda document: (document.item.time, document.item.id), reverse=True)
+        logging.debug(f'SearchIndex: {len(documents)} results for `{terms}`.')
+        return [document.item for document in documents]
+
+    def __len__(self):
+        return len(self._documents)
@@ -1,29 +1,135 @@
 """Handle SQL-related requests."""
 import functools
 import logging
+from collections import Counter, OrderedDict, deque
 from contextlib import contextmanager
-from datetime import datetime
-from typing import Callable, List, Union
-from sqlalchemy import create_engine, exists
-from sqlalchemy.orm import joinedload, relationship, scoped_session, sessionmaker
+from datetime import datetime, timedelta
+from typing import Callable, Dict, Iterable, List, Sequence, Set, Tuple, Union
+from sqlalchemy import and_, create_engine, event, exists, or_
+from sqlalchemy.engine import Engine
+from sqlalchemy.engine.url import make_url
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import relationship, scoped_session, sessionmaker, undefer
 from sqlalchemy.orm.session import Session
-from .config import SQLALCHEMY_DATABASE_URI
+from sqlalchemy.pool import StaticPool
+from sqlalchemy.sql import func as sql_func
+from .cache import LRUCache
+from .chat_writer import ChatWriter
+from .config import NOTICE_CACHE_SIZE, NOTICE_CACHE_TTL, NOTICE_MESSAGE_SUMMARY_LENGTH, SQLALCHEMY_DATABASE_URI
+from .config import SQL_POOL_MAX_OVERFLOW, SQL_POOL_PRE_PING, SQL_POOL_RECYCLE, SQL_POOL_SIZE, SQL_POOL_TIMEOUT
+from .config import DELIVERY_BATCH_SIZE, DELIVERY_FAILED, DELIVERY_PENDING, DELIVERY_RETENTION_DAYS
+from .config import NOTICE_HTML_CODEC, NOTICE_HTML_MIGRATION_BATCH_SIZE
+from .config import SEARCH_INDEX_BATCH_SIZE, SEARCH_INDEX_SUMMARY_LENGTH, SQLITE_BUSY_TIMEOUT, SQLITE_WAL_MODE
+from .config import STATUS_INSERT_ATTEMPTS, STATUS_RECENT_LENGTH, STATUS_RETENTION_DAYS, STATUS_ROLLUP_HOURLY_DAYS
+from .html_codec import HTML_CODEC_PLAIN, compress_html, get_html_codec, hash_html
 from .mess import fun_logger
-from .models import Attachment, Base, Chat, Notification, Status, SubscriberChannel
+from .models import Attachment, Base, Chat, Delivery, NoticeHtml, Notification, Status, StatusRollup, SubscriberChannel
+from .read_models import AttachmentSnapshot, ChatSnapshot, NoticeListItem, NoticeSnapshot, StatusSnapshot
+from .search_index import SearchIndex
+from .sql_metrics import SQLMetrics, TimedQueuePool
+from .subscriber_registry import SubscriberRegistry
+
+
+def create_sql_engine(database_uri: str, sql_metrics: SQLMetrics) -> Engine:
+    """Create an engine for MySQL or SQLite, selected by the scheme of `database_uri`.
+
+    SQLite databases share one connection if in memory (`sqlite://`), and use WAL mode
+    if `SQLITE_WAL_MODE` is set. Other databases use a pool configured by `SQL_POOL_*`.
+
+    :param database_uri: Database URI.
+    :type database_uri: str.
+    :param sql_metrics: Metrics to attach to the new engine.
+    :type sql_metrics: SQLMetrics.
+    :rtype: Engine.
+    """
+    database_url = make_url(database_uri)
+    if database_url.get_backend_name() == 'sqlite':
+        is_memory_database = database_url.database in (None, '', ':memory:')
+        engine = create_engine(
+            database_url,
+            poolclass=StaticPool if is_memory_database else TimedQueuePool,
+            connect_args={'check_same_thread': False, 'timeout': SQLITE_BUSY_TIMEOUT})
+
+        @event.listens_for(engine, 'connect')
+        def set_sqlite_pragma(dbapi_connection, connection_record):
+            cursor = dbapi_connection.cursor()
+            cursor.execute('PRAGMA foreign_keys=ON')
+            if SQLITE_WAL_MODE and not is_memory_database:
+                cursor.execute('PRAGMA journal_mode=WAL')
+                cursor.execute('PRAGMA synchronous=NORMAL')
+            cursor.close()
+
+        sql_metrics.capacity = 1 if is_memory_database else SQL_POOL_SIZE + SQL_POOL_MAX_OVERFLOW
+    else:
+        engine = create_engine(
+            database_url,
+            poolclass=TimedQueuePool,
+            pool_size=SQL_POOL_SIZE,
+            max_overflow=SQL_POOL_MAX_OVERFLOW,
+            pool_timeout=SQL_POOL_TIMEOUT,
+            pool_recycle=SQL_POOL_RECYCLE,
+            pool_pre_ping=SQL_POOL_PRE_PING)
+        sql_metrics.capacity = SQL_POOL_SIZE + SQL_POOL_MAX_OVERFLOW
+    if isinstance(engine.pool, TimedQueuePool):
+        engine.pool.metrics = sql_metrics
+    sql_metrics.attach(engine)
+    return engine
 
 
 class SQLManager(object):
     """Manager sessions.
 
+    :param database_uri: Defaults to None. Database URI, `SQLALCHEMY_DATABASE_URI` if not specified.
+    :type database_uri: str, optional.
+    :member engine: Database engine, see `create_sql_engine`.
+    :type engine: Engine.
+    :member sql_metrics: Pool and query metrics of :attr:`engine`.
+    :type sql_metrics: SQLMetrics.
     :member session_maker: Attached :obj: sessionmaker.
     :type session_maker: :obj:sessionmaker.
+    :member seen_notice_ids: IDs of notices known to be in the database, shared by all handlers.
+    :type seen_notice_ids: Set[str].
+    :member subscriber_registry: Chat ids of subscribers, shared by all handlers.
+    :type subscriber_registry: SubscriberRegistry.
+    :member notice_cache: :obj:`NoticeSnapshot`s by notice id, shared by all handlers.
+    :type notice_cache: LRUCache.
+    :member recent_status: Ring buffer of the latest :obj:`StatusSnapshot`s, shared by all handlers.
+    :type recent_status: deque.
+    :member search_index: Inverted index of notices, shared by all handlers.
+    :type search_index: SearchIndex.
+    :member chat_writer: Write-behind queue of changes to table `chat`, shared by all handlers.
+    :type chat_writer: ChatWriter.
+    :member notice_listeners: Functions called with new :obj:`NoticeSnapshot`s after each insert.
+    :type notice_listeners: List[Callable[[List[NoticeSnapshot]], None]].
     """
-    def __init__(self):
+    def __init__(self, database_uri: str = None):
         Notification.attachments = relationship("Attachment", order_by=Attachment.id, back_populates="notice")
-        engine = create_engine(SQLALCHEMY_DATABASE_URI)
-        Base.metadata.create_all(engine)
-        session_factory = sessionmaker(bind=engine)
+        self.sql_metrics = SQLMetrics()
+        self.engine = create_sql_engine(database_uri or SQLALCHEMY_DATABASE_URI, self.sql_metrics)
+        Base.metadata.create_all(self.engine)
+        session_factory = sessionmaker(bind=self.engine)
         self.session_maker = scoped_session(session_factory)
+        self.seen_notice_ids = set() # type: Set[str]
+        self.subscriber_registry = SubscriberRegistry()
+        self.notice_cache = LRUCache(NOTICE_CACHE_SIZE, NOTICE_CACHE_TTL)
+        self.recent_status = deque(maxlen=STATUS_RECENT_LENGTH)
+        self.search_index = SearchIndex()
+        self.chat_writer = ChatWriter(self)
+        self.chat_writer.start()
+        self.notice_listeners = [] # type: List[Callable[[List[NoticeSnapshot]], None]]
+
+    def add_notice_listener(self, listener: Callable[[List[NoticeSnapshot]], None]):
+        """Call `listener` with new notices after each insert, e.g. to refresh caches of rendered notices.
+
+        :param listener: Function taking a list of :obj:`NoticeSnapshot`s.
+        :type listener: Callable[[List[NoticeSnapshot]], None].
+        """
+        self.notice_listeners.append(listener)
+
+    def close(self):
+        """Write queued changes, run once before exit.
+        """
+        self.chat_writer.stop()
 
     @contextmanager
     def create_session(self):
@@ -40,6 +146,75 @@ class SQLManager(object):
             session.close()
             self.session_maker.remove()
 
+    def get_pool_stats(self) -> dict:
+        """Retrive pool status and metrics.
+
+        :rtype: dict.
+        """
+        pool_stats = self.sql_metrics.stats
+        pool_stats['status'] = self.engine.pool.status()
+        if isinstance(self.engine.pool, TimedQueuePool):
+            pool_stats['saturation'] = self.engine.pool.checkedout() / self.sql_metrics.capacity
+        return pool_stats
+
+
+def query_notice_snapshots(my_session: Session, *criterion) -> List[NoticeSnapshot]:
+    """Select :obj:`NoticeSnapshot`s and their attachments in one query,
+    loading only the first `NOTICE_MESSAGE_SUMMARY_LENGTH` characters of `summary`.
+
+    :param my_session: Current session.
+    :type my_session: Session.
+    :param criterion: Filters on :obj:`Notification`.
+    :return: Notices ordered by `(time, id)`.
+    :rtype: List[NoticeSnapshot].
+    """
+    notice_rows = OrderedDict()
+    for *notice_row, attachment_name, attachment_url in my_session.query(
+            Notification.id,
+            Notification.author,
+            Notification.title,
+            Notification.url,
+            sql_func.substr(Notification.summary, 1, NOTICE_MESSAGE_SUMMARY_LENGTH),
+            Notification.time,
+            Attachment.name,
+            Attachment.url
+    ).outerjoin(Attachment, Attachment.notice_id == Notification.id).filter(*criterion).order_by(
+            Notification.time, Notification.id, Attachment.id):
+        attachments = notice_rows.setdefault(tuple(notice_row), [])
+        if attachment_name is not None:
+            attachments.append(AttachmentSnapshot(name=attachment_name, url=attachment_url))
+    return [NoticeSnapshot(*notice_row, tuple(attachments)) for notice_row, attachments in notice_rows.items()]
+
+
+def store_compressed_html(my_session: Session, notices: List[Notification], codec: str) -> int:
+    """Move HTML of `notices` into table `notice_html`, compressed and deduplicated by content hash.
+
+    :param my_session: Current session.
+    :type my_session: Session.
+    :param notices: Notices with inline HTML loaded.
+    :type notices: List[Notification].
+    :param codec: Compression codec, `zlib` or `zstd`.
+    :type codec: str.
+    :return: Amount of new rows in table `notice_html`.
+    :rtype: int.
+    """
+    compressed_htmls = {}
+    for notice in notices:
+        if not notice.inline_html:
+            continue
+        html_hash = hash_html(notice.inline_html)
+        if html_hash not in compressed_htmls:
+            compressed_htmls[html_hash] = compress_html(notice.inline_html, codec)
+        notice.html_hash = html_hash
+        notice.inline_html = ''
+    existing_hashes = {
+        html_hash for html_hash, in my_session.query(NoticeHtml.hash).filter(NoticeHtml.hash.in_(compressed_htmls))
+    } if compressed_htmls else set()
+    my_session.add_all(
+        NoticeHtml(hash=html_hash, codec=codec, data=data)
+        for html_hash, data in compressed_htmls.items() if html_hash not in existing_hashes)
+    return len(compressed_htmls) - len(existing_hashes)
+
 
 def load_session(func: Callable):
     """Load new session and add session as the first argument of `func`.
@@ -58,9 +233,13 @@ def load_session(func: Callable):
 
 class SQLHandler(object):
     """Handler for SQL requests.
+
+    :member html_codec: Codec to store HTML of new notices, `plain` to store it inline.
+    :type html_codec: str.
     """
     def __init__(self, sql_manager=None):
         self.sql_manager = sql_manager
+        self.html_codec = get_html_codec(NOTICE_HTML_CODEC)
 
     def init_sql_manager(self, sql_manager=None):
         """Initialize SQLHandler with `sql_manager`.
@@ -74,166 +253,604 @@ class SQLHandler(object):
             logging.warning('SQLHandler: No `sql_manager` specified, another `scoped_session` will be opened.')
             self.sql_manager = SQLManager()
 
-    @load_session
-    def is_new_notice(my_session: Session, notice_id: int):
+    def warm_seen_notice_ids(self):
+        """Load all notice ids into the in-memory seen-id index.
+        """
+        with self.sql_manager.create_session() as my_session:
+            notice_ids = {notice_id for notice_id, in my_session.query(Notification.id)}
+        self.sql_manager.seen_notice_ids.update(notice_ids)
+        logging.info(f'SQLHandler: {len(notice_ids)} notice ids loaded.')
+
+    def filter_new_notice_ids(self, notice_ids: Iterable[str]) -> List[str]:
+        """Select ids not existing in the database, with at most one query.
+
+        :param notice_ids: IDs of listed notices.
+        :type notice_ids: Iterable[str].
+        :return: New ids, in the order of `notice_ids`.
+        :rtype: List[str].
+        """
+        seen_notice_ids = self.sql_manager.seen_notice_ids
+        unknown_ids = [notice_id for notice_id in notice_ids if notice_id not in seen_notice_ids]
+        if not unknown_ids:
+            return []
+        with self.sql_manager.create_session() as my_session:
+            existing_ids = {
+                notice_id for notice_id,
+                in my_session.query(Notification.id).filter(Notification.id.in_(set(unknown_ids)))
+            }
+        seen_notice_ids.update(existing_ids)
+        return [notice_id for notice_id in unknown_ids if notice_id not in existing_ids]
+
+    def is_new_notice(self, notice_id: str) -> bool:
         """Check whether `notice_id` exists.
 
-        :param my_session: Current session.
-        :type my_session: Session.
         :param notice_id: New notice id.
-        :type notice_id: int.
+        :type notice_id: str.
         """
-        return not my_session.query(exists().where(Notification.id==notice_id)).scalar()
+        return bool(self.filter_new_notice_ids([notice_id]))
 
-    @load_session
     @fun_logger(log_fun=logging.debug)
-    def insert_notice(my_session: Session, notice_dict: dict):
+    def insert_notices(self, notice_dicts: List[dict]) -> List[NoticeSnapshot]:
+        """Insert new notices and their attachments in one transaction, and cache them.
+
+        :param notice_dicts: Dicts representing new notices, with key `attachments`.
+        :type notice_dicts: List[dict].
+        :return: Inserted notices, in the order of `notice_dicts`.
+        :rtype: List[NoticeSnapshot].
+        """
+        if not notice_dicts:
+            return []
+        new_notices = []
+        for notice_dict in notice_dicts:
+            notice_dict = dict(notice_dict)
+            attachment_list = [Attachment(**attachment_dict) for attachment_dict in notice_dict.pop('attachments')]
+            new_notice = Notification(**notice_dict)
+            new_notice.attachments = attachment_list
+            logging.info(f'SQLHandler: Adding notice `{new_notice.title}` with {len(attachment_list)} attachments.')
+            new_notices.append(new_notice)
+        with self.sql_manager.create_session() as my_session:
+            if self.html_codec != HTML_CODEC_PLAIN:
+                store_compressed_html(my_session, new_notices, self.html_codec)
+            my_session.add_all(new_notices)
+            my_session.commit()
+        inserted_notices = [NoticeSnapshot.from_notice_dict(notice_dict) for notice_dict in notice_dicts]
+        for notice, notice_dict in zip(inserted_notices, notice_dicts):
+            self.sql_manager.seen_notice_ids.add(notice.id)
+            self.sql_manager.notice_cache.put(notice.id, notice)
+            self.sql_manager.search_index.add(
+                NoticeListItem(id=notice.id, title=notice.title, url=notice.url, time=notice.time),
+                notice.author,
+                notice_dict['summary'][:SEARCH_INDEX_SUMMARY_LENGTH])
+        for listener in self.sql_manager.notice_listeners:
+            try:
+                listener(inserted_notices)
+            except Exception as identifier:
+                logging.exception(identifier)
+        return inserted_notices
+
+    def compress_notice_html(self, codec: str = None, batch_size: int = NOTICE_HTML_MIGRATION_BATCH_SIZE) -> int:
+        """Move inline HTML of existing notices into table `notice_html`, batch by batch.
+
+        :param codec: Defaults to None. Compression codec, `NOTICE_HTML_CODEC` if not specified.
+        :type codec: str, optional.
+        :param batch_size: Defaults to `NOTICE_HTML_MIGRATION_BATCH_SIZE`. Amount of notices per transaction.
+        :type batch_size: int, optional.
+        :return: Amount of notices compressed.
+        :rtype: int.
+        """
+        codec = get_html_codec(codec or self.html_codec)
+        if codec == HTML_CODEC_PLAIN:
+            raise ValueError('SQLHandler: Cannot compress HTML with codec `plain`.')
+        compressed_count, last_notice_id = 0, ''
+        while True:
+            with self.sql_manager.create_session() as my_session:
+                notices = my_session.query(Notification).options(undefer('inline_html')).filter(
+                    Notification.html_hash.is_(None), Notification.id > last_notice_id).order_by(
+                    Notification.id).limit(batch_size).all()
+                if not notices:
+                    break
+                last_notice_id = notices[-1].id
+                store_compressed_html(my_session, notices, codec)
+                compressed_count += sum(notice.html_hash is not None for notice in notices)
+                my_session.commit()
+            logging.info(f'SQLHandler: {compressed_count} notices compressed, up to `{last_notice_id}`.')
+        return compressed_count
+
+    def insert_notice(self, notice_dict: dict) -> NoticeSnapshot:
         """Insert new notice to SQL.
 
-        :param my_session: Cureent session.
-        :type my_session: Session.
         :param notice_dict: Dict representing new notice.
         :type notice_dict: dict.
         """
-        attachment_list = [Attachment(**attachment_dict) for attachment_dict in notice_dict.pop('attachments')]
-        new_notice = Notification(**notice_dict)
-        new_notice.attachments = attachment_list
-        logging.info(f'SQLHandler: Adding notice `{new_notice.title}` with {len(attachment_list)} attachments.')
-        my_session.add(new_notice)
-        my_session.commit()
-        return my_session.query(Notification).options(joinedload('attachments')).filter(Notification.id == notice_dict['id']).one_or_none()
+        return self.insert_notices([notice_dict])[0]
 
-    @load_session
     @fun_logger(log_fun=logging.debug)
-    def get_notice(my_session: Session, notice_id: str) -> Union[Notification, None]:
-        """Retrive one notice.
+    def get_notice(self, notice_id: str) -> Union[NoticeSnapshot, None]:
+        """Retrive one notice, read through :attr:`SQLManager.notice_cache`.
 
-        :param my_session: Cureent session.
-        :type my_session: Session.
         :param notice_id: ID of the notice_id.
         :type notice_id: str.
         :return: The notice.
-        :rtype: Notification or None.
+        :rtype: NoticeSnapshot or None.
+        """
+        notice = self.sql_manager.notice_cache.get(notice_id)
+        if notice is None:
+            with self.sql_manager.create_session() as my_session:
+                notices = query_notice_snapshots(my_session, Notification.id == notice_id)
+            if not notices:
+                return None
+            notice = notices[0]
+            self.sql_manager.notice_cache.put(notice_id, notice)
+        return notice
+
+    def get_notices(self, notice_ids: List[str]) -> List[NoticeSnapshot]:
+        """Retrive notices in one query, read through :attr:`SQLManager.notice_cache`.
+
+        :param notice_ids: IDs of the notices.
+        :type notice_ids: List[str].
+        :return: Notices found, in the order of `notice_ids`.
+        :rtype: List[NoticeSnapshot].
+        """
+        notices = {notice_id: self.sql_manager.notice_cache.get(notice_id) for notice_id in notice_ids}
+        missing_ids = [notice_id for notice_id, notice in notices.items() if notice is None]
+        if missing_ids:
+            with self.sql_manager.create_session() as my_session:
+                for notice in query_notice_snapshots(my_session, Notification.id.in_(missing_ids)):
+                    notices[notice.id] = notice
+                    self.sql_manager.notice_cache.put(notice.id, notice)
+        return [notices[notice_id] for notice_id in notice_ids if notices[notice_id] is not None]
+
+    def get_cache_stats(self) -> Dict[str, Dict[str, int]]:
+        """Retrive size and hit/miss counters of shared caches.
+
+        :rtype: Dict[str, Dict[str, int]].
         """
-        return my_session.query(Notification).options(joinedload('attachments')).filter(Notification.id == notice_id).one_or_none()
+        return {'notice': self.sql_manager.notice_cache.stats}
 
     @load_session
     @fun_logger(log_fun=logging.debug)
-    def get_latest_notices(my_session: Session, length: int, start: int = 0) -> List:
-        """Retrive noticess with most recent `date`s.
+    def get_latest_notices(
+            my_session: Session,
+            length: int,
+            cursor: Tuple[datetime, str] = None,
+            is_newer: bool = False) -> List[NoticeListItem]:
+        """Retrive noticess with most recent `date`s, paginated by keyset `(time, id)`.
 
         :param my_session: Cureent session.
         :type my_session: Session.
         :param length: Amont of the notices retrived.
         :type length: int.
-        :param start: Count from the notice at index `start`, defaults to `0`
-        :type start: int.
-        :return: List of :obj:`Notice`s.
-        :rtype: list.
+        :param cursor: Defaults to None. `(time, id)` of the last notice on the previous page,
+            only notices older than it are retrived.
+        :type cursor: Tuple[datetime, str], optional.
+        :param is_newer: Defaults to False. Retrive the `length` notices newer than `cursor` instead,
+            i.e. `cursor` is the first notice on the next page.
+        :type is_newer: bool, optional.
+        :return: List of :obj:`NoticeListItem`s, newest first.
+        :rtype: List[NoticeListItem].
         """
-        return my_session.query(Notification).options(joinedload('attachments')).order_by(Notification.time.desc()).all()[start:][:length]
+        notice_query = my_session.query(Notification.id, Notification.title, Notification.url, Notification.time)
+        if cursor is not None:
+            cursor_time, cursor_id = cursor
+            if is_newer:
+                notice_query = notice_query.filter(or_(
+                    Notification.time > cursor_time,
+                    and_(Notification.time == cursor_time, Notification.id > cursor_id)))
+            else:
+                notice_query = notice_query.filter(or_(
+                    Notification.time < cursor_time,
+                    and_(Notification.time == cursor_time, Notification.id < cursor_id)))
+        if cursor is not None and is_newer:
+            return [
+                NoticeListItem._make(notice_row) for notice_row in reversed(
+                    notice_query.order_by(Notification.time, Notification.id).limit(length).all())
+            ]
+        return [
+            NoticeListItem._make(notice_row) for notice_row in
+            notice_query.order_by(Notification.time.desc(), Notification.id.desc()).limit(length)
+        ]
 
     @load_session
-    def get_chat_ids(my_session: Session, channel: SubscriberChannel = SubscriberChannel.AllChannel) -> List[int]:
-        """Retrive all chat ids.
+    def get_notices_between(my_session: Session, start: datetime, end: datetime) -> List[NoticeListItem]:
+        """Retrive notices released in `[start, end)`, oldest first.
+
+        :rtype: List[NoticeListItem].
+        """
+        return [NoticeListItem._make(row) for row in my_session.query(
+            Notification.id, Notification.title, Notification.url, Notification.time).filter(
+                Notification.time >= start, Notification.time < end).order_by(Notification.time, Notification.id)]
+
+    def warm_search_index(self):
+        """Index all notices in the database.
+        """
+        search_index = self.sql_manager.search_index
+        with self.sql_manager.create_session() as my_session:
+            for *notice_row, author, summary in my_session.query(
+                    Notification.id,
+                    Notification.title,
+                    Notification.url,
+                    Notification.time,
+                    Notification.author,
+                    sql_func.substr(Notification.summary, 1, SEARCH_INDEX_SUMMARY_LENGTH)
+            ).yield_per(SEARCH_INDEX_BATCH_SIZE):
+                search_index.add(NoticeListItem._make(notice_row), author, summary or '')
+        search_index.is_loaded = True
+        logging.info(f'SQLHandler: {len(search_index)} notices indexed.')
+
+    def search_notices(self, terms: str, since: datetime = None, author: str = None) -> List[NoticeListItem]:
+        """Search notices by title, author and summary, newest first, see `SearchIndex.search`.
+
+        :rtype: List[NoticeListItem].
+        """
+        if not self.sql_manager.search_index.is_loaded:
+            self.warm_search_index()
+        return self.sql_manager.search_index.search(terms, since=since, author=author)
+
+    def reload_subscribers(self):
+        """Reload the subscriber registry from table `chat`, with changes not yet written.
+        """
+        registry = self.sql_manager.subscriber_registry
+        generation = registry.generation
+        changes = self.sql_manager.chat_writer.get_changes()
+        with self.sql_manager.create_session() as my_session:
+            chats = my_session.query(Chat.id, Chat.is_insider, Chat.digest).all()
+        registry.load(chats, generation, changes)
+
+    def get_chat_ids(self, channel: SubscriberChannel = SubscriberChannel.AllChannel) -> Sequence[int]:
+        """Retrive all chat ids from the subscriber registry, reload it if stale.
 
-        :param my_session: Current session.
-        :type my_session: Session.
         :param channel: User channel.
         :type channel: SubscriberChannel, `all`(default), `normal`, `insider`.
-        :return: List of `id`s.
-        :rtype: List[int].
+        :return: Sorted `id`s.
+        :rtype: Sequence[int].
         """
-        if channel == SubscriberChannel.NormalChannel:
-            return [chat.id for chat in my_session.query(Chat).filter(Chat.is_insider==False).all()]
-        elif channel == SubscriberChannel.InsiderChannel:
-            return [chat.id for chat in my_session.query(Chat).filter(Chat.is_insider==True).all()]
-        else:
-            return [chat.id for chat in my_session.query(Chat).all()]
+        if self.sql_manager.subscriber_registry.is_stale:
+            self.reload_subscribers()
+        return self.sql_manager.subscriber_registry.get_chat_ids(channel)
+
+    def get_digest_chat_ids(self, digest: str) -> Sequence[int]:
+        """Retrive ids of chats subscribing digest `digest` from the subscriber registry, reload it if stale.
+
+        :param digest: Digest mode, a key of `DIGEST_INTERVALS`.
+        :type digest: str.
+        :return: Sorted `id`s.
+        :rtype: Sequence[int].
+        """
+        if self.sql_manager.subscriber_registry.is_stale:
+            self.reload_subscribers()
+        return self.sql_manager.subscriber_registry.get_digest_chat_ids(digest)
 
     @load_session
-    def insert_chat(my_session: Session, new_id: int) -> int:
-        """Insert chat id.
+    def get_chat_id_batch(my_session: Session, after: int = None, limit: int = DELIVERY_BATCH_SIZE) -> List[int]:
+        """Retrive chat ids from table `chat` batch by batch, ordered by chat id.
 
         :param my_session: Current session.
         :type my_session: Session.
-        :param new_id: Chat id.
-        :type new_id: int.
+        :param after: Defaults to None. Only chat ids greater than it are retrived.
+        :type after: int, optional.
+        :param limit: Defaults to `DELIVERY_BATCH_SIZE`. Maximum amount of chat ids.
+        :type limit: int, optional.
+        :rtype: List[int].
         """
-        if not my_session.query(exists().where(Chat.id==new_id)).scalar():
-            new_chat = Chat(id=new_id)
-            my_session.add(new_chat)
-            my_session.commit()
-            return new_id
-        return None
+        chat_query = my_session.query(Chat.id)
+        if after is not None:
+            chat_query = chat_query.filter(Chat.id > after)
+        return [chat_id for chat_id, in chat_query.order_by(Chat.id).limit(limit)]
 
     @load_session
-    def remove_chat(my_session: Session, old_id: int):
-        """Remove chat id.
+    def count_chats(my_session: Session, after: int = None) -> int:
+        """Count chats in table `chat`.
 
         :param my_session: Current session.
         :type my_session: Session.
+        :param after: Defaults to None. Only chat ids greater than it are counted.
+        :type after: int, optional.
+        :rtype: int.
+        """
+        chat_query = my_session.query(sql_func.count(Chat.id))
+        if after is not None:
+            chat_query = chat_query.filter(Chat.id > after)
+        return chat_query.scalar()
+
+    def get_chat(self, chat_id: int) -> Union[None, ChatSnapshot]:
+        """Retrive a chat, including changes not yet written.
+
+        :param chat_id: Chat id.
+        :type chat_id: int.
+        :return: The chat, or None if not found.
+        :rtype: Union[None, ChatSnapshot].
+        """
+        is_changed, chat = self.sql_manager.chat_writer.lookup(chat_id)
+        if is_changed:
+            return chat
+        with self.sql_manager.create_session() as my_session:
+            chat = my_session.query(Chat).filter(Chat.id == chat_id).one_or_none()
+            return None if chat is None else ChatSnapshot.from_chat(chat)
+
+    def _write_chat(self, chat_id: int, chat: Union[None, ChatSnapshot]):
+        """Queue a change of a chat, then update the subscriber registry.
+        """
+        self.sql_manager.chat_writer.put(chat_id, chat)
+        if chat is None:
+            self.sql_manager.subscriber_registry.remove(chat_id)
+        else:
+            self.sql_manager.subscriber_registry.add(chat_id, chat.is_insider, chat.digest)
+
+    def insert_chat(self, new_id: int) -> int:
+        """Insert chat id, written later by the chat writer.
+
+        :param new_id: Chat id.
+        :type new_id: int.
+        :return: `new_id`, or None if the chat exists.
+        :rtype: int.
+        """
+        if self.get_chat(new_id) is not None:
+            return None
+        self._write_chat(new_id, ChatSnapshot(id=new_id, is_insider=False))
+        return new_id
+
+    def remove_chat(self, old_id: int):
+        """Remove chat id, written later by the chat writer.
+
         :param old_id: Chat id.
         :type old_id: int.
         """
-        old_chat = my_session.query(Chat).filter(Chat.id == old_id).one_or_none()
-        if old_chat is None:
-            logging.warning(f"SQLHandler: Duplicate remove of chat `{old_id}`.")
-        else:
-            my_session.delete(old_chat)
+        self._write_chat(old_id, None)
+
+    def migrate_chat(self, old_id: int, new_id: int):
+        """Move a chat to a new id, e.g. when a group is upgraded, keeping its settings.
+
+        :param old_id: Old chat id.
+        :type old_id: int.
+        :param new_id: New chat id.
+        :type new_id: int.
+        """
+        old_chat = self.get_chat(old_id)
+        self._write_chat(old_id, None)
+        self._write_chat(new_id, ChatSnapshot(id=new_id, is_insider=False) if old_chat is None else old_chat._replace(id=new_id))
+
+    def insert_status(self, status_code: int) -> StatusSnapshot:
+        """Insert status, count it in its hourly rollup and remember it in the recent status buffer.
+        The rollup is incremented in place, or created if missing, retried as an increment if created concurrently.
+
+        :param status_code: Code representing current status.
+        :type status_code: int.
+        """
+        status_time = datetime.now().replace(microsecond=0)
+        bucket = status_time.replace(minute=0, second=0)
+        for attempt in range(STATUS_INSERT_ATTEMPTS):
+            with self.sql_manager.create_session() as my_session:
+                my_session.add(Status(status=status_code, time=status_time))
+                if not my_session.query(StatusRollup).filter(
+                        StatusRollup.bucket == bucket, StatusRollup.status == status_code).update(
+                            {StatusRollup.count: StatusRollup.count + 1}, synchronize_session=False):
+                    my_session.add(StatusRollup(bucket=bucket, status=status_code, count=1))
+                try:
+                    my_session.commit()
+                    break
+                except IntegrityError as identifier:
+                    my_session.rollback()
+                    if attempt + 1 == STATUS_INSERT_ATTEMPTS:
+                        raise identifier
+                    logging.warning(f'SQLHandler: Rollup of status `{status_code}` created concurrently, retry.')
+        new_status = StatusSnapshot(status=status_code, time=status_time)
+        self.sql_manager.recent_status.append(new_status)
+        return new_status
+
+    def get_recent_status(self, length: int) -> List[StatusSnapshot]:
+        """Retrive the latest `length` status from memory, at most `STATUS_RECENT_LENGTH`.
+
+        :rtype: List[StatusSnapshot].
+        """
+        recent_status = list(self.sql_manager.recent_status)
+        return recent_status[-length:] if length > 0 else []
+
+    def get_status_counts(self, start: datetime) -> Dict[int, int]:
+        """Count status by code from rollups, since the bucket containing `start`.
+
+        :param start: Start time, rounded down to the hour.
+        :type start: datetime.
+        :return: Amount of each status code.
+        :rtype: Dict[int, int].
+        """
+        bucket = start.replace(minute=0, second=0, microsecond=0)
+        with self.sql_manager.create_session() as my_session:
+            return {
+                status_code: int(status_count) for status_code, status_count in
+                my_session.query(StatusRollup.status, sql_func.sum(StatusRollup.count)).filter(
+                    StatusRollup.bucket >= bucket).group_by(StatusRollup.status)
+            }
+
+    def warm_recent_status(self):
+        """Fill the recent status buffer, and build rollups from table `status` if there are none.
+        """
+        with self.sql_manager.create_session() as my_session:
+            recent_status = my_session.query(Status).order_by(Status.time.desc()).limit(STATUS_RECENT_LENGTH).all()
+            self.sql_manager.recent_status.extendleft(StatusSnapshot.from_status(status) for status in recent_status)
+            if recent_status and not my_session.query(exists().where(StatusRollup.bucket.isnot(None))).scalar():
+                logging.warning('SQLHandler: Building status rollups from table `status`.')
+                rollup_counts = Counter(
+                    (status_time.replace(minute=0, second=0, microsecond=0), status_code)
+                    for status_code, status_time in my_session.query(Status.status, Status.time))
+                my_session.add_all(
+                    StatusRollup(bucket=bucket, status=status_code, count=status_count)
+                    for (bucket, status_code), status_count in rollup_counts.items())
+                my_session.commit()
+
+    def prune_status(self):
+        """Drop status logs older than `STATUS_RETENTION_DAYS` days,
+        and merge hourly rollups older than `STATUS_ROLLUP_HOURLY_DAYS` days into daily ones.
+
+        A daily rollup is kept in the bucket of midnight, so only rollups of other hours are merged,
+        each of them once.
+        """
+        today = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+        with self.sql_manager.create_session() as my_session:
+            pruned_count = my_session.query(Status).filter(
+                Status.time < today - timedelta(days=STATUS_RETENTION_DAYS)).delete(synchronize_session=False)
+            daily_counts = Counter()
+            for rollup in my_session.query(StatusRollup).filter(
+                    StatusRollup.bucket < today - timedelta(days=STATUS_ROLLUP_HOURLY_DAYS),
+                    sql_func.extract('hour', StatusRollup.bucket) != 0):
+                daily_counts[(rollup.bucket.replace(hour=0), rollup.status)] += rollup.count
+                my_session.delete(rollup)
+            my_session.flush()
+            for (bucket, status_code), status_count in daily_counts.items():
+                if not my_session.query(StatusRollup).filter(
+                        StatusRollup.bucket == bucket, StatusRollup.status == status_code).update(
+                            {StatusRollup.count: StatusRollup.count + status_count}, synchronize_session=False):
+                    my_session.add(StatusRollup(bucket=bucket, status=status_code, count=status_count))
             my_session.commit()
+        logging.info(f'SQLHandler: {pruned_count} status logs pruned, {len(daily_counts)} daily rollups merged.')
+
+    def warm_up(self):
+        """Load in-memory indexes and buffers shared by all handlers.
+        """
+        self.warm_seen_notice_ids()
+        self.warm_recent_status()
+        self.warm_search_index()
 
     @load_session
-    @fun_logger(log_fun=logging.debug)
-    def get_latest_status(my_session: Session, start: datetime, end: datetime = None) -> List[Status]:
-        """Retrive :obj:`Status` by time.
+    def get_unpushed_notices(my_session: Session) -> List[NoticeSnapshot]:
+        return query_notice_snapshots(my_session, Notification.is_pushed.is_(False))
+
+    @load_session
+    def mark_pushed(my_session: Session, notice_id: str):
+        if not my_session.query(Notification).filter(Notification.id == notice_id).update(
+                {Notification.is_pushed: True}, synchronize_session=False):
+            logging.warning(f"SQLHandler: Duplicate push of Notification `{notice_id}`.")
+        my_session.commit()
+
+    def enqueue_deliveries(self, notice_id: str, chat_ids: Iterable[int]) -> int:
+        """Add pending deliveries of a notice to the outbox, skipping chats already in it.
+
+        :param notice_id: ID of the notice.
+        :type notice_id: str.
+        :param chat_ids: Target chats.
+        :type chat_ids: Iterable[int].
+        :return: Amount of new deliveries.
+        :rtype: int.
+        """
+        with self.sql_manager.create_session() as my_session:
+            existing_chat_ids = {
+                chat_id for chat_id, in my_session.query(Delivery.chat_id).filter(Delivery.notice_id == notice_id)
+            }
+            delivery_time = datetime.now()
+            new_deliveries = [
+                {'notice_id': notice_id, 'chat_id': chat_id, 'state': DELIVERY_PENDING, 'time': delivery_time}
+                for chat_id in chat_ids if chat_id not in existing_chat_ids
+            ]
+            my_session.bulk_insert_mappings(Delivery, new_deliveries)
+            my_session.commit()
+        return len(new_deliveries)
+
+    @load_session
+    def get_pending_deliveries(my_session: Session, notice_id: str, after: int = None, limit: int = DELIVERY_BATCH_SIZE) -> List[int]:
+        """Retrive chat ids of pending deliveries of a notice, ordered by chat id.
 
         :param my_session: Current session.
         :type my_session: Session.
-        :param start: Start time of the list of :obj:`Status`s.
-        :type start: datetime.
-        :param end: Defaults to None. Start time of the list of :obj:`Status`s.
-        :type end: datetime.
-        :rtype: List[Status].
+        :param notice_id: ID of the notice.
+        :type notice_id: str.
+        :param after: Defaults to None. Only chat ids greater than it are retrived.
+        :type after: int, optional.
+        :param limit: Defaults to `DELIVERY_BATCH_SIZE`. Maximum amount of chat ids.
+        :type limit: int, optional.
+        :rtype: List[int].
         """
-        if end is None:
-            end = datetime.now()
-        return my_session.query(Status).filter(Status.time.between(start, end)).all()
+        delivery_query = my_session.query(Delivery.chat_id).filter(
+            Delivery.notice_id == notice_id, Delivery.state == DELIVERY_PENDING)
+        if after is not None:
+            delivery_query = delivery_query.filter(Delivery.chat_id > after)
+        return [chat_id for chat_id, in delivery_query.order_by(Delivery.chat_id).limit(limit)]
 
     @load_session
-    def insert_status(my_session: Session, status_code: int):
-        """Insert status.
+    def get_pending_notice_ids(my_session: Session) -> List[str]:
+        """Retrive ids of notices with pending deliveries.
+
+        :rtype: List[str].
+        """
+        return [
+            notice_id for notice_id,
+            in my_session.query(Delivery.notice_id).filter(Delivery.state == DELIVERY_PENDING).distinct()
+        ]
+
+    @load_session
+    def mark_deliveries(my_session: Session, notice_id: str, chat_ids: List[int], state: int):
+        """Set state of deliveries of a notice.
 
         :param my_session: Current session.
         :type my_session: Session.
-        :param status_code: Code representing current status.
-        :type status_code: int.
+        :param notice_id: ID of the notice.
+        :type notice_id: str.
+        :param chat_ids: Target chats.
+        :type chat_ids: List[int].
+        :param state: New state, `DELIVERY_SENT` or `DELIVERY_FAILED`.
+        :type state: int.
         """
-        new_status = Status(status=status_code)
-        my_session.add(new_status)
-        my_session.commit()
-        return new_status
+        if chat_ids:
+            my_session.query(Delivery).filter(Delivery.notice_id == notice_id, Delivery.chat_id.in_(chat_ids)).update(
+                {Delivery.state: state, Delivery.time: datetime.now()}, synchronize_session=False)
+            my_session.commit()
 
     @load_session
-    def get_unpushed_notices(my_session: Session) -> List[Notification]:
-        return my_session.query(Notification).options(joinedload('attachments')).filter(Notification.is_pushed.is_(False)).all()
+    def fail_pending_deliveries(my_session: Session, notice_id: str) -> int:
+        """Mark all pending deliveries of a notice failed.
+
+        :return: Amount of deliveries marked.
+        :rtype: int.
+        """
+        failed_count = my_session.query(Delivery).filter(
+            Delivery.notice_id == notice_id, Delivery.state == DELIVERY_PENDING).update(
+                {Delivery.state: DELIVERY_FAILED, Delivery.time: datetime.now()}, synchronize_session=False)
+        my_session.commit()
+        return failed_count
 
     @load_session
-    def mark_pushed(my_session: Session, notice_id: Notification):
-        old_notice = my_session.query(Notification).filter(Notification.id == notice_id).one_or_none()
-        if old_notice is None:
-            logging.warning(f"SQLHandler: Duplicate push of Notification `{old_notice}`.")
-        else:
-            old_notice.is_pushed = True
-            my_session.commit()
+    def get_delivery_progress(my_session: Session, notice_id: str) -> Dict[int, int]:
+        """Count deliveries of a notice by state.
+
+        :rtype: Dict[int, int].
+        """
+        return dict(
+            my_session.query(Delivery.state, sql_func.count(Delivery.chat_id)).filter(
+                Delivery.notice_id == notice_id).group_by(Delivery.state).all())
 
     @load_session
-    def toggle_insider(my_session: Session, chat_id: int) -> Union[None, bool]:
-        chat = my_session.query(Chat).filter(Chat.id == chat_id).one_or_none()
+    def prune_deliveries(my_session: Session):
+        """Drop finished deliveries older than `DELIVERY_RETENTION_DAYS` days.
+        """
+        pruned_count = my_session.query(Delivery).filter(
+            Delivery.state != DELIVERY_PENDING,
+            Delivery.time < datetime.now() - timedelta(days=DELIVERY_RETENTION_DAYS)).delete(synchronize_session=False)
+        my_session.commit()
+        logging.info(f'SQLHandler: {pruned_count} deliveries pruned.')
+
+    def toggle_insider(self, chat_id: int) -> Union[None, bool]:
+        """Toggle whether a chat is an insider, written later by the chat writer.
+
+        :return: New state, or None if the chat does not exist.
+        :rtype: Union[None, bool].
+        """
+        chat = self.get_chat(chat_id)
         if chat is None:
             logging.warning(f"SQLHandler: No such chat `{chat_id}`.")
             return None
-        else:
-            chat.is_insider = not chat.is_insider
-            my_session.commit()
-            return chat.is_insider
+        self._write_chat(chat_id, chat._replace(is_insider=not chat.is_insider))
+        return not chat.is_insider
+
+    def set_digest(self, chat_id: int, digest: str = None) -> Union[None, ChatSnapshot]:
+        """Subscribe a digest instead of each notice, written later by the chat writer.
+
+        :param digest: Defaults to None. Digest mode, a key of `DIGEST_INTERVALS`, None to receive each notice.
+        :type digest: str, optional.
+        :return: The updated chat, or None if the chat does not exist.
+        :rtype: Union[None, ChatSnapshot].
+        """
+        chat = self.get_chat(chat_id)
+        if chat is None:
+            logging.warning(f"SQLHandler: No such chat `{chat_id}`.")
+            return None
+        chat = chat._replace(digest=digest)
+        self._write_chat(chat_id, chat)
+        return chat
@@ -0,0 +1,118 @@
+"""Metrics of SQL connections and queries."""
+import logging
+import re
+import threading
+import time
+from typing import Dict
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.pool import QueuePool
+from .config import SQL_METRICS_MAX_STATEMENTS, SQL_METRICS_STATEMENT_LENGTH, SQL_SLOW_QUERY_TIME
+
+
+class SQLMetrics(object):
+    """Collect checkout wait time, pool saturation and per-statement latency.
+
+    :member capacity: Maximum amount of connections checked out at the same time.
+    :type capacity: int.
+    """
+    def __init__(self, capacity: int = 0):
+        self.capacity = capacity
+        self._lock = threading.Lock()
+        self._checkout_count = 0
+        self._checkout_wait_total = 0.0
+        self._checkout_wait_max = 0.0
+        self._checkedout_peak = 0
+        self._statements = {} # type: Dict[str, list]
+
+    def attach(self, engine: Engine):
+        """Listen to query events of `engine`.
+        """
+        event.listen(engine, 'before_cursor_execute', self._before_cursor_execute)
+        event.listen(engine, 'after_cursor_execute', self._after_cursor_execute)
+        event.listen(engine, 'handle_error', self._handle_error)
+
+    @staticmethod
+    def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('query_start_time', []).append(time.perf_counter())
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        self.record_query(statement, time.perf_counter() - conn.info['query_start_time'].pop())
+
+    @staticmethod
+    def _handle_error(exception_context):
+        if exception_context.connection is not None and exception_context.connection.info.get('query_start_time'):
+            exception_context.connection.info['query_start_time'].pop()
+
+    def record_checkout(self, wait_time: float, checkedout: int):
+        """Record a connection checkout.
+
+        :param wait_time: Seconds waited for the connection.
+        :type wait_time: float.
+        :param checkedout: Amount of connections checked out after this checkout.
+        :type checkedout: int.
+        """
+        with self._lock:
+            self._checkout_count += 1
+            self._checkout_wait_total += wait_time
+            self._checkout_wait_max = max(self._checkout_wait_max, wait_time)
+            self._checkedout_peak = max(self._checkedout_peak, checkedout)
+
+    def record_query(self, statement: str, elapsed_time: float):
+        """Record the latency of a statement, grouped by its leading text.
+        """
+        statement_key = re.sub(r'\s+', ' ', statement)[:SQL_METRICS_STATEMENT_LENGTH]
+        if elapsed_time > SQL_SLOW_QUERY_TIME:
+            logging.warning(f'SQLMetrics: Slow query ({elapsed_time:.3f}s): `{statement_key}`.')
+        with self._lock:
+            statement_stats = self._statements.get(statement_key)
+            if statement_stats is None:
+                if len(self._statements) >= SQL_METRICS_MAX_STATEMENTS:
+                    statement_key = 'OTHER'
+                    statement_stats = self._statements.setdefault(statement_key, [0, 0.0, 0.0])
+                else:
+                    statement_stats = self._statements[statement_key] = [0, 0.0, 0.0]
+            statement_stats[0] += 1
+            statement_stats[1] += elapsed_time
+            statement_stats[2] = max(statement_stats[2], elapsed_time)
+
+    @property
+    def stats(self) -> dict:
+        """Property, summary of all metrics, times in milliseconds.
+        """
+        with self._lock:
+            return {
+                'checkout_count': self._checkout_count,
+                'checkout_wait_avg_ms': 1000 * self._checkout_wait_total / self._checkout_count if self._checkout_count else 0,
+                'checkout_wait_max_ms': 1000 * self._checkout_wait_max,
+                'saturation_peak': self._checkedout_peak / self.capacity if self.capacity else 0,
+                'queries': {
+                    statement_key: {
+                        'count': count,
+                        'avg_ms': 1000 * total_time / count,
+                        'max_ms': 1000 * max_time
+                    } for statement_key, (count, total_time, max_time) in self._statements.items()
+                }
+            }
+
+
+class TimedQueuePool(QueuePool):
+    """A :obj:`QueuePool` which reports checkouts to :attr:`metrics`.
+
+    :member metrics: Attached metrics, defaults to None.
+    :type metrics: SQLMetrics.
+    """
+    metrics = None # type: SQLMetrics
+
+    def _do_get(self):
+        start_time = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            if self.metrics is not None:
+                self.metrics.record_checkout(time.perf_counter() - start_time, self.checkedout())
+
+    def recreate(self):
+        new_pool = super().recreate()
+        new_pool.metrics = self.metrics
+        return new_pool
@@ -0,0 +1,152 @@
+"""In-process registry of subscribers."""
+import bisect
+import heapq
+import logging
+import threading
+import time
+from array import array
+from typing import Dict, Iterable, Tuple, Union
+from .config import DIGEST_INTERVALS, SUBSCRIBER_REGISTRY_RELOAD_INTERVAL
+from .models import SubscriberChannel
+
+
+class SubscriberRegistry(object):
+    """Chat ids of each :obj:`SubscriberChannel` and each digest mode, stored as sorted compact integer arrays.
+    A chat subscribing a digest is only listed under its digest mode.
+
+    Kept up to date by `SQLHandler` on every chat write, and reloaded from the database
+    every `reload_interval` seconds as a safety net.
+
+    :member reload_interval: Seconds before the registry is considered stale.
+    :type reload_interval: float.
+    :member loaded_time: Time of the last successful load, None if never loaded.
+    :type loaded_time: float.
+    """
+    def __init__(self, reload_interval: float = SUBSCRIBER_REGISTRY_RELOAD_INTERVAL):
+        self.reload_interval = reload_interval
+        self.loaded_time = None
+        self._generation = 0
+        self._lock = threading.Lock()
+        self._chat_ids = self._create_lists(array)
+
+    @staticmethod
+    def _create_lists(factory) -> dict:
+        chat_ids = {SubscriberChannel.NormalChannel: factory('q'), SubscriberChannel.InsiderChannel: factory('q')}
+        chat_ids.update((digest, factory('q')) for digest in DIGEST_INTERVALS)
+        return chat_ids
+
+    @staticmethod
+    def _list_of(is_insider: bool, digest: str = None) -> Union[SubscriberChannel, str]:
+        if digest in DIGEST_INTERVALS:
+            return digest
+        return SubscriberChannel.InsiderChannel if is_insider else SubscriberChannel.NormalChannel
+
+    @property
+    def is_stale(self) -> bool:
+        """Property, whether the registry should be reloaded from the database.
+        """
+        return self.loaded_time is None or time.monotonic() - self.loaded_time > self.reload_interval
+
+    @property
+    def generation(self) -> int:
+        """Property, counter increased by every write, see `load`.
+        """
+        return self._generation
+
+    def load(
+            self,
+            chats: Iterable[Tuple[int, bool, str]],
+            generation: int = None,
+            changes: Dict[int, Tuple[int, bool, str]] = None) -> bool:
+        """Replace all chat ids.
+
+        :param chats: `(chat_id, is_insider, digest)` rows.
+        :type chats: Iterable[Tuple[int, bool, str]].
+        :param generation: Defaults to None. :attr:`generation` read before querying `chats`,
+            the load is skipped if any write happened since then.
+        :type generation: int, optional.
+        :param changes: Defaults to None. Rows of chats changed but not yet written, None if removed,
+            applied over `chats`.
+        :type changes: Dict[int, Tuple[int, bool, str]], optional.
+        :return: Whether the registry is loaded.
+        :rtype: bool.
+        """
+        changes = changes or {}
+        chat_ids = self._create_lists(lambda typecode: [])
+        for chat_id, is_insider, digest in chats:
+            if chat_id not in changes:
+                chat_ids[self._list_of(is_insider, digest)].append(chat_id)
+        for chat in changes.values():
+            if chat is not None:
+                chat_id, is_insider, digest = chat
+                chat_ids[self._list_of(is_insider, digest)].append(chat_id)
+        with self._lock:
+            if generation is not None and generation != self._generation:
+                logging.warning('SubscriberRegistry: Concurrent write detected, skip reloading.')
+                return False
+            self._chat_ids = {key: array('q', sorted(id_list)) for key, id_list in chat_ids.items()}
+            self._generation += 1
+            self.loaded_time = time.monotonic()
+        logging.info(f'SubscriberRegistry: {len(self)} chats loaded.')
+        return True
+
+    @staticmethod
+    def _insert(id_array: array, chat_id: int) -> bool:
+        index = bisect.bisect_left(id_array, chat_id)
+        if index < len(id_array) and id_array[index] == chat_id:
+            return False
+        id_array.insert(index, chat_id)
+        return True
+
+    @staticmethod
+    def _remove(id_array: array, chat_id: int) -> bool:
+        index = bisect.bisect_left(id_array, chat_id)
+        if index < len(id_array) and id_array[index] == chat_id:
+            del id_array[index]
+            return True
+        return False
+
+    def add(self, chat_id: int, is_insider: bool = False, digest: str = None):
+        """Add a chat, or move it to the list matching `is_insider` and `digest`.
+        """
+        target_key = self._list_of(is_insider, digest)
+        with self._lock:
+            for key, id_array in self._chat_ids.items():
+                if key != target_key:
+                    self._remove(id_array, chat_id)
+            self._insert(self._chat_ids[target_key], chat_id)
+            self._generation += 1
+
+    def remove(self, chat_id: int):
+        """Remove a chat from all channels.
+        """
+        with self._lock:
+            for id_array in self._chat_ids.values():
+                self._remove(id_array, chat_id)
+            self._generation += 1
+
+    def get_chat_ids(self, channel: SubscriberChannel = SubscriberChannel.AllChannel) -> array:
+        """Retrive a sorted copy of chat ids in `channel`, chats subscribing digests excluded.
+
+        :param channel: User channel.
+        :type channel: SubscriberChannel, `all`(default), `normal`, `insider`.
+        :rtype: array.
+        """
+        with self._lock:
+            if channel == SubscriberChannel.AllChannel:
+                return array('q', heapq.merge(
+                    self._chat_ids[SubscriberChannel.NormalChannel], self._chat_ids[SubscriberChannel.InsiderChannel]))
+            return array('q', self._chat_ids[channel])
+
+    def get_digest_chat_ids(self, digest: str) -> array:
+        """Retrive a sorted copy of chat ids subscribing digest `digest`.
+
+        :param digest: Digest mode, a key of `DIGEST_INTERVALS`.
+        :type digest: str.
+        :rtype: array.
+        """
+        with self._lock:
+            return array('q', self._chat_ids[digest])
+
+    def __len__(self):
+        return sum(len(id_array) for id_array in self._chat_ids.values())
@@ -0,0 +1,21 @@
+import argparse
+import logging
+from bupt_messager.config import NOTICE_HTML_CODEC, NOTICE_HTML_MIGRATION_BATCH_SIZE
+from bupt_messager.sql_handler import SQLHandler, SQLManager
+
+
+def main():
+    """Compress inline HTML of existing notices into table `notice_html`.
+    """
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--codec", type=str, help='Compression codec, `zlib` or `zstd`.', default=NOTICE_HTML_CODEC)
+    parser.add_argument("--batch-size", type=int, help='Notices per transaction.', default=NOTICE_HTML_MIGRATION_BATCH_SIZE)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    sql_handler = SQLHandler(SQLManager())
+    compressed_count = sql_handler.compress_notice_html(codec=args.codec, batch_size=args.batch_size)
+    logging.warning(f'{compressed_count} notices compressed, run `OPTIMIZE TABLE notification` to reclaim space on MySQL.')
+
+
+if __name__ == "__main__":
+    main()
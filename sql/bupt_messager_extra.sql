@@ -16,11 +16,26 @@ ALTER TABLE `attachment`
 ALTER TABLE `chat`
   ADD PRIMARY KEY (`id`);
 
+--
+-- Indexes for table `delivery`
+--
+ALTER TABLE `delivery`
+  ADD PRIMARY KEY (`notice_id`, `chat_id`),
+  ADD KEY `delivery_state` (`state`, `notice_id`);
+
+--
+-- Indexes for table `notice_html`
+--
+ALTER TABLE `notice_html`
+  ADD PRIMARY KEY (`hash`);
+
 --
 -- Indexes for table `notification`
 --
 ALTER TABLE `notification`
-  ADD PRIMARY KEY (`id`);
+  ADD PRIMARY KEY (`id`),
+  ADD KEY `notice_time_id` (`time`, `id`),
+  ADD KEY `notice_html` (`html_hash`);
 
 --
 -- Indexes for table `status`
@@ -28,6 +43,12 @@ ALTER TABLE `notification`
 ALTER TABLE `status`
   ADD PRIMARY KEY (`time`);
 
+--
+-- Indexes for table `status_rollup`
+--
+ALTER TABLE `status_rollup`
+  ADD PRIMARY KEY (`bucket`, `status`);
+
 --
 -- AUTO_INCREMENT for dumped tables
 --
@@ -46,3 +67,15 @@ ALTER TABLE `attachment`
 --
 ALTER TABLE `attachment`
   ADD CONSTRAINT `notice` FOREIGN KEY (`notice_id`) REFERENCES `notification` (`id`) ON UPDATE CASCADE;
+
+--
+-- Constraints for table `delivery`
+--
+ALTER TABLE `delivery`
+  ADD CONSTRAINT `delivery_notice` FOREIGN KEY (`notice_id`) REFERENCES `notification` (`id`) ON UPDATE CASCADE;
+
+--
+-- Constraints for table `notification`
+--
+ALTER TABLE `notification`
+  ADD CONSTRAINT `notice_html` FOREIGN KEY (`html_hash`) REFERENCES `notice_html` (`hash`);
@@ -0,0 +1,6 @@
+
+--
+-- Store the digest mode of each chat.
+--
+ALTER TABLE `chat`
+  ADD `digest` varchar(8) DEFAULT NULL;
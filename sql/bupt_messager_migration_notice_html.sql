@@ -0,0 +1,7 @@
+
+--
+-- Store HTML of notices in table `notice_html`, run `compress_html.py` afterwards.
+--
+ALTER TABLE `notification`
+  ADD `html_hash` varchar(64) DEFAULT NULL,
+  ADD CONSTRAINT `notice_html` FOREIGN KEY (`html_hash`) REFERENCES `notice_html` (`hash`);
@@ -6,5 +6,6 @@
 --
 
 CREATE TABLE `chat` (
-  `id` bigint(20) NOT NULL
+  `id` bigint(20) NOT NULL,
+  `digest` varchar(8) DEFAULT NULL
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
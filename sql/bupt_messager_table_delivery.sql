@@ -0,0 +1,13 @@
+
+-- --------------------------------------------------------
+
+--
+-- Table structure for table `delivery`
+--
+
+CREATE TABLE `delivery` (
+  `notice_id` varchar(36) NOT NULL,
+  `chat_id` bigint(20) NOT NULL,
+  `state` int(11) DEFAULT 0,
+  `time` datetime DEFAULT NULL
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
@@ -0,0 +1,12 @@
+
+-- --------------------------------------------------------
+
+--
+-- Table structure for table `notice_html`
+--
+
+CREATE TABLE `notice_html` (
+  `hash` varchar(64) NOT NULL,
+  `codec` varchar(8) DEFAULT NULL,
+  `data` mediumblob
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
@@ -12,5 +12,6 @@ CREATE TABLE `notification` (
   `url` text NOT NULL,
   `summary` text NOT NULL,
   `date` date NOT NULL,
-  `is_pushed` tinyint(1) NOT NULL
+  `is_pushed` tinyint(1) NOT NULL,
+  `html_hash` varchar(64) DEFAULT NULL
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
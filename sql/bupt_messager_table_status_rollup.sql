@@ -0,0 +1,12 @@
+
+-- --------------------------------------------------------
+
+--
+-- Table structure for table `status_rollup`
+--
+
+CREATE TABLE `status_rollup` (
+  `bucket` datetime NOT NULL,
+  `status` int(11) NOT NULL,
+  `count` int(11) DEFAULT 0
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
@@ -0,0 +1,108 @@
+#!/usr/env/python3
+# -*- coding: UTF-8 -*-
+
+import datetime
+import json
+import logging
+import os
+from ..bupt_messager.bot_handler.backend_helper import BackendHelper
+from ..bupt_messager.config import BOT_NOTICE_LIST_MAX_LENGTH, BOT_RESTART_ARG_NO_ARG
+from ..bupt_messager.models import Chat
+from ..bupt_messager.read_models import NoticeListItem
+from ..bupt_messager.sql_handler import SQLHandler, SQLManager
+from ..bupt_messager.mess import get_current_time, set_logger
+from .sql_handler_test import create_sample_notice
+
+
+class SampleUpdater(object):
+    """Updater without webhook sockets, so that a restart replaces the process in place.
+    """
+    def __init__(self):
+        self.is_stopped = False
+
+    def stop(self):
+        self.is_stopped = True
+
+
+def get_page_buttons(payload) -> dict:
+    """Callback data of the prev and next buttons on a page, by button text.
+    """
+    footer_buttons = json.loads(payload.reply_markup)['inline_keyboard'][-1]
+    return {button['text']: button['callback_data'] for button in footer_buttons if 'callback_data' in button}
+
+
+def turn_page(backend_helper: BackendHelper, callback_data: str):
+    """Get the page a button leads to, as `BotBackend.latest_callback` does.
+    """
+    assert len(callback_data.encode()) <= 64
+    _, length, direction, *cursor_args = callback_data.split('_')
+    cursor = backend_helper.load_notice_cursor(cursor_args)
+    return backend_helper.get_latest_page(int(length), cursor, is_newer=direction == 'p')
+
+
+def backend_helper_test(database_uri='sqlite://'):
+    set_logger(
+        f'log/test/backend_helper_test_{get_current_time()}.txt',
+        console_level=logging.DEBUG,
+        file_level=logging.DEBUG)
+    sql_handler = SQLHandler(SQLManager(database_uri))
+    notice_count = 12
+    sql_handler.insert_notices([create_sample_notice(index) for index in range(notice_count)])
+    backend_helper = BackendHelper(sql_handler=sql_handler)
+    first_page = backend_helper.get_latest_page(5)
+    assert first_page.key == 'latest_5_11' and list(get_page_buttons(first_page)) == ['next']
+    second_page = turn_page(backend_helper, get_page_buttons(first_page)['next'])
+    assert second_page.key == 'latest_5_6' and list(get_page_buttons(second_page)) == ['prev', 'next']
+    last_page = turn_page(backend_helper, get_page_buttons(second_page)['next'])
+    assert last_page.key == 'latest_5_1' and list(get_page_buttons(last_page)) == ['prev']
+    previous_page = turn_page(backend_helper, get_page_buttons(last_page)['prev'])
+    assert previous_page.key == second_page.key and previous_page.text == second_page.text
+    assert list(get_page_buttons(previous_page)) == ['prev', 'next']
+    previous_page = turn_page(backend_helper, get_page_buttons(previous_page)['prev'])
+    assert previous_page.key == first_page.key and list(get_page_buttons(previous_page)) == ['next']
+    assert backend_helper.load_notice_cursor(['malformed']) is None
+    assert backend_helper.load_notice_cursor(['20190901100000', '1']) == (datetime.datetime(2019, 9, 1, 10), '1')
+    long_notice = NoticeListItem(id='x' * 36, title='Title', url='https://ohhere.xyz', time=datetime.datetime(2099, 1, 1))
+    long_cursor = backend_helper.dump_notice_cursor(long_notice)
+    assert len(f'latest_{BOT_NOTICE_LIST_MAX_LENGTH}_p_{long_cursor}'.encode()) <= 64
+    assert backend_helper.load_notice_cursor(long_cursor.split('_')) == (long_notice.time, long_notice.id)
+    restarted_helper = BackendHelper(sql_handler=sql_handler)
+    assert turn_page(restarted_helper, get_page_buttons(first_page)['next']).text == second_page.text
+    restarted_helper.latest_pages.clear()
+    assert turn_page(restarted_helper, get_page_buttons(last_page)['prev']).text == second_page.text
+    sql_handler.insert_notices([create_sample_notice(notice_count)])
+    assert backend_helper.get_latest_page(5).key == f'latest_5_{notice_count}'
+    assert turn_page(backend_helper, get_page_buttons(second_page)['next']).key == 'latest_5_1'
+    logging.info(f'Latest pages: {backend_helper.latest_pages.stats}')
+    return backend_helper
+
+
+def restart_test(database_uri='sqlite://'):
+    set_logger(
+        f'log/test/restart_test_{get_current_time()}.txt',
+        console_level=logging.DEBUG,
+        file_level=logging.DEBUG)
+    sql_handler = SQLHandler(SQLManager(database_uri))
+    updater = SampleUpdater()
+    backend_helper = BackendHelper(sql_handler=sql_handler, updater=updater)
+
+    def get_written_chat_ids() -> list:
+        with sql_handler.sql_manager.create_session() as my_session:
+            return [chat.id for chat in my_session.query(Chat)]
+
+    chat_id = 1
+    sql_handler.insert_chat(chat_id)
+    assert get_written_chat_ids() == []
+    exec_chat_ids = []
+    original_execl, os.execl = os.execl, lambda *args: exec_chat_ids.extend(get_written_chat_ids())
+    try:
+        backend_helper.restart_app([BOT_RESTART_ARG_NO_ARG]).join()
+    finally:
+        os.execl = original_execl
+    assert updater.is_stopped and exec_chat_ids == [chat_id]
+    return backend_helper
+
+
+if __name__ == '__main__':
+    backend_helper_test()
+    restart_test()
@@ -1,19 +1,24 @@
 #!/usr/env/python3
 # -*- coding: UTF-8 -*-
 
+import datetime
 import logging
 from ..bupt_messager.notice_manager.bot_helper import BotHelper
 from ..bupt_messager.queued_bot import create_queued_bot
+from ..bupt_messager.read_models import NoticeSnapshot
 from ..bupt_messager.sql_handler import SQLHandler
 from ..bupt_messager.mess import get_current_time, set_logger
 
 
 def bot_helper_test():
-    sample_notice = {
-        'summary': 'This is a summary.',
-        'title': 'This is a Title.',
-        'url': 'https://ohhere.xyz'
-    }
+    sample_notice = NoticeSnapshot(
+        id='0',
+        author='Author',
+        title='This is a Title.',
+        url='https://ohhere.xyz',
+        summary='This is a summary.',
+        time=datetime.datetime.now(),
+        attachments=())
     test_count = 20
     set_logger(
         f'log/test/bot_helper_test_{get_current_time()}.txt',
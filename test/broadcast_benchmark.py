@@ -0,0 +1,199 @@
+#!/usr/env/python3
+# -*- coding: UTF-8 -*-
+
+import argparse
+import json
+import logging
+import random
+import resource
+import threading
+import time
+import tracemalloc
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import telegram.utils.request
+from ..bupt_messager.message_scheduler import MessageScheduler
+from ..bupt_messager.models import Chat
+from ..bupt_messager.notice_manager.bot_helper import BotHelper
+from ..bupt_messager.queued_bot import QueuedBot
+from ..bupt_messager.sql_handler import SQLHandler, SQLManager
+from ..bupt_messager.mess import get_current_time, set_logger
+from .sql_handler_test import create_sample_notice
+
+FAKE_BOT_TOKEN = '123456:benchmark'
+
+
+class FakeBotAPIHandler(BaseHTTPRequestHandler):
+    """Answer `sendMessage` like the Bot API, with injected latency and errors.
+    Settings are read from attributes of the server.
+    """
+    protocol_version = 'HTTP/1.1'
+
+    def do_POST(self):
+        data = json.loads(self.rfile.read(int(self.headers['Content-Length'])) or b'{}')
+        time.sleep(random.uniform(*self.server.latency))
+        chat_id = int(data.get('chat_id', 0))
+        if not self.server.take_quota() or random.random() < self.server.retry_after_rate:
+            self._reply(429, {
+                'ok': False,
+                'error_code': 429,
+                'description': f'Too Many Requests: retry after {self.server.retry_after}',
+                'parameters': {'retry_after': self.server.retry_after}})
+        elif chat_id % 100 < 100 * self.server.blocked_rate:
+            self._reply(403, {'ok': False, 'error_code': 403, 'description': 'Forbidden: bot was blocked by the user'})
+        else:
+            with self.server.lock:
+                self.server.message_count += 1
+                message_id = self.server.message_count
+            self._reply(200, {'ok': True, 'result': {
+                'message_id': message_id,
+                'date': int(time.time()),
+                'chat': {'id': chat_id, 'type': 'private'},
+                'text': data.get('text', '')}})
+
+    def _reply(self, status: int, body: dict):
+        raw_body = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(raw_body)))
+        self.end_headers()
+        self.wfile.write(raw_body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class FakeBotAPIServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 1024
+
+    def take_quota(self) -> bool:
+        """Count a request against `quota` requests per second, False if exceeded.
+        """
+        if not self.quota:
+            return True
+        with self.lock:
+            current_second = int(time.monotonic())
+            if current_second != self.quota_second:
+                self.quota_second, self.quota_used = current_second, 0
+            self.quota_used += 1
+            return self.quota_used <= self.quota
+
+
+def start_fake_bot_api(latency=(0.05, 0.15), retry_after_rate=0.0, retry_after=1, blocked_rate=0.0, quota=0):
+    """Start a fake Bot API server on a random local port.
+
+    :return: The server, whose `server_address` is listened.
+    :rtype: FakeBotAPIServer.
+    """
+    server = FakeBotAPIServer(('127.0.0.1', 0), FakeBotAPIHandler)
+    server.latency = latency
+    server.retry_after_rate = retry_after_rate
+    server.retry_after = retry_after
+    server.blocked_rate = blocked_rate
+    server.quota = quota
+    server.quota_second, server.quota_used = 0, 0
+    server.message_count = 0
+    server.lock = threading.Lock()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+class TimedQueuedBot(QueuedBot):
+    """A :obj:`QueuedBot` recording the latency and errors of each request.
+    """
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.latencies = []
+        self.errors = {}
+        self.set_error_handle(self.count_error)
+
+    def count_error(self, bot, error, chat_id=None):
+        error_name = type(error).__name__
+        self.errors[error_name] = self.errors.get(error_name, 0) + 1
+
+    def _send_message(self, *args, **kwargs):
+        start_time = time.perf_counter()
+        try:
+            return super()._send_message(*args, **kwargs)
+        finally:
+            self.latencies.append(time.perf_counter() - start_time)
+
+
+def get_percentile(values: list, percent: float) -> float:
+    if not values:
+        return 0
+    sorted_values = sorted(values)
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * percent / 100))]
+
+
+def broadcast_benchmark(
+        chat_count=1000, rate=30, workers=16, latency=(0.05, 0.15),
+        retry_after_rate=0.0, blocked_rate=0.0, quota=0, database_uri='sqlite://'):
+    """Broadcast a notice to `chat_count` synthetic chats through a fake Bot API.
+
+    :return: Results of the benchmark.
+    :rtype: dict.
+    """
+    server = start_fake_bot_api(
+        latency=latency, retry_after_rate=retry_after_rate, blocked_rate=blocked_rate, quota=quota)
+    sql_handler = SQLHandler(SQLManager(database_uri))
+    with sql_handler.sql_manager.create_session() as my_session:
+        my_session.bulk_insert_mappings(Chat, [{'id': chat_id, 'is_insider': False} for chat_id in range(1, chat_count + 1)])
+        my_session.commit()
+    sql_handler.reload_subscribers()
+    notice = sql_handler.insert_notices([create_sample_notice(1)])[0]
+    msg_queue = MessageScheduler(
+        lanes={'interactive': (8, rate, rate), 'admin': (4, rate, rate), 'bulk': (1, rate, rate)},
+        all_burst_limit=rate,
+        chat_interval=1,
+        workers=workers)
+    msg_queue.start()
+    request = telegram.utils.request.Request(con_pool_size=workers + 4)
+    queued_bot = TimedQueuedBot(
+        msg_queue, token=FAKE_BOT_TOKEN, base_url=f'http://127.0.0.1:{server.server_address[1]}/bot', request=request)
+    bot_helper = BotHelper(sql_handler, queued_bot)
+    tracemalloc.start()
+    start_time = time.perf_counter()
+    bot_helper.broadcast_notice(notice)
+    elapsed_time = time.perf_counter() - start_time
+    _, peak_memory = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    queued_bot.stop()
+    server.shutdown()
+    results = {
+        'chats': chat_count,
+        'seconds': elapsed_time,
+        'sent': server.message_count,
+        'msg_per_second': server.message_count / elapsed_time,
+        'p50_ms': 1000 * get_percentile(queued_bot.latencies, 50),
+        'p99_ms': 1000 * get_percentile(queued_bot.latencies, 99),
+        'errors': queued_bot.errors,
+        'retry_after': msg_queue.rate_controller.retry_after_count,
+        'delivery': sql_handler.get_delivery_progress(notice.id),
+        'lanes': msg_queue.stats,
+        'traced_peak_mb': peak_memory / 2 ** 20,
+        'max_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 2 ** 10
+    }
+    logging.warning(f'Broadcast benchmark: {json.dumps(results, default=str)}')
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--chats', type=int, default=1000, help='Amount of synthetic chats.')
+    parser.add_argument('--rate', type=float, default=30, help='Global messages per second.')
+    parser.add_argument('--workers', type=int, default=16, help='Messages in flight.')
+    parser.add_argument('--latency', type=float, nargs=2, default=(0.05, 0.15), help='Min and max latency in seconds.')
+    parser.add_argument('--retry-after-rate', type=float, default=0.0, help='Share of requests answered with 429.')
+    parser.add_argument('--blocked-rate', type=float, default=0.0, help='Share of chats answering 403.')
+    parser.add_argument('--quota', type=int, default=0, help='Requests per second before answering 429, 0 for no quota.')
+    parser.add_argument('--database-uri', type=str, default='sqlite://')
+    args = parser.parse_args()
+    set_logger(
+        f'log/test/broadcast_benchmark_{get_current_time()}.txt',
+        console_level=logging.WARNING,
+        file_level=logging.INFO)
+    broadcast_benchmark(
+        chat_count=args.chats, rate=args.rate, workers=args.workers, latency=tuple(args.latency),
+        retry_after_rate=args.retry_after_rate, blocked_rate=args.blocked_rate, quota=args.quota,
+        database_uri=args.database_uri)
@@ -0,0 +1,29 @@
+#!/usr/env/python3
+# -*- coding: UTF-8 -*-
+
+import logging
+from ..bupt_messager.bupt_messager import BUPTMessager
+from ..bupt_messager.config import BOT_LANE_BULK
+
+
+def bupt_messager_test():
+    messager = BUPTMessager(debug_mode=True, no_spider_mode=True)
+    message_scheduler = messager.queued_bot._msg_queue
+    message_count = 20
+    sent_indexes = []
+    for index in range(message_count):
+        message_scheduler.put(sent_indexes.append, (index,), {}, chat_id=index, lane=BOT_LANE_BULK)
+    try:
+        messager.hand_over()
+    except SystemExit as identifier:
+        assert identifier.code == 0
+    else:
+        raise AssertionError('BUPTMessager did not exit after handing over.')
+    assert sorted(sent_indexes) == list(range(message_count))
+    assert not messager.bot_handler.updater.running
+    logging.info(f'Handed over after sending {len(sent_indexes)} queued messages.')
+    return messager
+
+
+if __name__ == '__main__':
+    bupt_messager_test()
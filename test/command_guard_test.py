@@ -0,0 +1,106 @@
+#!/usr/env/python3
+# -*- coding: UTF-8 -*-
+
+import datetime
+import logging
+from telegram import Chat, Message, Update, User
+from ..bupt_messager.bot_handler.command_guard import CommandGuard
+from ..bupt_messager.config import BOT_LANE_BULK, BOT_LANE_INTERACTIVE, BUSY_TEXT, RATE_LIMITED_TEXT
+from ..bupt_messager.handler_metrics import HandlerMetrics
+from ..bupt_messager.message_scheduler import MessageScheduler
+from ..bupt_messager.queued_bot import QueuedBot
+from ..bupt_messager.mess import get_current_time, set_logger
+
+
+class PendingDispatcher(object):
+    """Keep callbacks passed to `run_async` until `run_pending`, as a :obj:`telegram.ext.Dispatcher` with busy workers.
+    """
+    def __init__(self):
+        self.pending_calls = []
+
+    def run_async(self, func, *args, **kwargs):
+        self.pending_calls.append((func, args, kwargs))
+
+    def run_pending(self):
+        pending_calls, self.pending_calls = self.pending_calls, []
+        for func, args, kwargs in pending_calls:
+            func(*args, **kwargs)
+
+
+class SampleBot(object):
+    """Collect sent messages.
+    """
+    def __init__(self):
+        self.sent_messages = []
+
+    def send_message(self, chat_id: int, text: str, **kwargs):
+        self.sent_messages.append((chat_id, text))
+
+
+def create_sample_update(user_id: int) -> Update:
+    return Update(user_id, message=Message(
+        message_id=1,
+        from_user=User(user_id, 'User', False),
+        date=datetime.datetime.now(),
+        chat=Chat(user_id, Chat.PRIVATE),
+        text='/latest'))
+
+
+def command_guard_test():
+    set_logger(
+        f'log/test/command_guard_test_{get_current_time()}.txt',
+        console_level=logging.DEBUG,
+        file_level=logging.DEBUG)
+    dispatcher, bot = PendingDispatcher(), SampleBot()
+    handler_metrics = HandlerMetrics()
+    command_guard = CommandGuard(handler_metrics, rate_limits={'latest_command': (0.01, 3)}, max_queued_updates=5)
+    handled_user_ids = []
+
+    def latest_command(bot, update):
+        handled_user_ids.append(update.effective_user.id)
+
+    guarded_command = command_guard.guarded(dispatcher, handler_metrics.timed(dispatcher, latest_command))
+    for _ in range(5):
+        guarded_command(bot, create_sample_update(1))
+    dispatcher.run_pending()
+    assert handled_user_ids == [1, 1, 1]
+    assert bot.sent_messages == [(1, RATE_LIMITED_TEXT)]
+    guarded_command(bot, create_sample_update(2))
+    dispatcher.run_pending()
+    assert handled_user_ids == [1, 1, 1, 2]
+    for user_id in range(10, 16):
+        guarded_command(bot, create_sample_update(user_id))
+    assert handler_metrics.queued_count == 5 and bot.sent_messages[-1] == (15, BUSY_TEXT)
+    dispatcher.run_pending()
+    guarded_command(bot, create_sample_update(15))
+    dispatcher.run_pending()
+    assert handled_user_ids[4:] == [10, 11, 12, 13, 14, 15]
+    assert handler_metrics.stats['handlers']['latest_command']['rejected'] == {'limited': 2, 'shed': 1}
+    return command_guard
+
+
+def interactive_shed_test():
+    set_logger(
+        f'log/test/interactive_shed_test_{get_current_time()}.txt',
+        console_level=logging.DEBUG,
+        file_level=logging.DEBUG)
+    max_send_queue_depth = 5
+    queued_bot = QueuedBot(MessageScheduler(), token='123:test')
+    for chat_id in range(max_send_queue_depth):
+        queued_bot.send_message(chat_id=chat_id, text='Queued.')
+    handler_metrics = HandlerMetrics()
+    command_guard = CommandGuard(handler_metrics, max_send_queue_depth=max_send_queue_depth)
+    dispatcher = PendingDispatcher()
+    guarded_command = command_guard.guarded(dispatcher, handler_metrics.timed(dispatcher, lambda bot, update: None))
+    for user_id in [1, 1, 2]:
+        guarded_command(queued_bot, create_sample_update(user_id))
+    queue_stats = queued_bot.get_queue_stats()
+    assert queue_stats[BOT_LANE_INTERACTIVE]['depth'] == max_send_queue_depth
+    assert queue_stats[BOT_LANE_BULK]['depth'] == 2 and not dispatcher.pending_calls
+    queued_bot.stop()
+    return command_guard
+
+
+if __name__ == '__main__':
+    command_guard_test()
+    interactive_shed_test()
@@ -0,0 +1,66 @@
+#!/usr/env/python3
+# -*- coding: UTF-8 -*-
+
+import logging
+import threading
+import time
+from telegram.utils.promise import Promise
+from ..bupt_messager.handler_metrics import HandlerMetrics, LatencyHistogram
+from ..bupt_messager.mess import get_current_time, set_logger
+
+
+class SampleDispatcher(object):
+    """Run callbacks in new threads and collect errors, as :obj:`telegram.ext.Dispatcher` does.
+    """
+    def __init__(self):
+        self.errors = []
+
+    def run_async(self, func, *args, **kwargs) -> Promise:
+        promise = Promise(func, args, kwargs)
+        threading.Thread(target=promise.run, daemon=True).start()
+        return promise
+
+    def dispatch_error(self, update, error: Exception):
+        self.errors.append(error)
+
+
+def handler_metrics_test():
+    set_logger(
+        f'log/test/handler_metrics_test_{get_current_time()}.txt',
+        console_level=logging.DEBUG,
+        file_level=logging.DEBUG)
+    histogram = LatencyHistogram(bounds=(0.1, 1))
+    for seconds in [0.05, 0.1, 0.5, 0.5, 3]:
+        histogram.record(seconds)
+    assert histogram.stats['buckets'] == {'0.1': 2, '1': 2, 'inf': 1}
+    assert histogram.get_percentile(40) == 0.1 and histogram.get_percentile(80) == 1
+    assert histogram.get_percentile(100) == histogram.max == 3
+    dispatcher = SampleDispatcher()
+    handler_metrics = HandlerMetrics()
+
+    def slow_command(bot, update):
+        time.sleep(0.2)
+        return update
+
+    def broken_command(bot, update):
+        raise ValueError(update)
+
+    timed_slow_command = handler_metrics.timed(dispatcher, slow_command)
+    timed_broken_command = handler_metrics.timed(dispatcher, broken_command)
+    promises = [timed_slow_command(None, index) for index in range(3)]
+    promises.append(timed_broken_command(None, 'broken'))
+    assert [promise.result(timeout=10) for promise in promises[:3]] == [0, 1, 2]
+    promises[-1].done.wait(10)
+    stats = handler_metrics.stats
+    assert stats['queued'] == 0 and stats['running'] == 0
+    slow_stats = stats['handlers']['slow_command']
+    assert slow_stats['latency']['count'] == 3 and slow_stats['latency']['buckets']['0.25'] == 3
+    assert slow_stats['wait']['count'] == 3 and slow_stats['errors'] == 0
+    assert stats['handlers']['broken_command']['errors'] == 1
+    assert len(dispatcher.errors) == 1 and isinstance(dispatcher.errors[0], ValueError)
+    logging.info(f'Handler metrics: {stats}')
+    return handler_metrics
+
+
+if __name__ == '__main__':
+    handler_metrics_test()
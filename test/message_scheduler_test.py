@@ -0,0 +1,84 @@
+#!/usr/env/python3
+# -*- coding: UTF-8 -*-
+
+import logging
+import threading
+import time
+from ..bupt_messager.config import BOT_LANE_ADMIN, BOT_LANE_BULK, BOT_LANE_INTERACTIVE
+from ..bupt_messager.message_scheduler import MessageScheduler
+from ..bupt_messager.mess import get_current_time, set_logger
+
+
+def message_scheduler_test():
+    set_logger(
+        f'log/test/message_scheduler_test_{get_current_time()}.txt',
+        console_level=logging.DEBUG,
+        file_level=logging.DEBUG)
+    scheduler = MessageScheduler(
+        lanes={BOT_LANE_INTERACTIVE: (8, 100, 100), BOT_LANE_ADMIN: (4, 100, 100), BOT_LANE_BULK: (1, 100, 100)},
+        all_burst_limit=20,
+        chat_interval=0.3,
+        group_interval=0.6,
+        workers=1)
+    sent_messages, sent_lock = [], threading.Lock()
+
+    def send(tag):
+        with sent_lock:
+            sent_messages.append((tag, time.monotonic()))
+
+    bulk_count = 60
+    bulk_promises = [
+        scheduler.put(send, (('bulk', index),), {}, chat_id=index, lane=BOT_LANE_BULK) for index in range(bulk_count)]
+    scheduler.start()
+    time.sleep(0.2)
+    interactive_promise = scheduler.put(send, (('interactive', 0),), {}, chat_id=-1, lane=BOT_LANE_INTERACTIVE)
+    same_chat_promises = [
+        scheduler.put(send, (('admin', index),), {}, chat_id=bulk_count, lane=BOT_LANE_ADMIN) for index in range(3)]
+    assert scheduler.drain(timeout=30)
+    assert all(promise.done.is_set() for promise in [*bulk_promises, interactive_promise, *same_chat_promises])
+    sent_tags = [tag for tag, _ in sent_messages]
+    assert sent_tags.index(('interactive', 0)) < bulk_count / 2
+    assert [tag for tag in sent_tags if tag[0] == 'bulk'] == [('bulk', index) for index in range(bulk_count)]
+    same_chat_times = [sent_time for tag, sent_time in sent_messages if tag[0] == 'admin']
+    assert all(later - earlier >= 0.25 for earlier, later in zip(same_chat_times, same_chat_times[1:]))
+    logging.info(f'Scheduler: {scheduler.stats}')
+    scheduler.stop()
+    return scheduler
+
+
+def concurrent_send_test():
+    set_logger(
+        f'log/test/concurrent_send_test_{get_current_time()}.txt',
+        console_level=logging.DEBUG,
+        file_level=logging.DEBUG)
+    workers, send_time = 4, 0.2
+    scheduler = MessageScheduler(
+        lanes={BOT_LANE_BULK: (1, 100, 100)}, all_burst_limit=100, chat_interval=0.05, workers=workers)
+    in_flight_chat_ids, sending_counts, sent_lock = [], [], threading.Lock()
+
+    def send(chat_id):
+        with sent_lock:
+            assert chat_id not in in_flight_chat_ids
+            in_flight_chat_ids.append(chat_id)
+            sending_counts.append(len(in_flight_chat_ids))
+        time.sleep(send_time)
+        with sent_lock:
+            in_flight_chat_ids.remove(chat_id)
+        return chat_id
+
+    chat_ids = [index % 6 for index in range(12)]
+    start_time = time.monotonic()
+    promises = [scheduler.put(send, (chat_id,), {}, chat_id=chat_id, lane=BOT_LANE_BULK) for chat_id in chat_ids]
+    scheduler.start()
+    assert [promise.result(timeout=30) for promise in promises] == chat_ids
+    elapsed_time = time.monotonic() - start_time
+    assert max(sending_counts) == workers
+    assert elapsed_time < len(chat_ids) * send_time / 2
+    logging.info(f'Sent {len(chat_ids)} messages in {elapsed_time:.2f}s by {workers} workers.')
+    scheduler.stop()
+    return scheduler
+
+
+if __name__ == '__main__':
+    message_scheduler_test()
+    concurrent_send_test()
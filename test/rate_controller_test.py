@@ -0,0 +1,53 @@
+#!/usr/env/python3
+# -*- coding: UTF-8 -*-
+
+import logging
+import time
+from telegram.error import RetryAfter
+from ..bupt_messager.config import BOT_LANE_BULK
+from ..bupt_messager.message_scheduler import MessageScheduler
+from ..bupt_messager.rate_controller import RateController
+from ..bupt_messager.mess import get_current_time, set_logger
+
+
+def rate_controller_test():
+    set_logger(
+        f'log/test/rate_controller_test_{get_current_time()}.txt',
+        console_level=logging.DEBUG,
+        file_level=logging.DEBUG)
+    rate_controller = RateController(30, min_rate=2, increase=1, decrease_factor=0.5, decrease_interval=1)
+    rate_controller.on_retry_after(10)
+    assert rate_controller.rate == 15
+    rate_controller.on_retry_after(10.5)
+    assert rate_controller.rate == 15 and rate_controller.retry_after_count == 2
+    for now in range(11, 16):
+        rate_controller.on_retry_after(now)
+    assert rate_controller.rate == 2
+    success_count = 0
+    while rate_controller.rate < rate_controller.max_rate:
+        rate_controller.on_success()
+        success_count += 1
+    assert rate_controller.rate == 30 and 400 < success_count < 500
+    scheduler = MessageScheduler(lanes={BOT_LANE_BULK: (1, 100, 100)}, all_burst_limit=30, chat_interval=0.05)
+    attempts = []
+
+    def send(chat_id):
+        attempts.append(chat_id)
+        if len(attempts) == 1:
+            raise RetryAfter(0.2)
+        return chat_id
+
+    start_time = time.monotonic()
+    promise = scheduler.put(send, (1,), {}, chat_id=1, lane=BOT_LANE_BULK)
+    scheduler.start()
+    assert promise.result(timeout=10) == 1 and attempts == [1, 1]
+    assert time.monotonic() - start_time >= 0.2
+    assert scheduler.stats['total']['retry_after'] == 1
+    assert scheduler.rate_controller.rate < 30
+    logging.info(f'Scheduler: {scheduler.stats}')
+    scheduler.stop()
+    return rate_controller
+
+
+if __name__ == '__main__':
+    rate_controller_test()
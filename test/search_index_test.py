@@ -0,0 +1,43 @@
+#!/usr/env/python3
+# -*- coding: UTF-8 -*-
+
+import datetime
+import logging
+from ..bupt_messager.read_models import NoticeListItem
+from ..bupt_messager.search_index import SearchIndex, tokenize
+from ..bupt_messager.mess import get_current_time, set_logger
+
+
+def search_index_test():
+    set_logger(
+        f'log/test/search_index_test_{get_current_time()}.txt',
+        console_level=logging.DEBUG,
+        file_level=logging.DEBUG)
+    assert tokenize('Hello 北邮') == {'hello', '北', '邮', '北邮'}
+    assert tokenize('北邮人', is_query=True) == {'北邮', '邮人'}
+    assert tokenize('邮', is_query=True) == {'邮'}
+    search_index = SearchIndex()
+    samples = [
+        ('0', '关于2019年国庆节放假的通知', '校长办公室'),
+        ('1', '图书馆国庆期间开放时间', '图书馆'),
+        ('2', 'Notice of the National Day holiday', 'International Office'),
+        ('3', '节假日放假安排', '校长办公室')]
+    for index, (notice_id, title, author) in enumerate(samples):
+        item = NoticeListItem(
+            id=notice_id, title=title, url=f'https://ohhere.xyz/{notice_id}',
+            time=datetime.datetime(2019, 9, 1) + datetime.timedelta(days=index))
+        search_index.add(item, author, title)
+        search_index.add(item, author, title)
+    assert len(search_index) == len(samples)
+    assert [item.id for item in search_index.search('国庆')] == ['1', '0']
+    assert [item.id for item in search_index.search('国庆节')] == ['0']
+    assert [item.id for item in search_index.search('放假')] == ['3', '0']
+    assert [item.id for item in search_index.search('国假')] == []
+    assert [item.id for item in search_index.search('HOLIDAY')] == ['2']
+    assert [item.id for item in search_index.search('放假', author='校长')] == ['3', '0']
+    assert [item.id for item in search_index.search('', since=datetime.datetime(2019, 9, 3))] == ['3', '2']
+    return search_index
+
+
+if __name__ == '__main__':
+    search_index_test()
@@ -0,0 +1,78 @@
+#!/usr/env/python3
+# -*- coding: UTF-8 -*-
+
+import datetime
+import logging
+from ..bupt_messager.config import STATUS_ROLLUP_HOURLY_DAYS
+from ..bupt_messager.models import StatusRollup, SubscriberChannel
+from ..bupt_messager.sql_handler import SQLHandler, SQLManager
+from ..bupt_messager.mess import get_current_time, set_logger
+
+
+def create_sample_notice(index: int) -> dict:
+    return {
+        'id': str(index),
+        'author': 'Author',
+        'html': f'<p>Notice {index}.</p>',
+        'title': f'Title {index}',
+        'url': f'https://ohhere.xyz/{index}',
+        'summary': f'Notice {index}.',
+        'time': datetime.datetime(2019, 9, 1) + datetime.timedelta(hours=index),
+        'attachments': [{'name': 'Attachment', 'notice_id': str(index), 'url': 'https://ohhere.xyz'}]
+    }
+
+
+def sql_handler_test(database_uri='sqlite://'):
+    set_logger(
+        f'log/test/sql_handler_test_{get_current_time()}.txt',
+        console_level=logging.DEBUG,
+        file_level=logging.DEBUG)
+    sql_handler = SQLHandler(SQLManager(database_uri))
+    sql_handler.warm_up()
+    notice_count = 12
+    sql_handler.insert_notices([create_sample_notice(index) for index in range(notice_count)])
+    assert sql_handler.filter_new_notice_ids([str(notice_count - 1), str(notice_count)]) == [str(notice_count)]
+    assert len(sql_handler.get_notice('0').attachments) == 1
+    cursor, notice_ids = None, []
+    while True:
+        notices = sql_handler.get_latest_notices(length=5, cursor=cursor)
+        if not notices:
+            break
+        notice_ids += [notice.id for notice in notices]
+        cursor = (notices[-1].time, notices[-1].id)
+    assert notice_ids == [str(index) for index in reversed(range(notice_count))]
+    assert [notice.id for notice in sql_handler.search_notices('title 11')] == ['11']
+    sql_handler.mark_pushed('0')
+    unpushed_notices = sql_handler.get_unpushed_notices()
+    assert len(unpushed_notices) == notice_count - 1 and len(unpushed_notices[0].attachments) == 1
+    for chat_id in [3, 1, 2]:
+        sql_handler.insert_chat(chat_id)
+    sql_handler.toggle_insider(2)
+    sql_handler.remove_chat(3)
+    assert list(sql_handler.get_chat_ids(SubscriberChannel.NormalChannel)) == [1]
+    assert list(sql_handler.get_chat_ids(SubscriberChannel.InsiderChannel)) == [2]
+    sql_handler.migrate_chat(2, -2)
+    assert sql_handler.get_chat(-2).is_insider and sql_handler.get_chat(2) is None
+    sql_handler.sql_manager.chat_writer.flush()
+    sql_handler.reload_subscribers()
+    assert list(sql_handler.get_chat_ids()) == [-2, 1]
+    sql_handler.set_digest(1, 'daily')
+    assert list(sql_handler.get_chat_ids()) == [-2] and list(sql_handler.get_digest_chat_ids('daily')) == [1]
+    sql_handler.insert_status(0)
+    assert sum(sql_handler.get_status_counts(datetime.datetime.now()).values()) == 1
+    old_day = datetime.datetime.now().replace(hour=0, minute=0, second=0, microsecond=0) - datetime.timedelta(
+        days=STATUS_ROLLUP_HOURLY_DAYS + 1)
+    with sql_handler.sql_manager.create_session() as my_session:
+        my_session.add_all([
+            StatusRollup(bucket=old_day, status=0, count=1),
+            StatusRollup(bucket=old_day.replace(hour=5), status=0, count=2)])
+        my_session.commit()
+    sql_handler.prune_status()
+    sql_handler.prune_status()
+    assert sql_handler.get_status_counts(old_day) == {0: 4}
+    logging.info(f'SQL pool: {sql_handler.sql_manager.get_pool_stats()}')
+    return sql_handler
+
+
+if __name__ == '__main__':
+    sql_handler_test()
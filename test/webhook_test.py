@@ -0,0 +1,102 @@
+#!/usr/env/python3
+# -*- coding: UTF-8 -*-
+
+import json
+import logging
+import os
+import signal
+import sys
+import threading
+import urllib.request
+from telegram import Bot, Update, User
+from telegram.ext import TypeHandler
+from tornado.netutil import bind_sockets
+from ..bupt_messager.bot_handler.webhook import HandoverUpdater, get_handover_parent, signal_handover_parent
+from ..bupt_messager.bot_handler.webhook import spawn_successor, wait_for_handover_parent
+from ..bupt_messager.mess import get_current_time, set_logger
+
+HANDOVER_TIMEOUT = 30
+LISTEN_ADDRESS = '127.0.0.1'
+
+
+def create_sample_updater() -> HandoverUpdater:
+    """Updater of a bot that never calls Telegram, whose webhook is only used locally.
+    """
+    bot = Bot('123:test')
+    bot.bot = User(123, 'Bot', True, username='test_bot')
+    return HandoverUpdater(bot=bot, workers=1)
+
+
+def post_update(port: int, url_path: str, update_id: int) -> int:
+    """Post an update to the webhook, as Telegram does.
+
+    :return: HTTP status.
+    :rtype: int.
+    """
+    request = urllib.request.Request(
+        f'http://{LISTEN_ADDRESS}:{port}/{url_path}',
+        data=json.dumps({'update_id': update_id}).encode(),
+        headers={'Content-Type': 'application/json'})
+    with urllib.request.urlopen(request, timeout=HANDOVER_TIMEOUT) as response:
+        return response.status
+
+
+def run_previous_process(sockets: list, port: int):
+    """Serve the webhook, start a successor with `sockets`, and hand over once signaled, see `BUPTMessager.hand_over`.
+    """
+    signal.pthread_sigmask(signal.SIG_BLOCK, [signal.SIGUSR1])
+    updater = create_sample_updater()
+    updater.webhook_sockets = sockets
+    updater.start_webhook(listen=LISTEN_ADDRESS, port=port, url_path='previous')
+    package_path = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    os.environ['PYTHONPATH'] = os.pathsep.join(filter(None, [package_path, os.environ.get('PYTHONPATH')]))
+    spawn_successor(updater.webhook_sockets, ['-m', __spec__.name, 'successor'])
+    is_signaled = signal.sigtimedwait([signal.SIGUSR1], HANDOVER_TIMEOUT) is not None
+    updater.stop()
+    logging.info(f'Previous process: Exit, signaled: {is_signaled}.')
+    os._exit(0 if is_signaled else 1)
+
+
+def run_successor():
+    """Serve inherited sockets and take over, see `BUPTMessager.take_over`, then handle an update and exit.
+    """
+    set_logger(
+        f'log/test/webhook_successor_test_{get_current_time()}.txt',
+        console_level=logging.DEBUG,
+        file_level=logging.DEBUG)
+    updater = create_sample_updater()
+    assert len(updater.webhook_sockets) == 1
+    is_received = threading.Event()
+    updater.dispatcher.add_handler(TypeHandler(Update, lambda bot, update: is_received.set()))
+    updater.start_webhook(listen=LISTEN_ADDRESS, port=0, url_path='successor')
+    parent_pid = get_handover_parent()
+    assert signal_handover_parent(parent_pid)
+    assert wait_for_handover_parent(parent_pid, HANDOVER_TIMEOUT)
+    is_received.wait(HANDOVER_TIMEOUT)
+    updater.stop()
+    logging.info(f'Successor: Exit, update received: {is_received.is_set()}.')
+
+
+def webhook_test():
+    set_logger(
+        f'log/test/webhook_test_{get_current_time()}.txt',
+        console_level=logging.DEBUG,
+        file_level=logging.DEBUG)
+    sockets = bind_sockets(0, address=LISTEN_ADDRESS)
+    port = sockets[0].getsockname()[1]
+    previous_pid = os.fork()
+    if previous_pid == 0:
+        run_previous_process(sockets, port)
+    for listening_socket in sockets:
+        listening_socket.close()
+    _, exit_status = os.waitpid(previous_pid, 0)
+    assert os.WIFEXITED(exit_status) and os.WEXITSTATUS(exit_status) == 0
+    assert post_update(port, 'successor', 1) == 200
+    logging.info(f'Webhook on port {port} handed over from `{previous_pid}`.')
+
+
+if __name__ == '__main__':
+    if sys.argv[1:] == ['successor']:
+        run_successor()
+    else:
+        webhook_test()